@@ -1,87 +1,199 @@
+import argparse
 import os
+import sys
+import threading
 import time
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Iterable, List
 
 import pandas as pd
-import requests
 
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
-API_VIEW_URL = "https://api.bilibili.com/x/web-interface/view"
-
+from src.config import load_config  # type: ignore
+from src.crawler import HttpClient  # type: ignore
+from video_index import API_COLUMNS, cached_api_meta, load_videos, save_api_meta
 
-def fetch_video_meta(bvid: str, timeout: float = 10.0) -> Dict[str, Any]:
-    """调用 B 站公开接口按 bvid 获取视频元数据。
 
-    返回尽量精简且与 key_videos 列兼容的字段。
+API_VIEW_URL = "https://api.bilibili.com/x/web-interface/view"
+# 默认只补 key_videos 自带的列；可扩展到 API_COLUMNS 中的任意字段
+DEFAULT_FIELDS = ["title", "view", "reply", "like"]
+DEFAULT_WORKERS = 4
+# view 接口中位于 data.stat 下的计数字段
+STAT_COLUMNS = ["view", "danmaku", "reply", "favorite", "coin", "share", "like"]
+
+
+def build_client(config_path: str | None = None) -> HttpClient:
+    """按 config.yaml 的 headers（含 Cookie）与 http 段构造带会话、重试与退避的客户端。"""
+    cfg = load_config(config_path)
+    http_cfg = cfg.get("http", {}) or {}
+    return HttpClient(
+        headers=dict(cfg.get("headers") or {}),
+        timeout=int(http_cfg.get("timeout", 15)),
+        retry=int(http_cfg.get("retry", 3)),
+        backoff=float(http_cfg.get("backoff", 1.5)),
+        proxy=http_cfg.get("proxy") or None,
+    )
+
+
+def _api_row(data: Dict[str, Any]) -> Dict[str, Any]:
+    # 直接取接口原始字段：接口没返回的字段记 None（写回时保持缺失），
+    # 不能用 normalize_item，它把缺失的计数补成 0，会当作真实值写回
+    stat = data.get("stat") if isinstance(data.get("stat"), dict) else {}
+    owner = data.get("owner") if isinstance(data.get("owner"), dict) else {}
+    row = {c: data.get(c) for c in API_COLUMNS if c not in STAT_COLUMNS}
+    row.update({c: stat.get(c) for c in STAT_COLUMNS})
+    row["owner"] = owner.get("name") or owner.get("mid")
+    # 空串与缺失等价
+    return {c: (None if v == "" else v) for c, v in row.items()}
+
+
+def fetch_video_meta(bvid: str, client: HttpClient) -> Dict[str, Any]:
+    """调用 B 站公开接口按 bvid 获取视频元数据，字段同 API_COLUMNS；接口未返回的字段为 None。
+
+    请求失败（重试用尽）或接口返回非 0 时返回空字典。
     """
     try:
-        resp = requests.get(API_VIEW_URL, params={"bvid": bvid}, timeout=timeout)
-        resp.raise_for_status()
-        j = resp.json()
+        j = client.get_json(API_VIEW_URL, params={"bvid": bvid})
     except Exception:
         return {}
-
     if not isinstance(j, dict) or j.get("code") not in (0, "0"):
         return {}
-
     data = j.get("data") or {}
-    stat = data.get("stat") or {}
-
-    return {
-        "title": data.get("title"),
-        "view": stat.get("view"),
-        "reply": stat.get("reply"),
-        "like": stat.get("like"),
-    }
-
-
-def backfill_key_videos(input_csv: str, output_csv: str, sleep_between: float = 0.6) -> str:
+    if not isinstance(data, dict) or not data:
+        return {}
+    return _api_row(data)
+
+
+def fetch_many(
+    bvids: Iterable[str],
+    client: HttpClient,
+    workers: int = DEFAULT_WORKERS,
+    sleep_between: float = 0.6,
+) -> Dict[str, Dict[str, Any]]:
+    """有界并发拉取：最多 workers 个请求同时进行，相邻两次请求的发起间隔不少于 sleep_between 秒。"""
+    lock = threading.Lock()
+    last = [0.0]
+
+    def one(bvid: str) -> Dict[str, Any]:
+        # 简单限速：全局串行地分配发起时间，避免并发请求对接口压力太大
+        with lock:
+            wait = last[0] + sleep_between - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last[0] = time.monotonic()
+        return fetch_video_meta(bvid, client)
+
+    bvids = list(bvids)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        return dict(zip(bvids, ex.map(one, bvids)))
+
+
+def _need_mask(df: pd.DataFrame, fields: List[str]) -> pd.Series:
+    # 需要补全的行：任一目标字段缺失（标题为空串也算缺失）
+    mask = pd.Series(False, index=df.index)
+    for col in fields:
+        if col not in df.columns:
+            return pd.Series(True, index=df.index)
+        mask |= df[col].isna()
+    if "title" in fields:
+        mask |= df["title"].astype(str).str.len() == 0
+    return mask
+
+
+def _write_back(df: pd.DataFrame, meta: pd.DataFrame, fields: List[str]) -> pd.DataFrame:
+    """按 bvid 一次性合并元数据，只在原值缺失时填充（combine_first）。"""
+    if meta.empty:
+        return df
+    aligned = df[["bvid"]].astype(str).merge(meta, on="bvid", how="left")
+    aligned.index = df.index
+    for col in fields:
+        if col not in aligned.columns:
+            continue
+        if col in df.columns:
+            cur = df[col].mask(df[col].astype(str).str.len() == 0) if col == "title" else df[col]
+            df[col] = cur.combine_first(aligned[col])
+        else:
+            df[col] = aligned[col]
+    return df
+
+
+def backfill_key_videos(
+    input_csv: str,
+    output_csv: str,
+    sleep_between: float = 0.6,
+    data_dir: str | None = None,
+    fields: Iterable[str] = DEFAULT_FIELDS,
+    workers: int = DEFAULT_WORKERS,
+    client: HttpClient | None = None,
+    config_path: str | None = None,
+) -> str:
+    """补全 key_videos 缺失的元数据：先查本地视频元数据索引（data_dir 相关目录下的采集 CSV），
+    再查已缓存的接口结果，仍缺失的才经 HttpClient 并发调用 B 站接口，新结果写回索引。
+
+    fields 为要补全的列（可含 pubdate、owner、tname、duration、coin、favorite、share 等），
+    输入缺少的列会新增。
+    """
     if not os.path.exists(input_csv):
         raise FileNotFoundError(input_csv)
+    fields = [c for c in fields if c in API_COLUMNS]
     df = pd.read_csv(input_csv)
-    if df.empty:
+    if df.empty or not fields:
         df.to_csv(output_csv, index=False)
         return output_csv
 
-    # 需要补全的行：标题为空或 view 为空
-    need_mask = df["title"].isna() | (df["title"].astype(str).str.len() == 0) | df["view"].isna()
-    need = df[need_mask].copy()
+    need = df[_need_mask(df, fields)]
     if need.empty:
         # 没有需要补全的，直接复制一份 enriched
         df.to_csv(output_csv, index=False)
         return output_csv
 
+    # 1) 本地多源合并结果（与 key_nodes_videos 共用同一索引）
     bvids = sorted(set(need["bvid"].dropna().astype(str)))
-    meta_cache: Dict[str, Dict[str, Any]] = {}
-
-    for i, bvid in enumerate(bvids, start=1):
-        m = fetch_video_meta(bvid)
-        meta_cache[bvid] = m
-        # 简单限速，避免对接口压力太大
-        time.sleep(sleep_between)
-
-    # 将拉到的元数据写回 DataFrame
-    for bvid, meta in meta_cache.items():
-        if not meta:
-            continue
-        mask = df["bvid"].astype(str) == bvid
-        for col in ("title", "view", "reply", "like"):
-            if col not in df.columns:
-                continue
-            # 只在原值缺失时填充
-            missing = df.loc[mask, col].isna()
-            if missing.any():
-                df.loc[mask & missing, col] = meta.get(col)
-
+    if data_dir:
+        local = load_videos(data_dir, bvids)
+        df = _write_back(df, local[["bvid", *fields]], fields)
+        bvids = sorted(set(df.loc[_need_mask(df, fields), "bvid"].dropna().astype(str)))
+
+    # 2) 已缓存的接口结果，3) 其余才联网拉取
+    metas = cached_api_meta(bvids)
+    todo = [b for b in bvids if b not in metas]
+    if todo:
+        fetched = fetch_many(todo, client or build_client(config_path), workers=workers, sleep_between=sleep_between)
+        save_api_meta(fetched, int(time.time()))
+        metas.update({b: m for b, m in fetched.items() if m})
+
+    if metas:
+        meta = pd.DataFrame.from_dict(metas, orient="index").rename_axis("bvid").reset_index()
+        df = _write_back(df, meta[["bvid", *fields]], fields)
     df.to_csv(output_csv, index=False)
     return output_csv
 
 
 def main() -> None:
     base_analysis = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
-    in_csv = os.path.join(base_analysis, "key_videos.csv")
-    out_csv = os.path.join(base_analysis, "key_videos_enriched.csv")
-    path = backfill_key_videos(in_csv, out_csv)
+    p = argparse.ArgumentParser(description="补全 key_videos 缺失的视频元数据（本地索引 → 接口缓存 → B 站接口）")
+    p.add_argument("--input_csv", default=os.path.join(base_analysis, "key_videos.csv"))
+    p.add_argument("--output_csv", default=os.path.join(base_analysis, "key_videos_enriched.csv"))
+    p.add_argument("--data_dir", default=os.environ.get("DZ_VIDEO_DATA", os.path.join("data")))
+    p.add_argument("--fields", default=",".join(DEFAULT_FIELDS), help=f"comma separated, any of: {','.join(API_COLUMNS)}")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="max concurrent API requests")
+    p.add_argument("--sleep", type=float, default=0.6, help="min seconds between two request starts")
+    p.add_argument("--config", default="config.yaml", help="config file providing headers/cookies and http settings")
+    args = p.parse_args()
+    path = backfill_key_videos(
+        args.input_csv,
+        args.output_csv,
+        sleep_between=args.sleep,
+        data_dir=args.data_dir,
+        fields=[f.strip() for f in args.fields.split(",") if f.strip()],
+        workers=args.workers,
+        config_path=args.config,
+    )
     print(path)
 
 
@@ -0,0 +1,283 @@
+import os
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln, logsumexp
+
+from online_detect import load_state, save_state, settled_weeks
+
+# 周级情绪/评论量的变点检测，联合考察 score、log(1+count)、neg_ratio 三条序列：
+#   离线：PELT（带剪枝的最优分段，均值变化 + 惩罚项），近似线性时间，输出分段边界；
+#   在线：贝叶斯在线变点检测（BOCPD，常数 hazard，Normal-Gamma 共轭），每新增一周
+#         只更新至多 max_run 个游程长度，输出每周为“新分段起点”的后验概率。
+# 各序列先用中位数与一阶差分的 MAD 标准化，使均值跳变不影响尺度估计。
+SERIES = ["score", "count", "neg_ratio"]
+SEGMENTS_NAME = "changepoint_segments.csv"
+ONLINE_NAME = "changepoints_online.csv"
+STATE_NAME = "changepoint_state.json"
+STATE_VERSION = 1
+MIN_SIZE = 2
+DEFAULT_HAZARD = 1 / 26
+DEFAULT_MAX_RUN = 104
+# 在线模式观察到第 t + lag 周后再给出第 t 周的变点概率（确认延迟）
+DEFAULT_LAG = 1
+SEGMENT_COLUMNS = ["segment", "start_window", "end_window", "n_weeks", "mean_score", "mean_count", "mean_neg_ratio"]
+ONLINE_COLUMNS = ["window", "cp_prob", "run_length"]
+# Normal-Gamma 先验（作用于标准化后的序列）
+_PRIOR = {"mu": 0.0, "kappa": 1.0, "alpha": 1.0, "beta": 1.0}
+
+
+def _features(df: pd.DataFrame) -> np.ndarray:
+    X = pd.DataFrame({c: pd.to_numeric(df[c], errors="coerce") if c in df.columns else 0.0 for c in SERIES})
+    X["count"] = np.log1p(X["count"].clip(lower=0))
+    return X.fillna(0.0).to_numpy(dtype=float)
+
+
+def robust_scaling(X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """每列的 (中心, 尺度)：中位数与 1.4826·MAD(一阶差分)/√2；退化时退回标准差，再退回 1。"""
+    center = np.median(X, axis=0)
+    scale = np.ones(X.shape[1])
+    if len(X) >= 3:
+        d = np.diff(X, axis=0)
+        mad = 1.4826 * np.median(np.abs(d - np.median(d, axis=0)), axis=0) / np.sqrt(2)
+        std = X.std(axis=0)
+        scale = np.where(mad > 0, mad, np.where(std > 0, std, 1.0))
+    return center, scale
+
+
+def pelt(X: np.ndarray, penalty: float | None = None, min_size: int = MIN_SIZE) -> List[int]:
+    """PELT 最优分段（均值变化的平方误差代价），返回各新分段起点的下标（不含 0）。
+
+    代价由前缀和 O(1) 求得；每步剪掉不可能再成为最优上一变点的候选，期望近似线性。
+    penalty 缺省为 2·p·ln(n)（p 为序列数）。
+    """
+    n, p = X.shape
+    if n < 2 * min_size:
+        return []
+    beta = 2 * p * np.log(n) if penalty is None else float(penalty)
+    S1 = np.vstack([np.zeros(p), np.cumsum(X, axis=0)])
+    S2 = np.concatenate([[0.0], np.cumsum((X ** 2).sum(axis=1))])
+
+    def cost(s: np.ndarray, t: int) -> np.ndarray:
+        m = (t - s)[:, None]
+        return S2[t] - S2[s] - ((S1[t] - S1[s]) ** 2 / m).sum(axis=1)
+
+    F = np.full(n + 1, np.inf)
+    F[0] = -beta
+    last = np.zeros(n + 1, dtype=np.int64)
+    cands = np.array([0], dtype=np.int64)
+    for t in range(min_size, n + 1):
+        ok = cands[t - cands >= min_size]
+        if len(ok):
+            vals = F[ok] + cost(ok, t) + beta
+            k = int(np.argmin(vals))
+            F[t], last[t] = vals[k], ok[k]
+            # 剪枝：F[s] + cost(s, t) > F[t] 的 s 以后也不会最优
+            keep = F[ok] + cost(ok, t) <= F[t]
+            cands = np.concatenate([ok[keep], cands[t - cands < min_size]])
+        if t - min_size + 1 > 0:
+            cands = np.append(cands, t - min_size + 1)
+    cps: List[int] = []
+    t = n
+    while t > 0:
+        s = int(last[t])
+        if s > 0:
+            cps.append(s)
+        t = s
+    return sorted(cps)
+
+
+def segment_table(weekly: pd.DataFrame, cps: List[int]) -> pd.DataFrame:
+    bounds = [0, *cps, len(weekly)]
+    rows = []
+    for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])):
+        seg = weekly.iloc[a:b]
+        rows.append({
+            "segment": i,
+            "start_window": seg["window"].iloc[0],
+            "end_window": seg["window"].iloc[-1],
+            "n_weeks": b - a,
+            "mean_score": float(seg["score"].mean()),
+            "mean_count": float(seg["count"].mean()),
+            "mean_neg_ratio": float(seg["neg_ratio"].mean()) if "neg_ratio" in seg.columns else np.nan,
+        })
+    return pd.DataFrame(rows, columns=SEGMENT_COLUMNS)
+
+
+class BOCPD:
+    """贝叶斯在线变点检测（Adams & MacKay, 2007），各序列独立的 Normal-Gamma 模型。
+
+    log_r[r] 为“当前游程已含最近 r 个观测”的对数后验；游程上限 max_run，超出部分截断。
+    """
+
+    def __init__(self, center, scale, hazard: float = DEFAULT_HAZARD, max_run: int = DEFAULT_MAX_RUN):
+        self.center = np.asarray(center, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.hazard = float(hazard)
+        self.max_run = int(max_run)
+        p = len(self.center)
+        self.log_r = np.array([0.0])
+        self.mu = np.full((1, p), _PRIOR["mu"])
+        self.kappa = np.full((1, p), _PRIOR["kappa"])
+        self.alpha = np.full((1, p), _PRIOR["alpha"])
+        self.beta = np.full((1, p), _PRIOR["beta"])
+
+    def _log_pred(self, x: np.ndarray) -> np.ndarray:
+        # Student-t 预测分布，各序列对数密度相加
+        df = 2 * self.alpha
+        var = self.beta * (self.kappa + 1) / (self.alpha * self.kappa)
+        z2 = (x - self.mu) ** 2 / var
+        lp = gammaln((df + 1) / 2) - gammaln(df / 2) - 0.5 * np.log(np.pi * df * var) - (df + 1) / 2 * np.log1p(z2 / df)
+        return lp.sum(axis=1)
+
+    def update(self, x_raw) -> np.ndarray:
+        """吸收一个新观测，返回更新后的游程后验（概率，下标为游程长度）。"""
+        x = (np.asarray(x_raw, dtype=float) - self.center) / self.scale
+        lp = self.log_r + self._log_pred(x)
+        grow = lp + np.log1p(-self.hazard)
+        cp = logsumexp(lp) + np.log(self.hazard)
+        # 游程 r -> r+1 吸收 x；新游程（长度 0）从先验开始
+        mu_n = (self.kappa * self.mu + x) / (self.kappa + 1)
+        beta_n = self.beta + self.kappa * (x - self.mu) ** 2 / (2 * (self.kappa + 1))
+        prior = np.array([[_PRIOR["mu"], _PRIOR["kappa"], _PRIOR["alpha"], _PRIOR["beta"]]]).repeat(len(x), axis=0).T
+        self.mu = np.vstack([prior[0], mu_n])
+        self.kappa = np.vstack([prior[1], self.kappa + 1])
+        self.alpha = np.vstack([prior[2], self.alpha + 0.5])
+        self.beta = np.vstack([prior[3], beta_n])
+        log_r = np.concatenate([[cp], grow])
+        if len(log_r) > self.max_run + 1:
+            log_r = log_r[:self.max_run + 1]
+            for k in ("mu", "kappa", "alpha", "beta"):
+                setattr(self, k, getattr(self, k)[:self.max_run + 1])
+        self.log_r = log_r - logsumexp(log_r)
+        return np.exp(self.log_r)
+
+    def to_state(self) -> Dict:
+        return {
+            "center": self.center.tolist(), "scale": self.scale.tolist(),
+            "hazard": self.hazard, "max_run": self.max_run,
+            "log_r": self.log_r.tolist(),
+            "mu": self.mu.tolist(), "kappa": self.kappa.tolist(),
+            "alpha": self.alpha.tolist(), "beta": self.beta.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, st: Dict) -> "BOCPD":
+        m = cls(st["center"], st["scale"], st["hazard"], st["max_run"])
+        m.log_r = np.asarray(st["log_r"], dtype=float)
+        for k in ("mu", "kappa", "alpha", "beta"):
+            setattr(m, k, np.asarray(st[k], dtype=float).reshape(len(m.log_r), -1))
+        return m
+
+
+def _load_weekly(weekly_csv: str, count_min: int) -> pd.DataFrame:
+    if not os.path.exists(weekly_csv):
+        return pd.DataFrame(columns=["window", *SERIES])
+    df = pd.read_csv(weekly_csv)
+    if df.empty:
+        return df
+    df = df[df["count"] >= count_min]
+    return df.sort_values("window").reset_index(drop=True)
+
+
+def detect_offline(weekly_csv: str, output_dir: str, count_min: int = 20, penalty: float | None = None) -> str:
+    """PELT 离线分段，输出 changepoint_segments.csv（每段起止周与各序列均值）。"""
+    os.makedirs(output_dir, exist_ok=True)
+    out = os.path.join(output_dir, SEGMENTS_NAME)
+    weekly = _load_weekly(weekly_csv, count_min)
+    if weekly.empty:
+        pd.DataFrame([], columns=SEGMENT_COLUMNS).to_csv(out, index=False)
+        return out
+    X = _features(weekly)
+    center, scale = robust_scaling(X)
+    cps = pelt((X - center) / scale, penalty=penalty)
+    segment_table(weekly, cps).to_csv(out, index=False)
+    return out
+
+
+def update_online(
+    weekly_csv: str,
+    output_dir: str,
+    count_min: int = 20,
+    hazard: float = DEFAULT_HAZARD,
+    max_run: int = DEFAULT_MAX_RUN,
+    lag: int = DEFAULT_LAG,
+    today: date | None = None,
+) -> str:
+    """BOCPD 增量更新：只吸收晚于上次进度的已结束周，把确认延迟已满的周追加到 changepoints_online.csv。
+
+    cp_prob 为观察到其后 lag 周时“该周是新分段第一周”的后验概率；run_length 为该周当时的
+    MAP 游程长度。标准化参数在首次运行时由已有数据确定并随状态保存；参数变化时从头重算。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    out = os.path.join(output_dir, ONLINE_NAME)
+    state_path = os.path.join(output_dir, STATE_NAME)
+    params = {"count_min": int(count_min), "hazard": float(hazard), "max_run": int(max_run), "lag": int(lag)}
+
+    weekly = _load_weekly(weekly_csv, count_min)
+    if not weekly.empty:
+        weekly = settled_weeks(weekly, today or date.today())
+    state = load_state(state_path)
+    fresh = state.get("version") != STATE_VERSION or state.get("params") != params
+    if fresh:
+        if weekly.empty:
+            pd.DataFrame([], columns=ONLINE_COLUMNS).to_csv(out, index=False)
+            return out
+        center, scale = robust_scaling(_features(weekly))
+        model = BOCPD(center, scale, hazard, max_run)
+        last_window, pending = None, []
+    else:
+        model = BOCPD.from_state(state["model"])
+        last_window, pending = state.get("last_window"), state.get("pending") or []
+        weekly = weekly[weekly["window"].astype(str) > last_window]
+
+    rows = []
+    X = _features(weekly) if not weekly.empty else np.empty((0, len(SERIES)))
+    for window, x in zip(weekly["window"].astype(str), X):
+        probs = model.update(x)
+        # pending 中的周按时间先后排列，最后一个即本周
+        pending.append([window, int(np.argmax(probs))])
+        if len(pending) > lag:
+            w, rl = pending.pop(0)
+            # 该周之后又观察了 lag 周：游程恰含 lag + 1 个观测即“该周为新分段起点”
+            k = lag + 1
+            rows.append({"window": w, "cp_prob": float(probs[k]) if k < len(probs) else 0.0, "run_length": rl})
+        last_window = window
+
+    new = pd.DataFrame(rows, columns=ONLINE_COLUMNS)
+    if fresh or not os.path.exists(out):
+        new.to_csv(out, index=False)
+    elif not new.empty:
+        new.to_csv(out, mode="a", header=False, index=False)
+    if last_window is not None:
+        save_state(state_path, {
+            "version": STATE_VERSION, "params": params, "last_window": last_window,
+            "pending": pending, "model": model.to_state(),
+        })
+    return out
+
+
+def main() -> None:
+    weekly_csv = os.environ.get(
+        "DZ_WEEKLY_TS",
+        os.path.join("analysis", "sentiment_timeseries_weekly.csv"),
+    )
+    output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
+    mode = os.environ.get("DZ_CP_MODE", "both")
+    if mode in ("offline", "both"):
+        pen = os.environ.get("DZ_CP_PENALTY")
+        print(detect_offline(weekly_csv, output_dir, count_min=20, penalty=float(pen) if pen else None))
+    if mode in ("online", "both"):
+        print(update_online(
+            weekly_csv,
+            output_dir,
+            count_min=20,
+            hazard=1 / float(os.environ.get("DZ_CP_EXPECTED_RUN", 1 / DEFAULT_HAZARD)),
+            max_run=int(os.environ.get("DZ_CP_MAX_RUN", DEFAULT_MAX_RUN)),
+        ))
+
+
+if __name__ == "__main__":
+    main()
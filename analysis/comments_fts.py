@@ -0,0 +1,162 @@
+import argparse
+import os
+import sys
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.storage import DB_FILENAME, get_connection  # type: ignore
+from topics_baseline import tokenize, tokenize_series  # 与话题基线共用同一套 jieba 分词与停用词
+
+
+_TZ8 = timezone(timedelta(hours=8))
+
+
+def init_fts(conn) -> None:
+    # 外部内容表：comments_fts_docs 保存入索引时的分词文本（rowid 即评论 rpid），
+    # 评论正文被重新抓取改写后可凭旧文本精确删除旧词条再写入新词条
+    old = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'comments_fts'").fetchone()
+    if old and "comments_fts_docs" not in old[0]:
+        # 旧版无内容表（content=''）无法删除词条：丢弃后全部重建
+        with conn:
+            conn.execute("DROP TABLE comments_fts")
+            conn.execute("UPDATE comments SET fts_done = 0")
+    conn.execute("CREATE TABLE IF NOT EXISTS comments_fts_docs (rpid INTEGER PRIMARY KEY, message TEXT NOT NULL, title TEXT NOT NULL)")
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts "
+        "USING fts5(message, title, content='comments_fts_docs', content_rowid='rpid', tokenize='unicode61')"
+    )
+    # comments.fts_done（见 src.storage）标记已按当前正文入索引的评论，正文变化时 UPSERT 将其清零；
+    # 部分索引只覆盖待处理的行，增量更新只扫描新评论与改写过的评论。
+    # 补后抓的早期月份时新评论的 rpid 可能小于已索引的最大 rpid，故不用 rpid 高水位。
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_fts_pending ON comments(rpid) WHERE fts_done = 0")
+    conn.commit()
+
+
+def update_index(db_path: str, batch_size: int = 5000) -> int:
+    """把尚未入索引（或正文已改写）的评论分批分词写入 FTS 表，返回写入条数。
+
+    只经部分索引读取 fts_done = 0 的评论，重复执行的代价与新到评论数成正比，与已索引总量无关；
+    已有旧词条的评论先按 comments_fts_docs 中的旧文本删除再写入。
+    """
+    conn = get_connection(db_path)
+    init_fts(conn)
+    last = -1
+    total = 0
+    while True:
+        rows = conn.execute(
+            "SELECT c.rpid, c.message, "
+            "(SELECT v.title FROM videos v WHERE v.bvid = c.bvid AND v.title != '' LIMIT 1) "
+            "FROM comments c "
+            "WHERE c.fts_done = 0 AND c.rpid > ? "
+            "ORDER BY c.rpid LIMIT ?",
+            (last, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+        # 整批分词：经共享分词缓存，同一视频标题只切一次
+        msgs = tokenize_series(pd.Series([r[1] for r in rows], dtype=object))
+        titles = tokenize_series(pd.Series([r[2] for r in rows], dtype=object))
+        docs = [(r[0], " ".join(m), " ".join(t)) for r, m, t in zip(rows, msgs, titles)]
+        marks = ",".join("?" * len(rows))
+        stale = conn.execute(
+            f"SELECT rpid, message, title FROM comments_fts_docs WHERE rpid IN ({marks})", [r[0] for r in rows],
+        ).fetchall()
+        with conn:
+            conn.executemany("INSERT INTO comments_fts(comments_fts, rowid, message, title) VALUES ('delete', ?, ?, ?)", stale)
+            conn.executemany("INSERT OR REPLACE INTO comments_fts_docs(rpid, message, title) VALUES (?, ?, ?)", docs)
+            conn.executemany("INSERT INTO comments_fts(rowid, message, title) VALUES (?, ?, ?)", docs)
+            conn.executemany("UPDATE comments SET fts_done = 1 WHERE rpid = ?", ((r[0],) for r in rows))
+        total += len(docs)
+        last = rows[-1][0]
+    return total
+
+
+def _match_expr(query: str, field: str | None = None) -> str:
+    """检索词与入索引文本用同一分词器切分；切分后为空的检索词（单字、停用词）从未入索引，直接报错。"""
+    # 逐个空格分隔的检索词分词，避免 tokenize 去空格后把相邻检索词粘连切错
+    toks: List[str] = []
+    for term in query.split():
+        words = tokenize(term)
+        if not words:
+            raise ValueError(f"检索词 {term!r} 分词后为空（单字与停用词不入索引），请换用两字及以上的词")
+        toks.extend(words)
+    expr = " AND ".join('"' + t.replace('"', '""') + '"' for t in toks)
+    if field:
+        expr = f"{field} : ({expr})"
+    return expr
+
+
+def _to_ts(day: str) -> int:
+    return int(datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=_TZ8).timestamp())
+
+
+def search(
+    db_path: str,
+    query: str,
+    since: str | None = None,
+    until: str | None = None,
+    field: str | None = None,
+    limit: int = 20,
+) -> pd.DataFrame:
+    """按 bm25 排序返回命中评论；since/until 为东八区日期（左闭右开）。"""
+    cols = ["rpid", "bvid", "ctime", "like", "message", "rank"]
+    expr = _match_expr(query, field)
+    if not expr:
+        return pd.DataFrame([], columns=cols)
+    conn = get_connection(db_path)
+    init_fts(conn)
+    sql = (
+        'SELECT c.rpid, c.bvid, c.ctime, c."like", c.message, bm25(comments_fts, 1.0, 0.5) AS rank '
+        "FROM comments_fts JOIN comments c ON c.rpid = comments_fts.rowid "
+        "WHERE comments_fts MATCH ?"
+    )
+    params: List = [expr]
+    if since:
+        sql += " AND c.ctime >= ?"
+        params.append(_to_ts(since))
+    if until:
+        sql += " AND c.ctime < ?"
+        params.append(_to_ts(until))
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(int(limit))
+    return pd.read_sql_query(sql, conn, params=params)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="评论全文检索（jieba 预分词 + SQLite FTS5）")
+    p.add_argument("--db", default=os.environ.get("DZ_COMMENTS_DB", os.path.join("data", DB_FILENAME)))
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("index", help="增量更新全文索引")
+    ps = sub.add_parser("search", help="检索评论")
+    ps.add_argument("query")
+    ps.add_argument("--since", help="起始日期 YYYY-MM-DD（含）")
+    ps.add_argument("--until", help="截止日期 YYYY-MM-DD（不含）")
+    ps.add_argument("--field", choices=["message", "title"], help="只在评论正文或视频标题中检索")
+    ps.add_argument("--limit", type=int, default=20)
+    args = p.parse_args()
+
+    if args.cmd == "index":
+        n = update_index(args.db)
+        print(f"indexed {n} new comments -> {args.db}")
+        return
+    try:
+        df = search(args.db, args.query, since=args.since, until=args.until, field=args.field, limit=args.limit)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if df.empty:
+        print("no matches")
+        return
+    df["ctime"] = pd.to_datetime(df["ctime"], unit="s", utc=True).dt.tz_convert("Asia/Shanghai").dt.strftime("%Y-%m-%d %H:%M")
+    print(df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import os
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    _HAS_ARROW = True
+except Exception:  # pragma: no cover - 未安装 pyarrow 时仅支持 CSV
+    pa = None
+    ds = None
+    _HAS_ARROW = False
+
+
+# 分区键：keyword=<关键词>/ym=<评论所在年月>，例如 keyword=丁真/ym=2023-04
+PARTITION_COLUMNS = ["keyword", "ym"]
+
+# 评论表的规范内存类型（read_comments 读入即套用）：重复度高的 bvid/uname/keyword 用 category，
+# 正文与分词结果用 Arrow 字符串，小范围整数用可空 Int32/Int8。rpid、ctime 缺失值很少见，
+# 无缺失时保持 int64（ctime 为 Unix 秒，范围过滤、周索引与窗口划分都以此为准）。
+_STRING = "string[pyarrow]" if _HAS_ARROW else "string"
+COMMENT_DTYPES = {
+    "bvid": "category",
+    "uname": "category",
+    "keyword": "category",
+    "parent": "Int64",
+    "mid": "Int64",
+    "root_rpid": "Int64",
+    "floor": "Int32",
+    "like": "Int32",
+    "depth": "Int8",
+    "message": _STRING,
+    "tokens": _STRING,
+    "sent_raw": "float64",
+}
+KEY_COLUMNS = ["rpid", "ctime"]
+# read_csv 直接解析可空整数很慢：整数列先按默认数值类型读入，再由 apply_comment_dtypes 转换
+_CSV_DTYPES = {c: t for c, t in COMMENT_DTYPES.items() if not t.startswith("Int")}
+
+
+def _comment_schema():
+    return pa.schema([
+        ("bvid", pa.dictionary(pa.int32(), pa.string())),
+        ("rpid", pa.int64()),
+        ("parent", pa.int64()),
+        ("floor", pa.int32()),
+        ("like", pa.int32()),
+        ("ctime", pa.int64()),
+        ("uname", pa.dictionary(pa.int32(), pa.string())),
+        ("mid", pa.int64()),
+        ("message", pa.string()),
+        ("root_rpid", pa.int64()),
+        ("depth", pa.int8()),
+        ("sent_raw", pa.float64()),
+        ("tokens", pa.string()),
+        ("keyword", pa.string()),
+        ("ym", pa.string()),
+    ])
+
+
+def _video_schema():
+    return pa.schema([
+        ("bvid", pa.dictionary(pa.int32(), pa.string())),
+        ("title", pa.string()),
+        ("tname", pa.dictionary(pa.int32(), pa.string())),
+        ("pubdate", pa.int64()),
+        ("duration", pa.int64()),
+        ("owner", pa.dictionary(pa.int32(), pa.string())),
+        ("view", pa.int64()),
+        ("danmaku", pa.int64()),
+        ("reply", pa.int64()),
+        ("favorite", pa.int64()),
+        ("coin", pa.int64()),
+        ("share", pa.int64()),
+        ("like", pa.int64()),
+        ("keyword", pa.string()),
+        ("ym", pa.string()),
+    ])
+
+
+def _require_arrow() -> None:
+    if not _HAS_ARROW:
+        raise RuntimeError("pyarrow is not available. Install pyarrow to read/write the Parquet dataset.")
+
+
+def _to_table(df: pd.DataFrame, schema) -> "pa.Table":
+    df = df.copy()
+    for field in schema:
+        if field.name not in df.columns:
+            df[field.name] = None
+        if pa.types.is_integer(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors="coerce").astype("Int64")
+        elif pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors="coerce").astype("float64")
+        elif field.name not in PARTITION_COLUMNS:
+            df[field.name] = df[field.name].astype("string")
+    df["keyword"] = df["keyword"].fillna("").astype(str)
+    df["ym"] = df["ym"].fillna("unknown").astype(str)
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+def _write(table, root_dir: str, schema=None) -> str:
+    os.makedirs(root_dir, exist_ok=True)
+    ds.write_dataset(
+        table,
+        root_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=PARTITION_COLUMNS,
+        partitioning_flavor="hive",
+        # 只替换本次写入涉及的分区，其他月份保持不变
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+    return root_dir
+
+
+def write_comments_parquet(df: pd.DataFrame, root_dir: str) -> str:
+    """按 keyword/评论年月分区写出评论；df 需包含 keyword 列，ym 缺省时由 ctime 推出。"""
+    _require_arrow()
+    if "ym" not in df.columns:
+        ts = pd.to_datetime(df["ctime"], unit="s", errors="coerce")
+        df = df.assign(ym=ts.dt.strftime("%Y-%m"))
+    return _write(_to_table(df, _comment_schema()), root_dir)
+
+
+def write_comments_parquet_stream(frames: Iterable[pd.DataFrame], root_dir: str) -> str:
+    """分块写出评论数据集：frames 逐块转换为 RecordBatch 流式写入，内存只保留当前块。
+
+    与 write_comments_parquet 一样只替换本次写入涉及的分区。
+    """
+    _require_arrow()
+    schema = _comment_schema()
+
+    def batches():
+        for df in frames:
+            if df.empty:
+                continue
+            if "ym" not in df.columns:
+                ts = pd.to_datetime(df["ctime"], unit="s", errors="coerce")
+                df = df.assign(ym=ts.dt.strftime("%Y-%m"))
+            yield from _to_table(df, schema).to_batches()
+
+    return _write(batches(), root_dir, schema=schema)
+
+
+def write_videos_parquet(df: pd.DataFrame, root_dir: str) -> str:
+    """按 keyword/采集月份分区写出视频元数据；df 需包含 keyword、ym 列。"""
+    _require_arrow()
+    return _write(_to_table(df, _video_schema()), root_dir)
+
+
+def _ym(value) -> str:
+    return pd.Timestamp(value).strftime("%Y-%m")
+
+
+def _ts(value) -> int:
+    return int(pd.Timestamp(value).timestamp())
+
+
+def week_bounds(windows: Iterable[str]):
+    """由若干 "YYYY-MM-DD/YYYY-MM-DD" 周窗口求覆盖范围 (start, end)，end 为最后一周次日。"""
+    ws = [str(w) for w in windows if isinstance(w, str) and "/" in w]
+    if not ws:
+        return None, None
+    start = min(pd.Timestamp(w.split("/")[0]) for w in ws)
+    end = max(pd.Timestamp(w.split("/")[1]) for w in ws) + pd.Timedelta(days=1)
+    return start, end
+
+
+def apply_comment_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """把评论表转换为 COMMENT_DTYPES 规定的类型（已是目标类型的列不动）。"""
+    for c, t in COMMENT_DTYPES.items():
+        if c not in df.columns:
+            continue
+        if t == "category" and isinstance(df[c].dtype, pd.CategoricalDtype):
+            # Parquet 字典列的类别按出现顺序排列，统一为字典序，分组/排序结果与字符串列一致
+            if not df[c].cat.categories.is_monotonic_increasing:
+                df[c] = df[c].cat.reorder_categories(df[c].cat.categories.sort_values())
+            continue
+        if df[c].dtype == t:
+            continue
+        if t.startswith("Int") and not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        df[c] = df[c].astype(t)
+    for c in KEY_COLUMNS:
+        if c in df.columns and df[c].dtype != np.int64 and pd.api.types.is_numeric_dtype(df[c]) and not df[c].hasnans:
+            df[c] = df[c].astype(np.int64)
+    return df
+
+
+def window_labels(ctime: pd.Series, freq: str) -> pd.Series:
+    """Unix 秒 → 时间窗口标签（如 2023-04、2023-04-10/2023-04-16，freq 为 pandas 周期频率）。
+
+    返回 category 列：只对去重后的窗口做字符串格式化；类别按时间先后排列（与标签字典序一致），
+    时间缺失记为末尾的 "NaT"。
+    """
+    per = pd.to_datetime(ctime, unit="s", errors="coerce").dt.to_period(freq)
+    codes, uniq = pd.factorize(per, sort=True)
+    cats = [str(u) for u in uniq]
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(cats), codes)
+        cats.append("NaT")
+    return pd.Series(pd.Categorical.from_codes(codes, categories=cats), index=ctime.index)
+
+
+def _arrow_types(t):
+    # Parquet 中的普通字符串直接转成 Arrow 字符串列，不经 Python 对象
+    return pd.StringDtype("pyarrow") if t == pa.string() else None
+
+
+def _unique_rpid(df: pd.DataFrame, per_keyword: bool) -> pd.DataFrame:
+    if per_keyword or "rpid" not in df.columns:
+        return df
+    dup = df["rpid"].duplicated() & df["rpid"].notna()
+    return df[~dup].reset_index(drop=True) if dup.any() else df
+
+
+def _project(df: pd.DataFrame, cols: List[str] | None) -> pd.DataFrame:
+    return df[[c for c in cols if c in df.columns]] if cols is not None else df
+
+
+def read_comments(
+    source: str,
+    columns: Iterable[str] | None = None,
+    start=None,
+    end=None,
+    keywords: Iterable[str] | None = None,
+    per_keyword: bool = False,
+) -> pd.DataFrame:
+    """统一读取清洗后的评论：source 为 CSV 文件或 Parquet 数据集目录。
+
+    columns 为列投影（缺失的列自动忽略）；start/end 为时间范围（左闭右开，
+    可为日期字符串或 Timestamp），对 Parquet 先按 ym 分区裁剪再按 ctime 过滤。
+    各列按 COMMENT_DTYPES 的规范类型读入。
+    清洗结果按 (keyword, rpid) 去重，同一评论可能出现在多个关键词下；per_keyword 为假时
+    按 rpid 只保留首条，整体统计每条评论只计一次，按关键词分组的面板统计传 per_keyword=True。
+    """
+    cols: List[str] | None = list(columns) if columns is not None else None
+    if os.path.isdir(source):
+        _require_arrow()
+        dataset = ds.dataset(source, format="parquet", partitioning="hive")
+        filt = None
+
+        def _and(expr):
+            return expr if filt is None else (filt & expr)
+
+        if start is not None:
+            filt = _and((ds.field("ym") >= _ym(start)) & (ds.field("ctime") >= _ts(start)))
+        if end is not None:
+            filt = _and((ds.field("ym") <= _ym(end)) & (ds.field("ctime") < _ts(end)))
+        if keywords is not None:
+            filt = _and(ds.field("keyword").isin(list(keywords)))
+        use = [c for c in cols if c in dataset.schema.names] if cols is not None else None
+        if use is not None and not per_keyword and "rpid" in dataset.schema.names and "rpid" not in use:
+            use.append("rpid")
+        df = dataset.to_table(columns=use, filter=filt).to_pandas(types_mapper=_arrow_types)
+        return apply_comment_dtypes(_project(_unique_rpid(df, per_keyword), cols))
+
+    if cols is not None:
+        want = set(cols)
+        if start is not None or end is not None:
+            want.add("ctime")
+        if keywords is not None:
+            want.add("keyword")
+        if not per_keyword:
+            want.add("rpid")
+        df = pd.read_csv(source, usecols=lambda c: c in want, dtype=_CSV_DTYPES)
+    else:
+        df = pd.read_csv(source, dtype=_CSV_DTYPES)
+    if start is not None:
+        df = df[df["ctime"] >= _ts(start)]
+    if end is not None:
+        df = df[df["ctime"] < _ts(end)]
+    if keywords is not None and "keyword" in df.columns:
+        df = df[df["keyword"].isin(list(keywords))]
+    return apply_comment_dtypes(_project(_unique_rpid(df, per_keyword), cols).reset_index(drop=True))
+
+
+def _week_range(window: str):
+    """"YYYY-MM-DD/YYYY-MM-DD" 周窗口 → [start, end) 的 ctime 秒数；无法解析时返回 None。"""
+    if not isinstance(window, str) or "/" not in window:
+        return None
+    a, b = window.split("/", 1)
+    return _ts(a), _ts(pd.Timestamp(b) + pd.Timedelta(days=1))
+
+
+class WeekIndex:
+    """按 ctime 排好序的评论 + 周窗口 → 行区间索引。
+
+    排序只做一次，之后每个周窗口用二分查找定位 [lo, hi)，取数为连续切片，
+    不必逐行生成周字符串、也不必每周整列扫描。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        df = df[df["ctime"].notna()] if "ctime" in df.columns else df.iloc[0:0]
+        self.df = df.sort_values("ctime", kind="stable").reset_index(drop=True)
+        self._ctime = self.df["ctime"].to_numpy(dtype=np.int64) if len(self.df) else np.empty(0, dtype=np.int64)
+
+    @property
+    def empty(self) -> bool:
+        return self.df.empty
+
+    def bounds(self, window: str) -> tuple[int, int]:
+        rng = _week_range(window)
+        if rng is None:
+            return 0, 0
+        lo, hi = np.searchsorted(self._ctime, rng, side="left")
+        return int(lo), int(hi)
+
+    def week(self, window: str) -> pd.DataFrame:
+        lo, hi = self.bounds(window)
+        return self.df.iloc[lo:hi]
+
+    def subset(self, windows: Iterable[str]) -> "WeekIndex":
+        """只保留给定周窗口内的评论（仍按 ctime 有序）。"""
+        spans = sorted({self.bounds(w) for w in windows})
+        rows = [np.arange(lo, hi) for lo, hi in spans if hi > lo]
+        return WeekIndex(self.df.iloc[np.concatenate(rows)] if rows else self.df.iloc[0:0])
+
+
+def load_week_index(source: str, windows: Iterable[str], columns: Iterable[str]) -> WeekIndex:
+    """读取覆盖给定周窗口时间范围的评论并建立周索引；source 不存在时返回空索引。"""
+    windows = list(windows)
+    cols = list(dict.fromkeys([*columns, "ctime"]))
+    if not os.path.exists(source) or not windows:
+        return WeekIndex(pd.DataFrame([], columns=cols))
+    start, end = week_bounds(windows)
+    return WeekIndex(read_comments(source, columns=cols, start=start, end=end))
@@ -1,80 +1,84 @@
 import os
 import pandas as pd
 
+from online_detect import main as online_main
+from sentiment_aggregate import PANEL_KEY, add_change_columns, aggregate_panel
+
+CANDIDATE_COLUMNS = [
+    "window", "count", "score",
+    "pos_ratio", "neg_ratio", "neu_ratio",
+    "z_count", "z_score", "d_count", "d_score",
+    "is_score_peak", "is_count_peak", "is_turning",
+]
+PANEL_NAME = "candidate_weeks_panel.csv"
+
+
+def flag_candidates(df: pd.DataFrame, by: str | None = None) -> pd.DataFrame:
+    """标记候选周；by 非空时各序列的“转折”分位数分别计算（groupby 向量化，不逐序列循环）。"""
+    # 情绪强度异常、评论量异常、情绪变化剧烈
+    # 阈值可以以后按需要调整
+    df["is_score_peak"] = df["z_score"].abs() >= 1.5
+    df["is_count_peak"] = df["z_count"] >= 1.5
+
+    # 用分位数定义“转折”：d_score 绝对值排在（本序列）整体的后 10%
+    if "d_score" in df.columns and not df["d_score"].isna().all():
+        abs_d = df["d_score"].abs()
+        q_d = abs_d.quantile(0.9) if by is None else df[by].map(abs_d.groupby(df[by]).quantile(0.9))
+        df["is_turning"] = abs_d >= q_d
+    else:
+        df["is_turning"] = False
+
+    df["is_candidate"] = df[["is_score_peak", "is_count_peak", "is_turning"]].any(axis=1)
+    return df
+
 
 def detect_candidate_weeks(weekly_csv: str, output_dir: str, count_min: int = 20) -> str:
     os.makedirs(output_dir, exist_ok=True)
+    out = os.path.join(output_dir, "candidate_weeks.csv")
     if not os.path.exists(weekly_csv):
-        out = os.path.join(output_dir, "candidate_weeks.csv")
-        pd.DataFrame([], columns=[
-            "window", "count", "score",
-            "pos_ratio", "neg_ratio", "neu_ratio",
-            "z_count", "z_score", "d_count", "d_score",
-            "is_score_peak", "is_count_peak", "is_turning",
-        ]).to_csv(out, index=False)
+        pd.DataFrame([], columns=CANDIDATE_COLUMNS).to_csv(out, index=False)
         return out
 
     df = pd.read_csv(weekly_csv)
     if df.empty:
-        out = os.path.join(output_dir, "candidate_weeks.csv")
-        pd.DataFrame([], columns=[
-            "window", "count", "score",
-            "pos_ratio", "neg_ratio", "neu_ratio",
-            "z_count", "z_score", "d_count", "d_score",
-            "is_score_peak", "is_count_peak", "is_turning",
-        ]).to_csv(out, index=False)
+        pd.DataFrame([], columns=CANDIDATE_COLUMNS).to_csv(out, index=False)
         return out
 
     # 只保留样本量足够的周
     df = df[df["count"] >= count_min].reset_index(drop=True)
     if df.empty:
-        out = os.path.join(output_dir, "candidate_weeks.csv")
-        pd.DataFrame([], columns=[
-            "window", "count", "score",
-            "pos_ratio", "neg_ratio", "neu_ratio",
-            "z_count", "z_score", "d_count", "d_score",
-            "is_score_peak", "is_count_peak", "is_turning",
-        ]).to_csv(out, index=False)
+        pd.DataFrame([], columns=CANDIDATE_COLUMNS).to_csv(out, index=False)
         return out
 
     # 若尚未有 z/d 列，则根据当前 df 再算一遍（兼容性考虑）
     if "z_count" not in df.columns or "z_score" not in df.columns:
-        if len(df) >= 2:
-            df["z_count"] = (df["count"] - df["count"].mean()) / df["count"].std(ddof=0)
-            df["z_score"] = (df["score"] - df["score"].mean()) / df["score"].std(ddof=0)
-            df["d_count"] = df["count"].diff().fillna(0.0)
-            df["d_score"] = df["score"].diff().fillna(0.0)
-        else:
-            df["z_count"] = 0.0
-            df["z_score"] = 0.0
-            df["d_count"] = 0.0
-            df["d_score"] = 0.0
-
-    # 情绪强度异常、评论量异常、情绪变化剧烈
-    # 阈值可以以后按需要调整
-    df["is_score_peak"] = df["z_score"].abs() >= 1.5
-    df["is_count_peak"] = df["z_count"] >= 1.5
+        df = add_change_columns(df)
 
-    # 用分位数定义“转折”：d_score 绝对值排在整体的后 10%
-    if "d_score" in df.columns and not df["d_score"].isna().all():
-        q_d = df["d_score"].abs().quantile(0.9)
-        df["is_turning"] = df["d_score"].abs() >= q_d
-    else:
-        df["is_turning"] = False
-
-    df["is_candidate"] = df[["is_score_peak", "is_count_peak", "is_turning"]].any(axis=1)
+    df = flag_candidates(df)
     cand = df[df["is_candidate"]].copy()
+    cand = cand.reindex(columns=CANDIDATE_COLUMNS)
+    cand.to_csv(out, index=False)
+    return out
 
-    cols = [
-        "window", "count", "score",
-        "pos_ratio", "neg_ratio", "neu_ratio",
-        "z_count", "z_score", "d_count", "d_score",
-        "is_score_peak", "is_count_peak", "is_turning",
-    ]
-    cand = cand.reindex(columns=cols)
 
-    out = os.path.join(output_dir, "candidate_weeks.csv")
-    cand.to_csv(out, index=False)
+def detect_panel(panel_csv: str, output_dir: str, count_min: int = 20) -> str:
+    """面板检测：(keyword, window) 长表上对所有关键词一次性判定，输出带 keyword 列的
+    candidate_weeks_panel.csv；每个关键词的结果与单独运行 detect_candidate_weeks 相同。"""
+    os.makedirs(output_dir, exist_ok=True)
+    out = os.path.join(output_dir, PANEL_NAME)
+    cols = [PANEL_KEY, *CANDIDATE_COLUMNS]
+    df = pd.read_csv(panel_csv) if os.path.exists(panel_csv) else pd.DataFrame()
+    if not df.empty:
+        df = df[df["count"] >= count_min].reset_index(drop=True)
+    if df.empty:
+        pd.DataFrame([], columns=cols).to_csv(out, index=False)
+        return out
+
+    df = df.sort_values([PANEL_KEY, "window"], kind="stable").reset_index(drop=True)
+    if "z_count" not in df.columns or "z_score" not in df.columns:
+        df = add_change_columns(df, by=PANEL_KEY)
+    df = flag_candidates(df, by=PANEL_KEY)
+    df[df["is_candidate"]].reindex(columns=cols).to_csv(out, index=False)
     return out
 
 
@@ -84,6 +88,26 @@ def main() -> None:
         os.path.join("analysis", "sentiment_timeseries_weekly.csv"),
     )
     output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
+    mode = os.environ.get("DZ_DETECT_MODE", "batch")
+    if mode == "online":
+        # 在线模式：滚动稳健 z 值 + EWMA 基线，只处理新增周（见 online_detect）
+        online_main()
+        return
+    if mode == "panel":
+        # 面板模式：所有关键词的周序列一次聚合、一次检测
+        input_csv = os.environ.get("DZ_CLEANED_COMMENTS", os.path.join("analysis", "cleaned", "comments_cleaned.csv"))
+        kws = [k.strip() for k in os.environ.get("DZ_PANEL_KEYWORDS", "").split(",") if k.strip()]
+        panel_csv = aggregate_panel(
+            input_csv,
+            output_dir,
+            freq="W",
+            start=os.environ.get("DZ_START"),
+            end=os.environ.get("DZ_END"),
+            keywords=kws or None,
+        )
+        print(panel_csv)
+        print(detect_panel(panel_csv, output_dir, count_min=20))
+        return
     path = detect_candidate_weeks(weekly_csv, output_dir, count_min=20)
     print(path)
 
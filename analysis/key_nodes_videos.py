@@ -1,10 +1,10 @@
 import os
-from glob import glob
-from typing import List
 
 import pandas as pd
 
-from key_nodes_prepare import _score_text_continuous
+from comments_io import load_week_index
+from sentiment_cache import ensure_sent_raw
+from video_index import load_videos
 
 
 def _load_candidate_weeks(path: str) -> pd.DataFrame:
@@ -14,78 +14,16 @@ def _load_candidate_weeks(path: str) -> pd.DataFrame:
     return df if not df.empty else pd.DataFrame()
 
 
-def _load_comments(cleaned_csv: str) -> pd.DataFrame:
-    if not os.path.exists(cleaned_csv):
-        return pd.DataFrame()
-    df = pd.read_csv(cleaned_csv)
-    if df.empty:
-        return df
-    ts = pd.to_datetime(df["ctime"], unit="s", errors="coerce")
-    df = df.assign(
-        ts=ts,
-        week=ts.dt.to_period("W").astype(str),
-    )
-    return df
-
-
-def _load_videos_from_data(data_dir: str) -> pd.DataFrame:
-    """从本地已爬取的各类 CSV 中汇总视频元数据。
-
-    优先使用本地数据目录（data/、data_click/、data_totalrank/、data_merged/、data_merged_relaxed），
-    通过 bvid 去重后返回一个包含 title/view/reply/like 等字段的总表，
-    以避免依赖联网补全。
-    """
-    base = os.path.abspath(data_dir)
-    candidate_dirs: List[str] = [base]
-    # 若存在其它采集输出目录，也一并纳入
-    for sub in ["data_click", "data_totalrank", "data_merged", "data_merged_relaxed"]:
-        p = os.path.join(os.path.dirname(base), sub)
-        if os.path.isdir(p):
-            candidate_dirs.append(p)
-
-    files: List[str] = []
-    for d in candidate_dirs:
-        files.extend(glob(os.path.join(d, "comments_*.csv")))
-        # data_merged / data_merged_relaxed 里也可能是按月合并后的 csv
-        files.extend(glob(os.path.join(d, "*.csv")))
-
-    if not files:
-        return pd.DataFrame()
-
-    dfs: List[pd.DataFrame] = []
-    for fp in sorted(set(files)):
-        try:
-            df = pd.read_csv(fp)
-            # 只保留含 bvid 的表作为候选元数据源
-            if "bvid" in df.columns:
-                dfs.append(df)
-        except Exception:
-            continue
-
-    if not dfs:
-        return pd.DataFrame()
-
-    merged = pd.concat(dfs, ignore_index=True)
-    # 按 bvid 去重，保留指标最高的一行（view 优先）
-    if "view" in merged.columns:
-        merged = merged.sort_values("view", ascending=False).drop_duplicates("bvid", keep="first")
-    else:
-        merged = merged.drop_duplicates("bvid", keep="first")
-    return merged
-
-
 def _compute_video_stats_for_week(wk_comments: pd.DataFrame) -> pd.DataFrame:
     if wk_comments.empty:
         return pd.DataFrame(columns=[
             "bvid", "comment_count", "comment_like_sum",
             "sent_mean", "sent_std",
         ])
-    # 确保有连续情感分
-    if "sent_raw" not in wk_comments.columns:
-        wk_comments = wk_comments.copy()
-        wk_comments["sent_raw"] = wk_comments["message"].fillna("").astype(str).apply(_score_text_continuous)
+    # 确保有连续情感分（缺失部分查/填共享缓存）
+    wk_comments = ensure_sent_raw(wk_comments)
     # 仅对真正需要的列做聚合，避免 pandas 对分组列本身触发 FutureWarning
-    g = wk_comments[["bvid", "like", "sent_raw"]].groupby("bvid", sort=False)
+    g = wk_comments[["bvid", "like", "sent_raw"]].groupby("bvid", sort=False, observed=True)
     stats = g.apply(
         lambda x: pd.Series({
             "comment_count": int(len(x)),
@@ -147,8 +85,12 @@ def extract_key_videos(
 
     cand = _load_candidate_weeks(candidate_weeks_csv)
     weekly = pd.read_csv(weekly_csv) if os.path.exists(weekly_csv) else pd.DataFrame()
-    comments = _load_comments(cleaned_comments_csv)
-    videos = _load_videos_from_data(data_dir)
+    # 只读取候选周覆盖的时间范围（Parquet 可按月分区裁剪），按 ctime 排序一次建立周索引
+    comments = load_week_index(
+        cleaned_comments_csv,
+        cand["window"] if not cand.empty else [],
+        columns=["bvid", "ctime", "message", "like", "sent_raw"],
+    )
 
     if cand.empty or comments.empty:
         out = os.path.join(output_dir, "key_videos.csv")
@@ -158,12 +100,14 @@ def extract_key_videos(
         ]).to_csv(out, index=False)
         return out
 
+    # 视频元数据走增量索引：只重读新增/变化的采集 CSV，按涉及的 bvid 查询
+    videos = load_videos(data_dir, comments.df["bvid"].dropna().astype(str).unique())
     weekly_mean = weekly.set_index("window") if not weekly.empty else None
 
     rows = []
     for _, w in cand.iterrows():
         window = w["window"]
-        wk_comments = comments[comments["week"] == window]
+        wk_comments = comments.week(window)
         if wk_comments.empty:
             continue
         stats = _compute_video_stats_for_week(wk_comments)
@@ -206,7 +150,7 @@ def extract_key_videos(
 
 def main() -> None:
     base_analysis = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
-    candidate_weeks_csv = os.path.join(base_analysis, "candidate_weeks.csv")
+    candidate_weeks_csv = os.environ.get("DZ_CANDIDATE_WEEKS", os.path.join(base_analysis, "candidate_weeks.csv"))
     weekly_csv = os.path.join(base_analysis, "sentiment_timeseries_weekly.csv")
     cleaned_comments_csv = os.environ.get(
         "DZ_CLEANED_COMMENTS",
@@ -0,0 +1,195 @@
+import os
+import re
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from comments_io import read_comments
+
+# MinHash + LSH 分段：评论按字符 n-gram 切片，取 NUM_PERM 个最小哈希作签名；
+# 签名切成 BANDS 段、每段 ROWS 个值，任一段完全相同的评论才成为候选对，
+# 候选对再按签名估计的 Jaccard 相似度 >= THRESHOLD 判定为近重复，整体近似线性。
+# 评论多为短文本，SimHash 对一两个字的改动过于敏感，故采用 MinHash。
+SHINGLE = 2
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.6
+_MIN_AGREE = int(np.ceil(THRESHOLD * NUM_PERM))
+# 归一化后短于该长度的文本切片太少，只做精确匹配
+MIN_LEN = 6
+# 每批参与签名计算的切片数，控制内存
+_BATCH = 1 << 20
+
+CLUSTER_COLUMNS = ["rpid", "dup_cluster", "dup_size"]
+MODES = ("off", "weight", "collapse")
+
+_norm_re = re.compile(r"[^\u4e00-\u9fffA-Za-z0-9]+")
+_SHIFT = np.uint64(32)
+_rng = np.random.RandomState(20201125)
+_A = _rng.randint(0, np.iinfo(np.int64).max, size=NUM_PERM, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+_B = _rng.randint(0, np.iinfo(np.int64).max, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+
+def normalize(s) -> str:
+    """去掉标点、空白与表情，英文转小写；用于精确匹配与切片。"""
+    if not isinstance(s, str):
+        return ""
+    return _norm_re.sub("", s).lower()
+
+
+def shingles(text: str) -> set:
+    return {text[i:i + SHINGLE] for i in range(max(len(text) - SHINGLE + 1, 1))}
+
+
+def minhash_signatures(texts) -> np.ndarray:
+    """批量计算 MinHash 签名，返回 (len(texts), NUM_PERM) 的 uint32 矩阵。
+
+    第 k 个哈希函数取 multiply-shift 形式 ((a_k * x + b_k) mod 2^64) >> 32，
+    逐个函数做一次向量运算 + 分段最小值，内存只与一批切片数成正比。
+    """
+    sigs = np.empty((len(texts), NUM_PERM), dtype=np.uint32)
+    i = 0
+    while i < len(texts):
+        grams: list = []
+        starts: list = []
+        j = i
+        while j < len(texts) and (j == i or len(grams) < _BATCH):
+            starts.append(len(grams))
+            grams.extend(shingles(texts[j]))
+            j += 1
+        h = pd.util.hash_array(np.array(grams, dtype=object))
+        idx = np.array(starts, dtype=np.int64)
+        for k in range(NUM_PERM):
+            sigs[i:j, k] = np.minimum.reduceat(((h * _A[k] + _B[k]) >> _SHIFT).astype(np.uint32), idx)
+        i = j
+    return sigs
+
+
+def _bucket_edges(grp: np.ndarray, sigs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """桶内按“代表元”聚拢：每轮取首个未归属的成员为代表，签名相似度达标者并入。
+
+    每轮一次向量化比较，代价为 O(桶大小 × 代表元数)；模板刷屏形成的大桶代表元很少。
+    """
+    src: list = []
+    dst: list = []
+    rest = grp
+    while len(rest) > 1:
+        hit = (sigs[rest[1:]] == sigs[rest[0]]).sum(axis=1) >= _MIN_AGREE
+        if hit.any():
+            src.append(np.full(int(hit.sum()), rest[0]))
+            dst.append(rest[1:][hit])
+        rest = rest[1:][~hit]
+    if not src:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(src), np.concatenate(dst)
+
+
+def _components(n: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """由边集求连通分量，返回每个节点所在分量的最小下标（标签传播 + 指针跳跃）。"""
+    labels = np.arange(n)
+    if len(u) == 0:
+        return labels
+    while True:
+        m = np.minimum(labels[u], labels[v])
+        new = labels.copy()
+        np.minimum.at(new, u, m)
+        np.minimum.at(new, v, m)
+        new = new[new]
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+def assign_clusters(messages: pd.Series, min_len: int = MIN_LEN) -> np.ndarray:
+    """为每条评论分配近重复簇号（簇内首条评论的位置下标）；不与任何评论重复者自成一簇。"""
+    norm = messages.map(normalize).to_numpy(dtype=object)
+    n = len(norm)
+    pos = np.arange(n)
+
+    # 1) 归一化后完全相同：直接连边到该文本首次出现的位置，且只让首条参与 MinHash；
+    #    归一化后为空（纯表情/标点）的评论不参与合并
+    codes, _ = pd.factorize(pd.Series(norm), sort=False)
+    nonempty = np.array([bool(t) for t in norm], dtype=bool)
+    first = pd.Series(pos).groupby(codes).transform("first").to_numpy()
+    edges_u = [first[nonempty]]
+    edges_v = [pos[nonempty]]
+
+    # 2) 足够长的代表文本做 MinHash + LSH 分段；每段结束后更新连通分量，
+    #    成员已全部连通的桶在后续分段中直接跳过
+    reps = pos[nonempty & (first == pos) & np.array([len(t) >= min_len for t in norm], dtype=bool)]
+    if len(reps) > 1:
+        sigs = minhash_signatures([norm[i] for i in reps])
+        for b in range(BANDS):
+            labels = _components(n, np.concatenate(edges_u), np.concatenate(edges_v))[reps]
+            band = pd.DataFrame(sigs[:, b * ROWS:(b + 1) * ROWS])
+            key = band.groupby(list(band.columns), sort=False).ngroup().to_numpy()
+            spread = pd.Series(labels).groupby(key).transform("nunique").to_numpy()
+            cand = np.flatnonzero(spread > 1)
+            order = cand[np.argsort(key[cand], kind="stable")]
+            cuts = np.flatnonzero(np.diff(key[order])) + 1
+            for grp in np.split(order, cuts):
+                if len(grp) > 1:
+                    su, sv = _bucket_edges(grp, sigs)
+                    edges_u.append(reps[su])
+                    edges_v.append(reps[sv])
+
+    return _components(n, np.concatenate(edges_u), np.concatenate(edges_v))
+
+
+def run(input_csv: str, output_dir: str, start=None, end=None) -> str:
+    """对清洗后的评论做近重复聚类，输出 near_dup_clusters.csv（rpid, dup_cluster, dup_size）。
+
+    dup_cluster 为簇内最早一条评论的 rpid。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    out = os.path.join(output_dir, "near_dup_clusters.csv")
+    if not os.path.exists(input_csv):
+        pd.DataFrame([], columns=CLUSTER_COLUMNS).to_csv(out, index=False)
+        return out
+    df = read_comments(input_csv, columns=["rpid", "ctime", "message"], start=start, end=end)
+    if df.empty:
+        pd.DataFrame([], columns=CLUSTER_COLUMNS).to_csv(out, index=False)
+        return out
+    df = df.sort_values(["ctime", "rpid"], kind="stable").reset_index(drop=True)
+    roots = assign_clusters(df["message"])
+    df["dup_cluster"] = df["rpid"].to_numpy()[roots]
+    df["dup_size"] = df.groupby("dup_cluster")["rpid"].transform("size")
+    df[CLUSTER_COLUMNS].to_csv(out, index=False)
+    return out
+
+
+def apply_near_dup(df: pd.DataFrame, clusters_csv: str | None, mode: str = "off", by: str | List[str] = "window") -> pd.DataFrame:
+    """按近重复簇调整评论权重，返回带 dup_w 列的 df（需含 rpid 与 by 列；by 可为多列，如 [keyword, window]）。
+
+    mode=weight：同一窗口内同簇的 n 条评论各计 1/n；mode=collapse：每个窗口每簇只保留首条。
+    mode=off 或找不到簇文件时 dup_w 恒为 1。
+    """
+    df = df.copy()
+    df["dup_w"] = 1.0
+    if mode not in MODES:
+        raise ValueError(f"unknown near-duplicate mode: {mode} (expected one of {', '.join(MODES)})")
+    if mode == "off" or not clusters_csv or not os.path.exists(clusters_csv):
+        return df
+    cl = pd.read_csv(clusters_csv, usecols=["rpid", "dup_cluster"])
+    df = df.merge(cl, on="rpid", how="left")
+    # 未出现在簇文件中的评论（如后来新增）各自成簇
+    df["dup_cluster"] = df["dup_cluster"].fillna(df["rpid"])
+    keys = [by] if isinstance(by, str) else list(by)
+    if mode == "collapse":
+        df = df.drop_duplicates(subset=[*keys, "dup_cluster"], keep="first")
+    else:
+        df["dup_w"] = 1.0 / df.groupby([*keys, "dup_cluster"], observed=True)["rpid"].transform("size")
+    return df.drop(columns=["dup_cluster"]).reset_index(drop=True)
+
+
+def main():
+    input_csv = os.environ.get("DZ_CLEANED_COMMENTS", os.path.join("analysis", "cleaned", "comments_cleaned.csv"))
+    output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
+    path = run(input_csv, output_dir, start=os.environ.get("DZ_START"), end=os.environ.get("DZ_END"))
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
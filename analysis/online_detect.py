@@ -0,0 +1,209 @@
+import json
+import os
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# 在线关键周检测：每周只与其之前 lookback 个有效周比较——
+#   z_count / z_score：相对滚动中位数的稳健 z 值（尺度为 1.4826 × MAD）；
+#   d_count / d_score：相对 EWMA 基线（截至上一周）的偏离，d_score 再按滚动 MAD 判定“转折”。
+# 检测状态（滚动窗口、EWMA、已处理到的周）持久化为 JSON，新增周只需 O(新增周数) 计算，
+# 已输出的历史周标记不会因新数据而改变。参数变化时状态作废、从头重算。
+# 候选周写入独立的 candidate_weeks_online.csv，不与批量检测的 candidate_weeks.csv 混写。
+STATE_NAME = "online_detect_state.json"
+WEEKS_NAME = "online_weeks.csv"
+CANDIDATE_NAME = "candidate_weeks_online.csv"
+STATE_VERSION = 1
+DEFAULT_LOOKBACK = 12
+DEFAULT_ALPHA = 0.3
+# 历史不足该周数时只积累状态、不做判定
+MIN_HISTORY = 4
+PEAK_Z = 3.0
+TURN_Z = 3.0
+_MAD_SCALE = 1.4826
+
+CANDIDATE_COLUMNS = [
+    "window", "count", "score",
+    "pos_ratio", "neg_ratio", "neu_ratio",
+    "z_count", "z_score", "d_count", "d_score",
+    "is_score_peak", "is_count_peak", "is_turning",
+]
+WEEK_COLUMNS = CANDIDATE_COLUMNS + ["ewma_count", "ewma_score", "is_candidate"]
+
+
+def _robust_z(x: float, hist: np.ndarray) -> float:
+    """相对 hist 的稳健 z 值；MAD 为 0 时退回平均绝对偏差，仍为 0（历史恒定）则记 0。"""
+    med = float(np.median(hist))
+    dev = np.abs(hist - med)
+    scale = _MAD_SCALE * float(np.median(dev))
+    if scale <= 0:
+        scale = 1.2533 * float(dev.mean())
+    if scale <= 0:
+        return 0.0
+    return (x - med) / scale
+
+
+class OnlineDetector:
+    def __init__(self, lookback: int = DEFAULT_LOOKBACK, alpha: float = DEFAULT_ALPHA, count_min: int = 20):
+        self.params = {"lookback": int(lookback), "alpha": float(alpha), "count_min": int(count_min),
+                       "min_history": MIN_HISTORY, "peak_z": PEAK_Z, "turn_z": TURN_Z}
+        self.last_window: str | None = None
+        # 最近 lookback 个有效周的 [count, score, d_score]
+        self.history: List[List[float]] = []
+        self.ewma_count: float | None = None
+        self.ewma_score: float | None = None
+
+    def to_state(self) -> Dict:
+        return {
+            "version": STATE_VERSION,
+            "params": self.params,
+            "last_window": self.last_window,
+            "history": self.history,
+            "ewma_count": self.ewma_count,
+            "ewma_score": self.ewma_score,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict, lookback: int, alpha: float, count_min: int) -> "OnlineDetector":
+        """从持久化状态恢复；版本或参数不一致时返回全新的检测器。"""
+        det = cls(lookback, alpha, count_min)
+        if state.get("version") != STATE_VERSION or state.get("params") != det.params:
+            return det
+        det.last_window = state.get("last_window")
+        det.history = [list(map(float, h)) for h in state.get("history") or []]
+        det.ewma_count = state.get("ewma_count")
+        det.ewma_score = state.get("ewma_score")
+        return det
+
+    def step(self, row: Dict) -> Dict | None:
+        """处理一个新周，返回带检测结果的记录；评论数不足 count_min 的周只推进进度、返回 None。"""
+        self.last_window = str(row["window"])
+        count, score = float(row["count"]), float(row["score"])
+        if count < self.params["count_min"]:
+            return None
+        alpha = self.params["alpha"]
+        d_count = 0.0 if self.ewma_count is None else count - self.ewma_count
+        d_score = 0.0 if self.ewma_score is None else score - self.ewma_score
+        z_count = z_score = z_turn = 0.0
+        if len(self.history) >= self.params["min_history"]:
+            hist = np.asarray(self.history, dtype=float)
+            z_count = _robust_z(count, hist[:, 0])
+            z_score = _robust_z(score, hist[:, 1])
+            z_turn = _robust_z(d_score, hist[:, 2])
+        out = {k: row.get(k) for k in CANDIDATE_COLUMNS}
+        out.update({
+            "z_count": z_count,
+            "z_score": z_score,
+            "d_count": d_count,
+            "d_score": d_score,
+            "is_score_peak": abs(z_score) >= self.params["peak_z"],
+            "is_count_peak": z_count >= self.params["peak_z"],
+            "is_turning": abs(z_turn) >= self.params["turn_z"],
+        })
+        out["is_candidate"] = out["is_score_peak"] or out["is_count_peak"] or out["is_turning"]
+        # 更新状态：EWMA 基线与滚动窗口都只用截至本周的数据
+        self.ewma_count = count if self.ewma_count is None else alpha * count + (1 - alpha) * self.ewma_count
+        self.ewma_score = score if self.ewma_score is None else alpha * score + (1 - alpha) * self.ewma_score
+        out["ewma_count"] = self.ewma_count
+        out["ewma_score"] = self.ewma_score
+        self.history.append([count, score, d_score])
+        del self.history[:-self.params["lookback"]]
+        return out
+
+
+def settled_weeks(weekly: pd.DataFrame, today: date) -> pd.DataFrame:
+    """最后一周若尚未结束（周末日期 >= today）视为仍在累积，暂不处理。"""
+    if weekly.empty:
+        return weekly
+    last_end = str(weekly["window"].iloc[-1]).split("/")[-1]
+    try:
+        done = pd.Timestamp(last_end).date() < today
+    except ValueError:
+        done = True
+    return weekly if done else weekly.iloc[:-1]
+
+
+def load_state(path: str) -> Dict:
+    """读取检测器的 JSON 状态；文件不存在或损坏时返回空字典（由调用方从头重算）。"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_state(path: str, state: Dict) -> None:
+    """原子写出 JSON 状态（先写临时文件再替换），中途失败不会留下半份状态。"""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _append(df: pd.DataFrame, path: str, columns: List[str], fresh: bool) -> None:
+    if fresh or not os.path.exists(path):
+        df.reindex(columns=columns).to_csv(path, index=False)
+    elif not df.empty:
+        df.reindex(columns=columns).to_csv(path, mode="a", header=False, index=False)
+
+
+def update_candidate_weeks(
+    weekly_csv: str,
+    output_dir: str,
+    count_min: int = 20,
+    lookback: int = DEFAULT_LOOKBACK,
+    alpha: float = DEFAULT_ALPHA,
+    today: date | None = None,
+) -> str:
+    """增量检测：只处理周时序表中晚于上次进度的已结束周，检测结果追加到 online_weeks.csv（全部有效周），
+    再由其整体重写 candidate_weeks_online.csv（候选周，列与批量检测一致）。"""
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_NAME)
+    weeks_csv = os.path.join(output_dir, WEEKS_NAME)
+    out = os.path.join(output_dir, CANDIDATE_NAME)
+
+    state = load_state(state_path)
+    det = OnlineDetector.from_state(state, lookback, alpha, count_min)
+    # 状态无效（首次运行或参数变化）时从头重算并重写输出
+    fresh = det.last_window is None
+
+    weekly = pd.read_csv(weekly_csv) if os.path.exists(weekly_csv) else pd.DataFrame(columns=["window"])
+    if not weekly.empty:
+        weekly = weekly.sort_values("window").reset_index(drop=True)
+        weekly = settled_weeks(weekly, today or date.today())
+        if det.last_window is not None:
+            weekly = weekly[weekly["window"].astype(str) > det.last_window]
+
+    rows = [r for r in (det.step(rec) for rec in weekly.to_dict("records")) if r is not None]
+    new = pd.DataFrame(rows, columns=WEEK_COLUMNS)
+    _append(new, weeks_csv, WEEK_COLUMNS, fresh)
+    # 候选表每次由完整的 online_weeks.csv 重建（每年约 50 行），不依赖其自身的历史内容
+    weeks = pd.read_csv(weeks_csv)
+    weeks[weeks["is_candidate"].astype(bool)].reindex(columns=CANDIDATE_COLUMNS).to_csv(out, index=False)
+    if det.last_window is not None:
+        save_state(state_path, det.to_state())
+    return out
+
+
+def main() -> None:
+    weekly_csv = os.environ.get(
+        "DZ_WEEKLY_TS",
+        os.path.join("analysis", "sentiment_timeseries_weekly.csv"),
+    )
+    output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
+    path = update_candidate_weeks(
+        weekly_csv,
+        output_dir,
+        count_min=20,
+        lookback=int(os.environ.get("DZ_DETECT_LOOKBACK", DEFAULT_LOOKBACK)),
+        alpha=float(os.environ.get("DZ_DETECT_ALPHA", DEFAULT_ALPHA)),
+    )
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
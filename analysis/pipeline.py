@@ -0,0 +1,340 @@
+import ast
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Set
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# 分析流水线的 DAG 调度：每个阶段声明输入/输出路径与参数，依赖关系由“某阶段的输入是另一阶段的输出”推出。
+# 阶段签名 = 参数 + 输入内容哈希 + 阶段函数所在模块及其传递导入的全部项目内模块的源码哈希
+# + 这些模块涉及的环境变量与运行时版本（打分器 / 分词器，含词典摘要）；签名与上次成功运行一致且输出都在时跳过。
+# 文件内容哈希按 (size, mtime_ns) 记忆，未变化的文件不重读；目录（原始数据、Parquet 数据集）
+# 与合并清单一样只按其中各文件的 (相对路径, size, mtime_ns) 指纹汇总，不读内容。
+# 互不依赖的分支（情感 / 主题 / 关键周链路）用进程池并行执行；池内阶段自身的进程池
+# （解析 / 打分 / 分词）按 CPU 份额限流，避免进程数相乘。
+STATE_NAME = "pipeline_state.json"
+STATE_VERSION = 3
+DEFAULT_WORKERS = 3
+# 阶段内部进程池的进程数环境变量（preprocess / sentiment_engine / src.tokenizer）
+INNER_WORKER_ENV = ("DZ_PREPROCESS_WORKERS", "DZ_SENT_WORKERS", "DZ_TOKEN_WORKERS")
+_CHUNK = 1 << 20
+# 依赖闭包中含这些模块时，把对应环境变量的取值与运行时版本并入签名
+RUNTIME_DEPS = {
+    "analysis/sentiment_baseline.py": ("DZ_SENT_LEXICON",),
+    "src/tokenizer.py": ("DZ_USER_DICT",),
+    "analysis/visualize.py": ("DZ_FONT",),
+    "src/wordclouder.py": ("DZ_FONT",),
+}
+# 依赖闭包中含这些模块时，再并入打分器 / 分词器的运行时版本（见 _runtime_versions）
+VERSIONED = ("analysis/sentiment_baseline.py", "src/tokenizer.py")
+_imports: Dict[str, tuple] = {}
+
+
+class Stage:
+    """一个流水线阶段：func(**kwargs) 读 inputs、写 outputs（文件或目录路径）。
+
+    func 需为模块级函数（可被子进程 pickle）；kwargs 中的值参与签名，应为可 JSON 序列化的简单值。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        inputs: Iterable[str] = (),
+        outputs: Iterable[str] = (),
+        **kwargs: Any,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = [os.path.abspath(p) for p in inputs]
+        self.outputs = [os.path.abspath(p) for p in outputs]
+        self.kwargs = kwargs
+
+
+def _under(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def dependencies(stages: List[Stage]) -> Dict[str, List[str]]:
+    """{阶段名: 上游阶段名列表}；输入等于某阶段的输出或位于其输出目录之下即依赖该阶段。"""
+    producers: Dict[str, str] = {}
+    for s in stages:
+        for out in s.outputs:
+            if out in producers:
+                raise ValueError(f"output {out} produced by both {producers[out]} and {s.name}")
+            producers[out] = s.name
+    deps: Dict[str, List[str]] = {}
+    for s in stages:
+        ups = {name for inp in s.inputs for out, name in producers.items() if _under(inp, out) or _under(out, inp)}
+        ups.discard(s.name)
+        deps[s.name] = sorted(ups)
+    # 拓扑检查：有环时报错
+    seen: Dict[str, int] = {}
+
+    def visit(n: str) -> None:
+        if seen.get(n) == 1:
+            raise ValueError(f"dependency cycle at stage {n}")
+        if seen.get(n) == 2:
+            return
+        seen[n] = 1
+        for d in deps[n]:
+            visit(d)
+        seen[n] = 2
+
+    for s in stages:
+        visit(s.name)
+    return deps
+
+
+def _file_hash(path: str, memo: Dict[str, list]) -> str:
+    st = os.stat(path)
+    key = [st.st_size, st.st_mtime_ns]
+    hit = memo.get(path)
+    if hit and hit[:2] == key:
+        return hit[2]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_CHUNK), b""):
+            h.update(block)
+    memo[path] = [*key, h.hexdigest()]
+    return memo[path][2]
+
+
+def content_hash(path: str, memo: Dict[str, list]) -> str:
+    """文件的内容哈希或目录的 size/mtime 指纹；不存在的路径记为 "missing"。"""
+    if os.path.isfile(path):
+        return _file_hash(path, memo)
+    if not os.path.isdir(path):
+        return "missing"
+    h = hashlib.blake2b(digest_size=16)
+    for base, dirs, files in os.walk(path):
+        dirs.sort()
+        for fn in sorted(files):
+            fp = os.path.join(base, fn)
+            st = os.stat(fp)
+            h.update(f"{os.path.relpath(fp, path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _resolve(name: str, bases: List[Path]) -> List[str]:
+    parts = [p for p in name.split(".") if p]
+    if not parts:
+        return []
+    for base in bases:
+        for cand in (base.joinpath(*parts).with_suffix(".py"), base.joinpath(*parts, "__init__.py")):
+            if cand.is_file() and ROOT in cand.resolve().parents:
+                return [str(cand.resolve())]
+    return []
+
+
+def _local_imports(path: str) -> List[str]:
+    """path 中（含函数体内延迟导入）引用的项目内模块文件；按 mtime 记忆解析结果。"""
+    mtime = os.stat(path).st_mtime_ns
+    hit = _imports.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+    here = Path(path).parent
+    found: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for a in node.names:
+                # 同目录导入（from comments_io import ...）或以项目根为起点（src.x / analysis.x）
+                found.update(_resolve(a.name, [here, ROOT]))
+        elif isinstance(node, ast.ImportFrom):
+            bases = [here.parents[node.level - 2] if node.level > 1 else here] if node.level else [here, ROOT]
+            mod = node.module or ""
+            found.update(_resolve(mod, bases))
+            for a in node.names:
+                # from src import storage 这类导入的是子模块
+                found.update(_resolve(f"{mod}.{a.name}" if mod else a.name, bases))
+    deps = sorted(found - {str(Path(path).resolve())})
+    _imports[path] = (mtime, deps)
+    return deps
+
+
+def module_closure(path: str) -> List[str]:
+    """path 及其传递导入的全部项目内模块文件（已排序）。"""
+    seen: Set[str] = set()
+    todo = [str(Path(path).resolve())]
+    while todo:
+        p = todo.pop()
+        if p in seen:
+            continue
+        seen.add(p)
+        todo.extend(_local_imports(p))
+    return sorted(seen)
+
+
+def _runtime_versions() -> Dict[str, Any]:
+    # 打分器 / 分词器版本（含外部词典与用户词典的内容摘要），阶段依赖其模块时并入签名
+    from sentiment_cache import scorer_id
+    from src.tokenizer import tokenizer_version  # type: ignore
+
+    return {"analysis/sentiment_baseline.py": list(scorer_id()), "src/tokenizer.py": tokenizer_version()}
+
+
+def _code_payload(func: Callable, memo: Dict[str, list], runtime: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        files = module_closure(inspect.getsourcefile(func) or "")
+    except (TypeError, OSError, SyntaxError):
+        return {"code": "", "env": {}, "versions": {}}
+    rel = [Path(f).relative_to(ROOT).as_posix() for f in files]
+    h = hashlib.blake2b(digest_size=16)
+    for r, f in zip(rel, files):
+        h.update(f"{r}\0{_file_hash(f, memo)}\n".encode("utf-8"))
+    env = {name: os.environ.get(name) for r in rel for name in RUNTIME_DEPS.get(r, ())}
+    versions: Dict[str, Any] = {}
+    if any(r in VERSIONED for r in rel):
+        if "versions" not in runtime:
+            runtime["versions"] = _runtime_versions()
+        versions = {r: v for r, v in runtime["versions"].items() if r in rel}
+    return {"code": h.hexdigest(), "env": env, "versions": versions}
+
+
+def signature(stage: Stage, memo: Dict[str, list], runtime: Dict[str, Any] | None = None) -> str:
+    """runtime 为本次运行内共享的运行时版本缓存（省略时每次重新计算）。"""
+    payload = {
+        "func": f"{stage.func.__module__}.{stage.func.__qualname__}",
+        **_code_payload(stage.func, memo, {} if runtime is None else runtime),
+        "kwargs": stage.kwargs,
+        "inputs": {p: content_hash(p, memo) for p in stage.inputs},
+        "outputs": stage.outputs,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _load_state(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception:
+        return {}
+    return state if state.get("version") == STATE_VERSION else {}
+
+
+def _save_state(path: str, state: Dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _init_worker(inner: int) -> None:
+    # 用户显式设置的进程数优先
+    for name in INNER_WORKER_ENV:
+        os.environ.setdefault(name, str(inner))
+
+
+def _call(func: Callable, kwargs: Dict[str, Any]) -> float:
+    t0 = time.perf_counter()
+    func(**kwargs)
+    return time.perf_counter() - t0
+
+
+def run_pipeline(
+    stages: List[Stage],
+    state_path: str,
+    workers: int = DEFAULT_WORKERS,
+    force: Iterable[str] | bool = False,
+) -> Dict[str, str]:
+    """按依赖顺序执行各阶段，返回 {阶段名: ran/skipped/failed/blocked}。
+
+    签名未变且输出齐全的阶段跳过；force=True 全部重跑，或传入阶段名列表只强制这些阶段。
+    workers <= 1 时在当前进程顺序执行；否则阶段在进程池中并行，各阶段内部的进程池上限为
+    CPU 核数 / workers。任一阶段失败时其下游标为 blocked，其余分支照常完成。
+    """
+    deps = dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    forced = set(by_name) if force is True else set(force or ())
+    state = _load_state(state_path)
+    memo: Dict[str, list] = state.get("files") or {}
+    done_sigs: Dict[str, str] = state.get("stages") or {}
+    runtime: Dict[str, Any] = {}
+    status: Dict[str, str] = {}
+
+    def persist() -> None:
+        live = {p: v for p, v in memo.items() if os.path.exists(p)}
+        _save_state(state_path, {"version": STATE_VERSION, "stages": done_sigs, "files": live})
+
+    def ready() -> List[Stage]:
+        return [by_name[n] for n in deps if n not in status and n not in running_names and all(d in status for d in deps[n])]
+
+    def finish(name: str, sig: str, result: str, elapsed: float | None = None) -> None:
+        status[name] = result
+        if result == "ran":
+            done_sigs[name] = sig
+            persist()
+        elif result == "failed":
+            done_sigs.pop(name, None)
+            persist()
+        suffix = f" ({elapsed:.1f}s)" if elapsed is not None else ""
+        print(f"[{result}] {name}{suffix}")
+
+    running_names: set = set()
+    ex = None
+    if workers > 1:
+        inner = max(1, (os.cpu_count() or 1) // workers)
+        ex = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(inner,))
+    futures: Dict[Any, tuple] = {}
+    try:
+        while len(status) < len(stages):
+            # 先处理所有可以立即确定的阶段（跳过 / 上游失败），再提交需要运行的
+            progressed = True
+            while progressed:
+                progressed = False
+                for s in ready():
+                    if any(status[d] in ("failed", "blocked") for d in deps[s.name]):
+                        finish(s.name, "", "blocked")
+                        progressed = True
+                        continue
+                    sig = signature(s, memo, runtime)
+                    outputs_ok = all(os.path.exists(p) for p in s.outputs)
+                    if s.name not in forced and done_sigs.get(s.name) == sig and outputs_ok:
+                        finish(s.name, sig, "skipped")
+                        progressed = True
+                        continue
+                    if ex is None:
+                        try:
+                            elapsed = _call(s.func, s.kwargs)
+                        except Exception as e:
+                            print(f"{s.name}: {e!r}")
+                            finish(s.name, sig, "failed")
+                        else:
+                            # 输出已更新，重新哈希时以新内容为准
+                            finish(s.name, signature(s, memo, runtime), "ran", elapsed)
+                        progressed = True
+                    else:
+                        futures[ex.submit(_call, s.func, s.kwargs)] = (s, sig)
+                        running_names.add(s.name)
+            if not futures:
+                continue
+            finished, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                s, sig = futures.pop(fut)
+                running_names.discard(s.name)
+                try:
+                    elapsed = fut.result()
+                except Exception as e:
+                    print(f"{s.name}: {e!r}")
+                    finish(s.name, sig, "failed")
+                else:
+                    finish(s.name, signature(s, memo, runtime), "ran", elapsed)
+    finally:
+        if ex is not None:
+            ex.shutdown()
+    return status
@@ -1,8 +1,29 @@
 import os
-import json
+import sys
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.dedup_index import DedupIndex  # type: ignore
+from src.storage import get_connection, import_comments_json, iter_json_items  # type: ignore
+from comments_io import write_comments_parquet, write_comments_parquet_stream, write_videos_parquet
+from sentiment_cache import score_messages
+from topics_baseline import tokenize_series
+
+PAT_JSON = re.compile(r"^comments_(.+)_(\d{4})(\d{2})\.json$")
+# root_rpid 为所属根评论的 rpid（根评论即自身），depth 0 为根评论、1 为楼中楼回复
+CLEANED_COLUMNS = ["bvid", "rpid", "parent", "floor", "like", "ctime", "uname", "mid", "message", "keyword", "root_rpid", "depth"]
+INT_COLUMNS = ["rpid", "parent", "floor", "like", "ctime", "mid", "root_rpid", "depth"]
+# 每凑满这么多条（去重后）评论写出一块，峰值内存与语料总量无关
+DEFAULT_CHUNK = 50000
 
 _url_re = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
 _ws_re = re.compile(r"\s+")
@@ -17,58 +38,234 @@ def _clean_text(s: str) -> str:
     return s
 
 
-def _extract_rows(payload: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
+def _extract_rows(payload: List[Dict[str, Any]], keyword: str = "", roots_only: bool = False) -> List[tuple]:
+    """展开为按 CLEANED_COLUMNS 排列的元组行；层级规则同 src.storage.flatten_comments
+    （子回复的 root 缺失时取所属根评论 rpid）。直接产出元组，不构造中间字典。"""
+    out: List[tuple] = []
     for it in payload or []:
-        v = it.get("video") or {}
-        cm = it.get("comments") or {}
+        v = (it or {}).get("video") or {}
+        cm = (it or {}).get("comments") or {}
         bvid = v.get("bvid") or cm.get("bvid")
-        replies = (cm.get("replies") or [])
-        for c in replies:
-            out.append({
-                "bvid": bvid,
-                "rpid": c.get("rpid"),
-                "parent": c.get("parent"),
-                "floor": c.get("floor"),
-                "like": c.get("like"),
-                "ctime": c.get("ctime"),
-                "uname": c.get("uname"),
-                "mid": c.get("mid"),
-                "message": _clean_text(c.get("message")),
-            })
+        for c in cm.get("replies") or []:
+            rpid = c.get("rpid")
+            if rpid is None:
+                continue
+            out.append((
+                bvid, rpid, c.get("parent"), c.get("floor"), c.get("like"), c.get("ctime"),
+                c.get("uname"), c.get("mid"), _clean_text(c.get("message")), keyword, rpid, 0,
+            ))
+            if roots_only:
+                continue
+            for cc in c.get("replies") or []:
+                if cc.get("rpid") is None:
+                    continue
+                out.append((
+                    bvid, cc.get("rpid"), cc.get("parent"), cc.get("floor"), cc.get("like"), cc.get("ctime"),
+                    cc.get("uname"), cc.get("mid"), _clean_text(cc.get("message")), keyword, cc.get("root") or rpid, 1,
+                ))
     return out
 
 
-def load_and_clean(input_dir: str, output_dir: str) -> str:
+def _frame(rows: List[tuple]) -> pd.DataFrame:
+    # 整数列统一为可空整型，分块写出时各块的 CSV 格式一致
+    df = pd.DataFrame.from_records(rows, columns=CLEANED_COLUMNS)
+    for c in INT_COLUMNS:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+    return df
+
+
+def parse_json_file(path: str, roots_only: bool = False) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """流式解析一个 comments_*.json：逐个数组元素展开根评论与子回复，返回 (评论表, 视频元数据)。
+
+    文件损坏时整个文件跳过（返回空表）。
+    """
+    m = PAT_JSON.match(os.path.basename(path))
+    keyword = m.group(1) if m else ""
+    ym = f"{m.group(2)}-{m.group(3)}" if m else None
+    rows: List[tuple] = []
+    videos: List[Dict[str, Any]] = []
+    try:
+        for it in iter_json_items(path):
+            rows.extend(_extract_rows([it], keyword=keyword, roots_only=roots_only))
+            v = (it or {}).get("video") or {}
+            if ym and v.get("bvid"):
+                videos.append({**v, "keyword": keyword, "ym": ym})
+    except Exception:
+        return _frame([]), []
+    return _frame(rows), videos
+
+
+def _parse_files(paths: List[str], roots_only: bool, workers: int) -> Iterator[Tuple[pd.DataFrame, List[Dict[str, Any]]]]:
+    """按文件顺序产出解析结果；多进程时最多 2×workers 个文件在途，避免结果堆积。"""
+    if workers <= 1 or len(paths) < 2:
+        for p in paths:
+            yield parse_json_file(p, roots_only)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        it = iter(paths)
+        pending = deque(ex.submit(parse_json_file, p, roots_only) for _, p in zip(range(2 * workers), it))
+        while pending:
+            fut = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append(ex.submit(parse_json_file, nxt, roots_only))
+            yield fut.result()
+
+
+def _dedup(df: pd.DataFrame, index: DedupIndex) -> pd.DataFrame:
+    # 跨文件按 (keyword, rpid) 去重：同一关键词下保留最先出现的一条，同一评论被多个关键词
+    # 采到时在各关键词下各留一条（整体统计由 read_comments 再按 rpid 去重）。
+    # 已见键登记在磁盘可溢出的临时索引中，每块只查询/登记本块的键，内存不随已处理文件数增长
+    df = df[df["rpid"].notna()]
+    keys = pd.util.hash_pandas_object(df[["keyword", "rpid"]], index=False).to_numpy()
+    return df[index.filter_new(keys)]
+
+
+def json_files(input_dir: str) -> List[str]:
+    return sorted(
+        os.path.join(input_dir, fn) for fn in os.listdir(input_dir)
+        if fn.startswith("comments_") and fn.lower().endswith(".json")
+    )
+
+
+def clean_json_files(paths: List[str], roots_only: bool = False) -> pd.DataFrame:
+    """只清洗给定的 comments_*.json（增量聚合用），按 (keyword, rpid) 去重，列同 CLEANED_COLUMNS。"""
+    index = DedupIndex()
+    try:
+        parts = [_dedup(parse_json_file(p, roots_only)[0], index) for p in paths]
+    finally:
+        index.close()
+    return pd.concat(parts, ignore_index=True) if parts else _frame([])
+
+
+def _workers() -> int:
+    return int(os.environ.get("DZ_PREPROCESS_WORKERS", os.cpu_count() or 1))
+
+
+def load_and_clean(
+    input_dir: str,
+    output_dir: str,
+    parquet_dir: str | None = None,
+    with_sentiment: bool = False,
+    with_tokens: bool = False,
+    roots_only: bool = False,
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK,
+) -> str:
+    """清洗 comments_*.json 为逐条评论 CSV；parquet_dir 非空时同时写出分区 Parquet 数据集
+    （parquet_dir/comments 与 parquet_dir/videos，按 keyword/年月分区）。
+
+    各文件在进程池中流式解析（workers，默认 DZ_PREPROCESS_WORKERS 或 CPU 核数），根评论与
+    子回复一并展开（roots_only 为真时只保留根评论），按 (keyword, rpid) 经临时 SQLite 去重索引（DedupIndex）去重；
+    每凑满 chunk_size 条即追加写出一块，峰值内存约为“在途文件 + 一块”的数据量。
+    with_sentiment 为真时附带 sent_raw 列（经共享情感分缓存），下游阶段直接复用；
+    with_tokens 为真时附带 tokens 列（空格连接的分词结果，经共享分词缓存），话题/词云阶段不再重复分词。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    out_csv = os.path.join(output_dir, "comments_cleaned.csv")
+    columns = CLEANED_COLUMNS + (["sent_raw"] if with_sentiment else []) + (["tokens"] if with_tokens else [])
+    videos: List[Dict[str, Any]] = []
+    index = DedupIndex()
+    written = [0]
+
+    def flush(parts: List[pd.DataFrame]) -> pd.DataFrame:
+        df = pd.concat(parts, ignore_index=True)
+        if with_sentiment:
+            df["sent_raw"] = score_messages(df["message"])
+        if with_tokens:
+            df["tokens"] = tokenize_series(df["message"]).str.join(" ")
+        df[columns].to_csv(out_csv, mode="a" if written[0] else "w", header=not written[0], index=False)
+        written[0] += len(df)
+        return df
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        buf: List[pd.DataFrame] = []
+        n = 0
+        for df, vids in _parse_files(json_files(input_dir), roots_only, workers or _workers()):
+            videos.extend(vids)
+            df = _dedup(df, index)
+            if df.empty:
+                continue
+            buf.append(df)
+            n += len(df)
+            if n >= chunk_size:
+                yield flush(buf)
+                buf, n = [], 0
+        if buf:
+            yield flush(buf)
+
+    try:
+        if parquet_dir:
+            write_comments_parquet_stream(chunks(), os.path.join(parquet_dir, "comments"))
+        else:
+            for _ in chunks():
+                pass
+    finally:
+        index.close()
+    if not written[0]:
+        pd.DataFrame([], columns=columns).to_csv(out_csv, index=False)
+    if parquet_dir and videos:
+        vdf = pd.DataFrame(videos).drop_duplicates(subset=["bvid", "keyword", "ym"], keep="first")
+        write_videos_parquet(vdf, os.path.join(parquet_dir, "videos"))
+    return out_csv
+
+
+def load_and_clean_db(
+    db_path: str,
+    output_dir: str,
+    import_dir: str | None = None,
+    parquet_dir: str | None = None,
+    with_sentiment: bool = False,
+    with_tokens: bool = False,
+    roots_only: bool = False,
+) -> str:
+    """从采集时写入的 SQLite 评论表读取评论（含子回复，roots_only 为真时只取根评论）。
+
+    评论按所属视频的每个关键词各出一行，与 JSON 清洗的 (keyword, rpid) 去重口径一致；rpid 主键保证关键词内不重复。
+
+    import_dir 非空时先把该目录下的历史 comments_*.json 幂等导入评论表。
+    """
     os.makedirs(output_dir, exist_ok=True)
-    rows: List[Dict[str, Any]] = []
-    for fn in os.listdir(input_dir):
-        if not fn.lower().endswith(".json"):
-            continue
-        if not fn.startswith("comments_"):
-            continue
-        path = os.path.join(input_dir, fn)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                payload = json.load(f)
-            rows.extend(_extract_rows(payload))
-        except Exception:
-            continue
-    if not rows:
-        out_csv = os.path.join(output_dir, "comments_cleaned.csv")
-        pd.DataFrame([], columns=["bvid","rpid","parent","floor","like","ctime","uname","mid","message"]).to_csv(out_csv, index=False)
-        return out_csv
-    df = pd.DataFrame(rows)
-    df = df.drop_duplicates(subset=["rpid"], keep="first")
+    if import_dir:
+        import_comments_json(import_dir, db_path)
+    df = pd.read_sql_query(
+        'SELECT c.bvid, c.rpid, c.parent, c.floor, c."like", c.ctime, c.uname, c.mid, c.message, '
+        "k.keyword, CASE WHEN c.depth = 0 THEN c.rpid ELSE c.root END AS root_rpid, c.depth "
+        "FROM comments c LEFT JOIN (SELECT DISTINCT bvid, keyword FROM videos WHERE keyword != '') k ON k.bvid = c.bvid "
+        f"{'WHERE c.depth = 0 ' if roots_only else ''}ORDER BY c.ctime, c.rpid, k.keyword",
+        get_connection(db_path),
+    )
+    df["message"] = df["message"].map(_clean_text)
+    df["keyword"] = df["keyword"].fillna("")
+    if with_sentiment:
+        df["sent_raw"] = score_messages(df["message"])
+    if with_tokens:
+        df["tokens"] = tokenize_series(df["message"]).str.join(" ")
     out_csv = os.path.join(output_dir, "comments_cleaned.csv")
     df.to_csv(out_csv, index=False)
+    if parquet_dir:
+        write_comments_parquet(df, os.path.join(parquet_dir, "comments"))
     return out_csv
 
 
 def main():
     input_dir = os.environ.get("DZ_INPUT_DIR", "data")
     output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis", "cleaned"))
-    path = load_and_clean(input_dir, output_dir)
+    db_path = os.environ.get("DZ_COMMENTS_DB")
+    parquet_dir = os.environ.get("DZ_PARQUET_DIR")
+    with_sentiment = os.environ.get("DZ_WITH_SENTIMENT", "0") == "1"
+    with_tokens = os.environ.get("DZ_WITH_TOKENS", "0") == "1"
+    roots_only = os.environ.get("DZ_ROOTS_ONLY", "0") == "1"
+    if db_path:
+        path = load_and_clean_db(
+            db_path, output_dir, import_dir=os.environ.get("DZ_INPUT_DIR"),
+            parquet_dir=parquet_dir, with_sentiment=with_sentiment, with_tokens=with_tokens, roots_only=roots_only,
+        )
+    else:
+        path = load_and_clean(
+            input_dir, output_dir, parquet_dir=parquet_dir, with_sentiment=with_sentiment, with_tokens=with_tokens,
+            roots_only=roots_only,
+        )
     print(path)
 
 
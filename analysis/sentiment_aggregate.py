@@ -0,0 +1,234 @@
+import os
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+from comments_io import read_comments, window_labels
+from near_duplicates import apply_near_dup
+from sentiment_cache import ensure_sent_raw
+
+# 统一的情感聚合引擎：评论只读取、打分一次，再按多个时间粒度向量化聚合
+# （np.bincount 求各窗口计数与加权和），一次写出全部粒度的表。
+BASE_COLUMNS = ["window", "count", "pos", "neg", "neu", "score", "pos_ratio", "neg_ratio", "neu_ratio"]
+CHANGE_COLUMNS = ["z_count", "z_score", "d_count", "d_score"]
+# 可加的窗口部分和：wsum = Σw，wssum = Σw·s；细粒度窗口的部分和相加即得粗粒度窗口
+SUM_COLUMNS = ["count", "pos", "neg", "neu", "wsum", "wssum"]
+# 粒度（pandas Period 频率）→ 输出文件名；其他频率（如 Q、W-SAT）写 sentiment_timeseries_<freq>.csv
+OUTPUT_NAMES = {
+    "D": "sentiment_timeseries_daily.csv",
+    "W": "sentiment_timeseries_weekly.csv",
+    "M": "sentiment_timeseries.csv",
+}
+LABEL_THRESHOLD = 0.2
+# 面板模式：按 (关键词, 窗口) 聚合全部关键词，一张长表
+PANEL_KEY = "keyword"
+
+
+def output_name(freq: str) -> str:
+    return OUTPUT_NAMES.get(freq, f"sentiment_timeseries_{freq}.csv")
+
+
+def panel_output_name(freq: str) -> str:
+    return output_name(freq).replace(".csv", "_panel.csv")
+
+
+def _columns(freq: str) -> list:
+    # 月度表沿用原有列；其余粒度附带 z-score/差分列，供异常窗口识别使用
+    return BASE_COLUMNS if freq == "M" else BASE_COLUMNS + CHANGE_COLUMNS
+
+
+def add_change_columns(agg: pd.DataFrame, by: str | None = None) -> pd.DataFrame:
+    """z-score 与一阶差分，用于后续识别“异常周”；by 非空时在每个序列内分别计算（agg 需按 by、window 排序）。"""
+    if by is not None:
+        g = agg.groupby(by, sort=False, observed=True)
+        single = g["window"].transform("size").to_numpy() < 2
+        for col in ["count", "score"]:
+            z = (agg[col] - g[col].transform("mean")) / g[col].transform("std", ddof=0)
+            # 与单序列一致：只有一个窗口的序列 z/d 记 0
+            agg[f"z_{col}"] = z.mask(single, 0.0)
+            agg[f"d_{col}"] = g[col].diff().fillna(0.0)
+        return agg
+    if len(agg) >= 2:
+        agg["z_count"] = (agg["count"] - agg["count"].mean()) / agg["count"].std(ddof=0)
+        agg["z_score"] = (agg["score"] - agg["score"].mean()) / agg["score"].std(ddof=0)
+        agg["d_count"] = agg["count"].diff().fillna(0.0)
+        agg["d_score"] = agg["score"].diff().fillna(0.0)
+    else:
+        agg["z_count"] = 0.0
+        agg["z_score"] = 0.0
+        agg["d_count"] = 0.0
+        agg["d_score"] = 0.0
+    return agg
+
+
+def window_sums(
+    window: pd.Series,
+    sent: np.ndarray,
+    like_w: np.ndarray,
+    dup_w: np.ndarray,
+    by: pd.Series | None = None,
+) -> pd.DataFrame:
+    """按 window（by 非空时按 (by, window)）求部分和 SUM_COLUMNS，结果按键排序。"""
+    keys = window if by is None else pd.MultiIndex.from_arrays([by, window])
+    codes, uniques = pd.factorize(keys, sort=True)
+    k = len(uniques)
+    label = np.where(sent > LABEL_THRESHOLD, 1, np.where(sent < -LABEL_THRESHOLD, -1, 0))
+    w = like_w * dup_w
+    count = np.bincount(codes, weights=dup_w, minlength=k)
+    wsum = np.bincount(codes, weights=w, minlength=k)
+    head = {"window": np.asarray(uniques, dtype=object)} if by is None else {
+        PANEL_KEY: np.asarray(uniques.get_level_values(0), dtype=object),
+        "window": np.asarray(uniques.get_level_values(1), dtype=object),
+    }
+    return pd.DataFrame({
+        **head,
+        "count": count,
+        "pos": np.bincount(codes[label > 0], weights=dup_w[label > 0], minlength=k),
+        "neg": np.bincount(codes[label < 0], weights=dup_w[label < 0], minlength=k),
+        "neu": np.bincount(codes[label == 0], weights=dup_w[label == 0], minlength=k),
+        "wsum": wsum,
+        "wssum": np.bincount(codes, weights=sent * w, minlength=k),
+    })
+
+
+def finalize_sums(sums: pd.DataFrame) -> pd.DataFrame:
+    """由部分和得到输出指标：score = Σw·s / max(Σw, 1)，以及各类比例。"""
+    agg = sums.drop(columns=["wsum", "wssum"])
+    agg["score"] = sums["wssum"].to_numpy() / np.maximum(sums["wsum"].to_numpy(), 1)
+    # 比例指标：更稳定比较不同窗口的情感结构
+    count = agg["count"].to_numpy()
+    safe = np.where(count > 0, count, np.nan)
+    for col in ["pos", "neg", "neu"]:
+        agg[f"{col}_ratio"] = np.nan_to_num(agg[col].to_numpy() / safe, nan=0.0)
+    return agg
+
+
+def aggregate_windows(
+    window: pd.Series,
+    sent: np.ndarray,
+    like_w: np.ndarray,
+    dup_w: np.ndarray,
+    by: pd.Series | None = None,
+) -> pd.DataFrame:
+    """按 window 聚合：计数按 dup_w 加权，score = sum(w·s) / max(sum(w), 1)，w = like_w·dup_w。
+
+    by 非空时按 (by, window) 组合键一次聚合所有序列，结果首列为 keyword，按 (keyword, window) 排序。
+    """
+    return finalize_sums(window_sums(window, sent, like_w, dup_w, by=by))
+
+
+def like_weights(like: pd.Series) -> pd.Series:
+    return 1 + like.fillna(0).astype(int).clip(lower=0, upper=100)
+
+
+def aggregate_sentiment(
+    input_csv: str,
+    output_dir: str,
+    freqs: Iterable[str] = ("M",),
+    start=None,
+    end=None,
+    near_dup: str = "off",
+    clusters_csv: str | None = None,
+) -> Dict[str, str]:
+    """一次读取与打分，写出各粒度情感时序表，返回 {freq: 输出路径}。"""
+    os.makedirs(output_dir, exist_ok=True)
+    freqs = list(dict.fromkeys(freqs))
+    outs = {f: os.path.join(output_dir, output_name(f)) for f in freqs}
+    df = pd.DataFrame()
+    if os.path.exists(input_csv):
+        df = read_comments(input_csv, columns=["rpid", "ctime", "message", "like", "sent_raw"], start=start, end=end)
+    if df.empty:
+        for f, out in outs.items():
+            pd.DataFrame([], columns=_columns(f)).to_csv(out, index=False)
+        return outs
+
+    # 情感分查/填共享缓存，每条不同文本只打分一次
+    df = ensure_sent_raw(df)
+    df["like_w"] = like_weights(df["like"])
+    for f, out in outs.items():
+        g = df.assign(window=window_labels(df["ctime"], f))
+        # 近重复降权/折叠以本粒度的窗口为单位
+        g = apply_near_dup(g, clusters_csv, near_dup) if near_dup != "off" else g.assign(dup_w=1.0)
+        agg = aggregate_windows(
+            g["window"],
+            g["sent_raw"].to_numpy(dtype=float),
+            g["like_w"].to_numpy(dtype=float),
+            g["dup_w"].to_numpy(dtype=float),
+        )
+        if f != "M":
+            agg = add_change_columns(agg)
+        agg[_columns(f)].to_csv(out, index=False)
+    return outs
+
+
+def aggregate_panel(
+    input_csv: str,
+    output_dir: str,
+    freq: str = "W",
+    start=None,
+    end=None,
+    keywords: Iterable[str] | None = None,
+    near_dup: str = "off",
+    clusters_csv: str | None = None,
+) -> str:
+    """面板聚合：所有关键词（或 keywords 指定的子集）的 (keyword, 窗口) 长表一次算出，
+    各关键词序列分别附带 z-score/差分列，写出 sentiment_timeseries_<粒度>_panel.csv。
+
+    关键词为空的评论不计入面板。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    out = os.path.join(output_dir, panel_output_name(freq))
+    cols = [PANEL_KEY, *_columns(freq)]
+    df = pd.DataFrame()
+    if os.path.exists(input_csv):
+        df = read_comments(
+            input_csv, columns=["rpid", "ctime", "message", "like", "sent_raw", PANEL_KEY],
+            start=start, end=end, keywords=keywords, per_keyword=True,
+        )
+    if not df.empty and PANEL_KEY in df.columns:
+        df = df[df[PANEL_KEY].astype("string").fillna("") != ""].reset_index(drop=True)
+    if df.empty or PANEL_KEY not in df.columns:
+        pd.DataFrame([], columns=cols).to_csv(out, index=False)
+        return out
+
+    df = ensure_sent_raw(df)
+    df["like_w"] = like_weights(df["like"])
+    df["window"] = window_labels(df["ctime"], freq)
+    # 近重复以 (关键词, 窗口) 为单位，与各关键词单独聚合时一致
+    if near_dup != "off":
+        df = apply_near_dup(df, clusters_csv, near_dup, by=[PANEL_KEY, "window"])
+    else:
+        df["dup_w"] = 1.0
+    agg = aggregate_windows(
+        df["window"],
+        df["sent_raw"].to_numpy(dtype=float),
+        df["like_w"].to_numpy(dtype=float),
+        df["dup_w"].to_numpy(dtype=float),
+        by=df[PANEL_KEY],
+    )
+    if freq != "M":
+        agg = add_change_columns(agg, by=PANEL_KEY)
+    agg[cols].to_csv(out, index=False)
+    return out
+
+
+def main() -> None:
+    input_csv = os.environ.get("DZ_CLEANED_COMMENTS", os.path.join("analysis", "cleaned", "comments_cleaned.csv"))
+    output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
+    freqs = [f.strip() for f in os.environ.get("DZ_SENT_FREQS", "D,W,M").split(",") if f.strip()]
+    paths = aggregate_sentiment(
+        input_csv,
+        output_dir,
+        freqs=freqs,
+        start=os.environ.get("DZ_START"),
+        end=os.environ.get("DZ_END"),
+        near_dup=os.environ.get("DZ_NEAR_DUP_MODE", "off"),
+        clusters_csv=os.environ.get("DZ_NEAR_DUP_CLUSTERS", os.path.join(output_dir, "near_dup_clusters.csv")),
+    )
+    for p in paths.values():
+        print(p)
+
+
+if __name__ == "__main__":
+    main()
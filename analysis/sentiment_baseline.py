@@ -1,6 +1,20 @@
 import os
+import sys
 import math
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
 import pandas as pd
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.keyword_matcher import KeywordMatcher  # type: ignore
+from sentiment_aggregate import aggregate_sentiment
 try:
     from snownlp import SnowNLP
     _HAS_SNOW = True
@@ -14,23 +28,53 @@ _pos_emoji = set(["😀","😁","😂","🤣","😊","😍","👍","❤","😻",
 _neg_emoji = set(["😡","🤬","😞","😢","😭","👎","💔","🙄","😒"]) 
 
 
-def score_text(s: str) -> int:
-    if not isinstance(s, str) or not s:
+def load_lexicon(path: str) -> Dict[str, float]:
+    """读取外部情感词典：每行 “词<Tab或空格>权重”，权重为正表示正面、为负表示负面；
+    省略权重时记 1。支持 # 注释与空行。"""
+    lex: Dict[str, float] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            if len(parts) >= 2:
+                try:
+                    lex[parts[0]] = float(parts[1])
+                    continue
+                except ValueError:
+                    pass
+            lex[parts[0]] = 1.0
+    return lex
+
+
+@lru_cache(maxsize=None)
+def _lexicon(path: str | None) -> tuple[KeywordMatcher, list, list]:
+    """编译词典：返回 (自动机, 各模式正面权重, 各模式负面权重)。
+
+    内置词表每个词/表情权重 ±1；外部词典同名条目覆盖内置权重；所有词编译进同一个自动机。
+    """
+    lex: Dict[str, float] = {w: 1.0 for w in _pos | _pos_emoji}
+    lex.update({w: -1.0 for w in _neg | _neg_emoji})
+    if path:
+        lex.update(load_lexicon(path))
+    words = sorted(lex)
+    pos = [max(lex[w], 0.0) for w in words]
+    neg = [max(-lex[w], 0.0) for w in words]
+    return KeywordMatcher(words, ignore_case=False), pos, neg
+
+
+def _lexicon_path() -> str | None:
+    return os.environ.get("DZ_SENT_LEXICON") or None
+
+
+def _rule_label(s: str, matcher: KeywordMatcher, pos: list, neg: list) -> int:
+    # 命中的每个词只计一次：正面权重和与负面权重和比较
+    hits = matcher.hits(s)
+    if not hits:
         return 0
-    p = 0
-    n = 0
-    for w in _pos:
-        if w in s:
-            p += 1
-    for w in _neg:
-        if w in s:
-            n += 1
-    for e in _pos_emoji:
-        if e in s:
-            p += 1
-    for e in _neg_emoji:
-        if e in s:
-            n += 1
+    p = sum(pos[i] for i in hits)
+    n = sum(neg[i] for i in hits)
     if p > n:
         return 1
     if n > p:
@@ -38,6 +82,23 @@ def score_text(s: str) -> int:
     return 0
 
 
+def score_text(s: str) -> int:
+    if not isinstance(s, str) or not s:
+        return 0
+    return _rule_label(s, *_lexicon(_lexicon_path()))
+
+
+def score_series(s: pd.Series) -> pd.Series:
+    """score_text 的向量化版本：整列共用一个自动机，相同文本只扫描一次。"""
+    lexicon = _lexicon(_lexicon_path())
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    labels = np.array(
+        [_rule_label(t, *lexicon) if isinstance(t, str) else 0 for t in np.asarray(uniques, dtype=object)] + [0],
+        dtype=int,
+    )
+    return pd.Series(labels[codes], index=s.index)
+
+
 def _score_text_continuous(s: str) -> float:
     if not isinstance(s, str) or not s:
         return 0.0
@@ -54,47 +115,33 @@ def _score_text_continuous(s: str) -> float:
     return float(score_text(s))
 
 
-def run(input_csv: str, output_dir: str) -> str:
-    os.makedirs(output_dir, exist_ok=True)
-    if not os.path.exists(input_csv):
-        out = os.path.join(output_dir, "sentiment_timeseries.csv")
-        pd.DataFrame([], columns=["window","count","pos","neg","neu","score","pos_ratio","neg_ratio","neu_ratio"]).to_csv(out, index=False)
-        return out
-    df = pd.read_csv(input_csv)
-    if df.empty:
-        out = os.path.join(output_dir, "sentiment_timeseries.csv")
-        pd.DataFrame([], columns=["window","count","pos","neg","neu","score","pos_ratio","neg_ratio","neu_ratio"]).to_csv(out, index=False)
-        return out
-    df["window"] = pd.to_datetime(df["ctime"], unit="s", errors="coerce").dt.to_period("M").astype(str)
-    df["sent_raw"] = df["message"].fillna("").astype(str).apply(_score_text_continuous)
-    df["sent_label"] = df["sent_raw"].apply(lambda v: 1 if v > 0.2 else (-1 if v < -0.2 else 0))
-    df["w"] = 1 + df["like"].fillna(0).astype(int).clip(lower=0, upper=100)
-
-    # 仅对真正需要的列做聚合，避免 pandas FutureWarning
-    gdf = df[["window", "sent_raw", "sent_label", "w"]].groupby("window", sort=True)
-    agg = gdf.apply(lambda g: pd.Series({
-        "count": int(len(g)),
-        "pos": int((g["sent_label"] > 0).sum()),
-        "neg": int((g["sent_label"] < 0).sum()),
-        "neu": int((g["sent_label"] == 0).sum()),
-        "score": float((g["sent_raw"] * g["w"]).sum() / max(g["w"].sum(), 1)),
-    })).reset_index()
-
-    # 比例指标：更稳定比较不同月份情感结构
-    agg["count_safe"] = agg["count"].replace(0, pd.NA).astype("Float64")
-    agg["pos_ratio"] = (agg["pos"] / agg["count_safe"]).fillna(0.0)
-    agg["neg_ratio"] = (agg["neg"] / agg["count_safe"]).fillna(0.0)
-    agg["neu_ratio"] = (agg["neu"] / agg["count_safe"]).fillna(0.0)
-    agg = agg.drop(columns=["count_safe"])
-    out = os.path.join(output_dir, "sentiment_timeseries.csv")
-    agg.to_csv(out, index=False)
-    return out
+def run(
+    input_csv: str,
+    output_dir: str,
+    start=None,
+    end=None,
+    near_dup: str = "off",
+    clusters_csv: str | None = None,
+) -> str:
+    """按月聚合情感；near_dup=weight/collapse 时按近重复簇降权或折叠（见 near_duplicates）。"""
+    outs = aggregate_sentiment(
+        input_csv, output_dir, freqs=("M",), start=start, end=end,
+        near_dup=near_dup, clusters_csv=clusters_csv,
+    )
+    return outs["M"]
 
 
 def main():
     input_csv = os.environ.get("DZ_CLEANED_COMMENTS", os.path.join("analysis","cleaned","comments_cleaned.csv"))
     output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
-    path = run(input_csv, output_dir)
+    path = run(
+        input_csv,
+        output_dir,
+        start=os.environ.get("DZ_START"),
+        end=os.environ.get("DZ_END"),
+        near_dup=os.environ.get("DZ_NEAR_DUP_MODE", "off"),
+        clusters_csv=os.environ.get("DZ_NEAR_DUP_CLUSTERS", os.path.join(output_dir, "near_dup_clusters.csv")),
+    )
     print(path)
 
 
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.sqlite_cache import cached_compute, connect  # type: ignore
+from comments_io import read_comments
+
+# 情感分缓存：以评论文本内容哈希 + 打分器名称/版本为键，跨阶段、跨运行共享；
+# 同一条文本在同一打分器版本下只打分一次。打分器或其版本变化时旧记录自然失效。
+DEFAULT_CACHE = os.path.join("analysis", "cache", "sentiment_cache.sqlite")
+# 规则/归一化逻辑变化时递增，使旧缓存失效
+RULES_VERSION = "1"
+
+
+def cache_path() -> str:
+    return os.environ.get("DZ_SENTIMENT_CACHE", DEFAULT_CACHE)
+
+
+def scorer_id() -> tuple[str, str]:
+    """当前打分器的 (名称, 版本)：有 SnowNLP 时为 snownlp，否则为词典规则。
+
+    词典规则的版本包含外部词典（DZ_SENT_LEXICON）内容的摘要，改词典即换版本。
+    """
+    from sentiment_baseline import _HAS_SNOW, _lexicon_path  # 延迟导入，避免循环依赖
+
+    if _HAS_SNOW:
+        try:
+            from importlib.metadata import version
+            v = version("snownlp")
+        except Exception:
+            v = "unknown"
+        return "snownlp", f"{v}+{RULES_VERSION}"
+    lex = _lexicon_path()
+    if lex and os.path.exists(lex):
+        with open(lex, "rb") as f:
+            return "lexicon", f"{RULES_VERSION}+{hashlib.sha1(f.read()).hexdigest()[:12]}"
+    return "lexicon", RULES_VERSION
+
+
+def _init_cache(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS scores ("
+        "h INTEGER NOT NULL, scorer TEXT NOT NULL, version TEXT NOT NULL, score REAL NOT NULL, "
+        "PRIMARY KEY (h, scorer, version)) WITHOUT ROWID"
+    )
+
+
+def _default_scorer() -> Callable[[List[str]], List[float]]:
+    # 未命中缓存的文本交给多进程批量打分引擎
+    from sentiment_engine import score_texts
+
+    return score_texts
+
+
+def score_messages(
+    messages: pd.Series,
+    path: str | None = None,
+    scorer: Callable[[List[str]], List[float]] | None = None,
+) -> pd.Series:
+    """返回与 messages 同索引的连续情感分 sent_raw；命中缓存的文本不再打分。
+
+    只对去重后的非空文本查缓存/打分，新分数写回缓存；空文本恒为 0。
+    """
+    texts = messages.fillna("").astype(str)
+    codes, uniques = pd.factorize(texts, sort=False)
+    values = np.zeros(len(uniques), dtype=float)
+    todo = [i for i, t in enumerate(uniques) if t]
+    if todo:
+        name, version = scorer_id()
+        values[todo] = cached_compute(
+            [uniques[i] for i in todo],
+            connect(path or cache_path(), _init_cache),
+            "scores", "score", {"scorer": name, "version": version},
+            scorer or _default_scorer(),
+            encode=float,
+        )
+    return pd.Series(values[codes], index=messages.index, name="sent_raw")
+
+
+def ensure_sent_raw(df: pd.DataFrame, path: str | None = None) -> pd.DataFrame:
+    """保证 df 含完整的 sent_raw 列：已有分数（如 preprocess 预先写入）直接沿用，缺失部分查缓存补齐。"""
+    if "sent_raw" in df.columns and df["sent_raw"].notna().all():
+        return df
+    df = df.copy()
+    if "sent_raw" not in df.columns:
+        df["sent_raw"] = score_messages(df["message"], path)
+        return df
+    miss = df["sent_raw"].isna()
+    df.loc[miss, "sent_raw"] = score_messages(df.loc[miss, "message"], path)
+    df["sent_raw"] = df["sent_raw"].astype(float)
+    return df
+
+
+def warm_cache(input_csv: str, output_json: str) -> str:
+    """为清洗后的全部评论查/填情感分缓存，写出打分摘要 JSON（打分器、版本、文本条数）。
+
+    流水线中作为唯一的打分阶段：月度 / 周度情感与关键视频等阶段都在其后运行，只读缓存，
+    不再并行重复打分。摘要内容只随数据与打分器变化，重跑结果不变时不触发下游重算。
+    """
+    df = read_comments(input_csv, columns=["message", "sent_raw"]) if os.path.exists(input_csv) else pd.DataFrame()
+    if not df.empty:
+        ensure_sent_raw(df)
+    name, version = scorer_id()
+    os.makedirs(os.path.dirname(output_json) or ".", exist_ok=True)
+    with open(output_json, "w", encoding="utf-8") as f:
+        json.dump({"scorer": name, "version": version, "texts": int(len(df))}, f, ensure_ascii=False)
+    return output_json
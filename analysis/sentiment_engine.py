@@ -0,0 +1,56 @@
+import os
+import sys
+from pathlib import Path
+from typing import List, Sequence
+
+import pandas as pd
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.parallel import chunked_map  # type: ignore
+
+# 批量情感打分引擎：去掉空文本与重复文本后，按块分发到进程池，
+# 每个工作进程只初始化一次 SnowNLP 模型，结果按提交顺序流式取回。
+DEFAULT_CHUNK = 2000
+# 待打分文本少于该数量时直接在本进程计算，省去进程池启动开销
+MIN_PARALLEL = 5000
+
+
+def _init_worker() -> None:
+    # 预热：SnowNLP 首次调用时才加载情感模型，放在初始化阶段每个进程只做一次
+    from sentiment_baseline import _score_text_continuous
+
+    _score_text_continuous("初始化")
+
+
+def _score_chunk(texts: List[str]) -> List[float]:
+    from sentiment_baseline import _HAS_SNOW, _score_text_continuous, score_series
+
+    if not _HAS_SNOW:
+        # 无 SnowNLP 时退回词典规则，整块向量化匹配
+        return score_series(pd.Series(texts, dtype=object)).astype(float).tolist()
+    return [_score_text_continuous(t) for t in texts]
+
+
+def default_workers() -> int:
+    env = os.environ.get("DZ_SENT_WORKERS")
+    if env:
+        return max(1, int(env))
+    return os.cpu_count() or 1
+
+
+def score_texts(
+    texts: Sequence[str],
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK,
+) -> List[float]:
+    """返回与 texts 一一对应的连续情感分；空文本记 0，重复文本只算一次。"""
+    codes, uniques = pd.factorize(pd.Series(list(texts), dtype=object).fillna("").astype(str), sort=False)
+    todo = [t for t in uniques if t]
+    scores = {"": 0.0}
+    scores.update(zip(todo, chunked_map(_score_chunk, todo, workers or default_workers(), chunk_size, MIN_PARALLEL, _init_worker)))
+    values = [scores[t] for t in uniques]
+    return [values[c] for c in codes]
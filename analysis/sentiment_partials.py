@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import sys
+from glob import glob
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.sqlite_cache import connect  # type: ignore
+from comments_io import window_labels
+from preprocess import clean_json_files
+from sentiment_aggregate import (
+    LABEL_THRESHOLD, SUM_COLUMNS, _columns, add_change_columns, finalize_sums,
+    like_weights, output_name, window_sums,
+)
+from sentiment_cache import ensure_sent_raw, scorer_id
+
+# 增量情感聚合：持久化按日的可加部分和（条数、正/负/中性条数、Σw、Σw·s），
+# 以及已计入的 rpid 集合。新一批评论先按 rpid 排除已计入的，再把增量累加到它涉及的日期上；
+# 周/月等时序表由日部分和上卷得到（周、月都是整日的并集），无需重读评论。
+# 打分器或聚合规则变化时部分和整体作废，下次同步从头重建。
+DEFAULT_STORE = os.path.join("analysis", "cache", "sentiment_partials.sqlite")
+# v2：去掉从未导出的 like_sum 列，旧库的 partials 表按新表结构重建
+STORE_VERSION = 2
+PARTIAL_COLUMNS = SUM_COLUMNS
+
+
+def store_path() -> str:
+    return os.environ.get("DZ_SENT_PARTIALS", DEFAULT_STORE)
+
+
+def _signature() -> str:
+    name, version = scorer_id()
+    return json.dumps({"v": STORE_VERSION, "scorer": [name, version], "label": LABEL_THRESHOLD}, sort_keys=True)
+
+
+def _init_store(conn: sqlite3.Connection) -> None:
+    sums = ", ".join(f"{c} REAL NOT NULL" for c in PARTIAL_COLUMNS)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    row = conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+    sig = _signature()
+    stale = row is None or row[0] != sig
+    if stale:
+        # 部分和的列可能随版本变化，签名不符时按当前列重建表
+        conn.execute("DROP TABLE IF EXISTS partials")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS seen (rpid INTEGER PRIMARY KEY) WITHOUT ROWID;"
+        f"CREATE TABLE IF NOT EXISTS partials (day TEXT PRIMARY KEY, {sums}) WITHOUT ROWID;"
+        "CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);"
+        "CREATE TEMP TABLE IF NOT EXISTS batch (rpid INTEGER PRIMARY KEY);"
+    )
+    if stale:
+        reset(conn)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('signature', ?)", (sig,))
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    return connect(path, _init_store)
+
+
+def reset(conn: sqlite3.Connection) -> None:
+    """清空部分和、已计入 rpid 与来源记录。"""
+    with conn:
+        conn.execute("DELETE FROM seen")
+        conn.execute("DELETE FROM partials")
+        conn.execute("DELETE FROM sources")
+
+
+def _unseen(conn: sqlite3.Connection, rpids: List[int]) -> set:
+    # 批量与已计入集合做反连接，比逐条查询快得多
+    conn.execute("DELETE FROM batch")
+    conn.executemany("INSERT OR IGNORE INTO batch(rpid) VALUES (?)", ((r,) for r in rpids))
+    return {r for (r,) in conn.execute("SELECT rpid FROM batch WHERE rpid NOT IN (SELECT rpid FROM seen)")}
+
+
+def ingest(df: pd.DataFrame, path: str | None = None) -> int:
+    """把一批清洗后的评论计入部分和（需含 rpid、ctime、message、like 列），返回新计入的条数。
+
+    rpid 已计入的评论被忽略；ctime 缺失的评论不计入。
+    """
+    conn = _connect(path or store_path())
+    if df.empty:
+        return 0
+    df = df.assign(rpid=pd.to_numeric(df["rpid"], errors="coerce"))
+    df = df[df["rpid"].notna() & pd.to_numeric(df["ctime"], errors="coerce").notna()]
+    df = df.assign(rpid=df["rpid"].astype("int64")).drop_duplicates("rpid", keep="first")
+    new = _unseen(conn, df["rpid"].tolist())
+    df = df[df["rpid"].isin(new)].reset_index(drop=True)
+    if df.empty:
+        return 0
+
+    df = ensure_sent_raw(df)
+    like = df["like"] if "like" in df.columns else pd.Series(0, index=df.index)
+    day = window_labels(df["ctime"], "D")
+    sums = window_sums(
+        day,
+        df["sent_raw"].to_numpy(dtype=float),
+        like_weights(like).to_numpy(dtype=float),
+        pd.Series(1.0, index=df.index).to_numpy(),
+    )
+
+    cols = ", ".join(PARTIAL_COLUMNS)
+    marks = ", ".join("?" * (len(PARTIAL_COLUMNS) + 1))
+    update = ", ".join(f"{c} = {c} + excluded.{c}" for c in PARTIAL_COLUMNS)
+    with conn:
+        conn.executemany("INSERT INTO seen(rpid) VALUES (?)", ((int(r),) for r in df["rpid"]))
+        conn.executemany(
+            f"INSERT INTO partials(day, {cols}) VALUES ({marks}) ON CONFLICT(day) DO UPDATE SET {update}",
+            sums[["window", *PARTIAL_COLUMNS]].astype(object).values.tolist(),
+        )
+    return len(df)
+
+
+def sync_json(input_dir: str, path: str | None = None) -> int:
+    """计入 input_dir 下新增或变化的 comments_*.json，返回新计入的评论数。
+
+    逐个文件清洗、计入，计入后立即记下该文件的来源记录，峰值内存只有一个文件的量；
+    中途中断时已计入的文件下次不再重读。部分和只增不减：已计入评论在源文件中被修改或删除不会回退，需要时用 rebuild 重建。
+    """
+    conn = _connect(path or store_path())
+    known = {p: (s, m) for p, s, m in conn.execute("SELECT path, size, mtime_ns FROM sources")}
+    changed = []
+    for fp in sorted(glob(os.path.join(os.path.abspath(input_dir), "comments_*.json"))):
+        st = os.stat(fp)
+        if known.get(fp) != (st.st_size, st.st_mtime_ns):
+            changed.append((fp, st.st_size, st.st_mtime_ns))
+    n = 0
+    for fp, size, mtime_ns in changed:
+        # 跨文件的重复评论由 seen 表排除
+        n += ingest(clean_json_files([fp]), path)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO sources(path, size, mtime_ns) VALUES (?, ?, ?)", (fp, size, mtime_ns))
+    return n
+
+
+def rebuild(input_dir: str, path: str | None = None) -> int:
+    reset(_connect(path or store_path()))
+    return sync_json(input_dir, path)
+
+
+def load_partials(path: str | None = None) -> pd.DataFrame:
+    conn = _connect(path or store_path())
+    return pd.read_sql_query(f"SELECT day, {', '.join(PARTIAL_COLUMNS)} FROM partials ORDER BY day", conn)
+
+
+def export_timeseries(
+    output_dir: str,
+    freqs: Iterable[str] = ("W", "M"),
+    start=None,
+    end=None,
+    path: str | None = None,
+) -> Dict[str, str]:
+    """由日部分和上卷写出各粒度时序表（文件名与列同 aggregate_sentiment），返回 {freq: 路径}。"""
+    os.makedirs(output_dir, exist_ok=True)
+    parts = load_partials(path)
+    if start is not None:
+        parts = parts[parts["day"] >= str(pd.Timestamp(start).date())]
+    if end is not None:
+        parts = parts[parts["day"] < str(pd.Timestamp(end).date())]
+    outs: Dict[str, str] = {}
+    for f in dict.fromkeys(freqs):
+        out = os.path.join(output_dir, output_name(f))
+        outs[f] = out
+        if parts.empty:
+            pd.DataFrame([], columns=_columns(f)).to_csv(out, index=False)
+            continue
+        window = pd.PeriodIndex(parts["day"], freq="D").asfreq(f).astype(str)
+        sums = parts[SUM_COLUMNS].groupby(window, sort=True).sum().rename_axis("window").reset_index()
+        agg = finalize_sums(sums)
+        if f != "M":
+            agg = add_change_columns(agg)
+        agg[_columns(f)].to_csv(out, index=False)
+    return outs
+
+
+def main() -> None:
+    input_dir = os.environ.get("DZ_INPUT_DIR", "data")
+    output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
+    freqs = [f.strip() for f in os.environ.get("DZ_SENT_FREQS", "D,W,M").split(",") if f.strip()]
+    if os.environ.get("DZ_PARTIALS_REBUILD", "0") == "1":
+        n = rebuild(input_dir)
+    else:
+        n = sync_json(input_dir)
+    print(f"{store_path()}: +{n} comments")
+    paths = export_timeseries(output_dir, freqs=freqs, start=os.environ.get("DZ_START"), end=os.environ.get("DZ_END"))
+    for p in paths.values():
+        print(p)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+from itertools import chain
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# 窗口×词项计数矩阵：词列表整体编码后一次累加（不展开成逐词 DataFrame），得到 CSR 稀疏矩阵
+# + 窗口列表 + 词表（按字典序排列，列号即词的字典序）。矩阵持久化后，TopN、
+# TF-IDF、对数似然“特征词”都只是矩阵上的向量化查询，无需再扫一遍语料。
+MATRIX_NAME = "topics_matrix.npz"
+TERM_COLUMNS = ["window", "word", "freq"]
+SCORE_COLUMNS = ["window", "word", "freq", "score"]
+
+
+class TopicMatrix:
+    """counts[i, j] 为窗口 windows[i] 中词 vocab[j] 的（加权）出现次数。"""
+
+    def __init__(self, counts: sparse.csr_matrix, windows: List[str], vocab: List[str], weighted: bool = False):
+        self.counts = counts
+        self.windows = list(windows)
+        self.vocab = list(vocab)
+        self.weighted = weighted
+
+    @classmethod
+    def build(cls, windows: Iterable[str], tokens: Iterable[List[str]], weights: Iterable[float] | None = None) -> "TopicMatrix":
+        """由逐条评论的 (窗口, 词列表, 权重) 累加；weights 为空时每条评论权重为 1。"""
+        tokens = list(tokens)
+        lens = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        # 窗口与词表都按字典序编码，便于按窗口输出、按词名打破并列
+        windows = windows if isinstance(windows, pd.Series) else pd.Series(list(windows), dtype=object)
+        win_codes, win_list = pd.factorize(windows, sort=True)
+        term_codes, vocab = pd.factorize(np.fromiter(chain.from_iterable(tokens), dtype=object, count=int(lens.sum())), sort=True)
+        weighted = weights is not None
+        w = np.asarray(weights if isinstance(weights, pd.Series) else list(weights), dtype=float) if weighted else np.ones(len(tokens))
+        counts = sparse.coo_matrix(
+            (np.repeat(w, lens), (np.repeat(win_codes, lens), term_codes)),
+            shape=(len(win_list), len(vocab)),
+        ).tocsr()  # 转换时同一 (窗口, 词) 的多条记录自动求和
+        # 没有任何词的窗口不出现在矩阵中
+        keep = np.flatnonzero(np.diff(counts.indptr) > 0)
+        return cls(counts[keep], [win_list[i] for i in keep], list(vocab), weighted=weighted)
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        m = self.counts
+        np.savez_compressed(
+            path,
+            data=m.data, indices=m.indices, indptr=m.indptr, shape=np.asarray(m.shape),
+            windows=np.asarray(self.windows, dtype=str), vocab=np.asarray(self.vocab, dtype=str),
+            weighted=np.asarray(self.weighted),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "TopicMatrix":
+        with np.load(path) as z:
+            counts = sparse.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"]))
+            return cls(counts, z["windows"].tolist(), z["vocab"].tolist(), weighted=bool(z["weighted"]))
+
+    def _rank(self, score: np.ndarray, topn: int, positive_only: bool = False) -> pd.DataFrame:
+        """每个窗口按 score 降序（并列按词的字典序）取前 topn 个非零项；score 与 counts.data 一一对应。"""
+        m = self.counts
+        rows = np.repeat(np.arange(m.shape[0]), np.diff(m.indptr))
+        order = np.lexsort((m.indices, -score, rows))
+        rank = np.arange(len(order)) - m.indptr[rows[order]]
+        keep = order[rank < topn]
+        if positive_only:
+            keep = keep[score[keep] > 0]
+        return pd.DataFrame({
+            "window": np.asarray(self.windows, dtype=object)[rows[keep]],
+            "word": np.asarray(self.vocab, dtype=object)[m.indices[keep]],
+            "freq": m.data[keep],
+            "score": score[keep],
+        })
+
+    def _freq_values(self, freq: pd.Series) -> pd.Series:
+        # 加权计数保留 3 位小数，未加权时即出现次数
+        return freq.round(3) if self.weighted else freq.round().astype(int)
+
+    def top_terms(self, topn: int = 50) -> pd.DataFrame:
+        # 按输出精度排序，避免加权和的浮点尾差打乱并列词的顺序
+        out = self._rank(np.round(self.counts.data, 3), topn)
+        out["freq"] = self._freq_values(out["freq"])
+        return out[TERM_COLUMNS]
+
+    def tfidf(self, topn: int = 50) -> pd.DataFrame:
+        """以窗口为文档：tf = 词频/窗口总词数，idf = ln((1+窗口数)/(1+含该词的窗口数)) + 1。"""
+        m = self.counts
+        row_sum = np.asarray(m.sum(axis=1)).ravel()
+        doc_freq = np.bincount(m.indices, minlength=m.shape[1])
+        idf = np.log((1 + m.shape[0]) / (1 + doc_freq)) + 1
+        rows = np.repeat(np.arange(m.shape[0]), np.diff(m.indptr))
+        score = m.data / row_sum[rows] * idf[m.indices]
+        out = self._rank(score, topn)
+        out["freq"] = self._freq_values(out["freq"])
+        out["score"] = out["score"].round(6)
+        return out[SCORE_COLUMNS]
+
+    def distinctive_terms(self, topn: int = 50) -> pd.DataFrame:
+        """对数似然比（Dunning G²）：窗口内词频相对其余窗口显著偏高的词，只保留偏高方向。"""
+        m = self.counts
+        row_sum = np.asarray(m.sum(axis=1)).ravel()
+        col_sum = np.asarray(m.sum(axis=0)).ravel()
+        total = row_sum.sum()
+        rows = np.repeat(np.arange(m.shape[0]), np.diff(m.indptr))
+        a = m.data
+        b = col_sum[m.indices] - a
+        n1 = row_sum[rows]
+        n2 = total - n1
+        e1 = (a + b) * n1 / total
+        e2 = (a + b) * n2 / total
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g2 = 2 * (a * np.log(a / e1) + np.where(b > 0, b * np.log(b / e2), 0.0))
+        over = (n2 <= 0) | (a * n2 > b * n1)
+        score = np.where(over, np.nan_to_num(g2), 0.0)
+        out = self._rank(score, topn, positive_only=True)
+        out["freq"] = self._freq_values(out["freq"])
+        out["score"] = out["score"].round(6)
+        return out[SCORE_COLUMNS]
+
+
+def matrix_path(output_dir: str) -> str:
+    return os.path.join(output_dir, MATRIX_NAME)
+
+
+def main() -> None:
+    """基于已持久化的矩阵输出 TF-IDF 与特征词表（需先运行 topics_baseline）。"""
+    output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
+    topn = int(os.environ.get("DZ_TOPN", "50"))
+    path = matrix_path(output_dir)
+    if not os.path.exists(path):
+        print(f"matrix not found: {path} (run topics_baseline.py first)")
+        return
+    tm = TopicMatrix.load(path)
+    outs = (
+        os.path.join(output_dir, "topics_tfidf.csv"),
+        os.path.join(output_dir, "topics_distinctive.csv"),
+    )
+    tm.tfidf(topn).to_csv(outs[0], index=False)
+    tm.distinctive_terms(topn).to_csv(outs[1], index=False)
+    for p in outs:
+        print(p)
+
+
+if __name__ == "__main__":
+    main()
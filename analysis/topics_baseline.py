@@ -1,52 +1,108 @@
+import json
 import os
 import re
+import sys
+from pathlib import Path
+
 import pandas as pd
-import jieba
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.tokenizer import segment, tokenize_texts  # type: ignore
+from comments_io import read_comments, window_labels
+from near_duplicates import apply_near_dup
+from topic_matrix import TERM_COLUMNS, TopicMatrix, matrix_path
 
 _stop = set(["的","了","啊","么","吗","呀","哦","和","与","及","也","很","在","就","都","还","又","而且","但是","如果","就是","这个","那个","一个","不是","没有"]) 
 _token_re = re.compile(r"[\u4e00-\u9fffA-Za-z0-9_]+")
 
 
-def tokenize(s: str):
+def _normalize(s) -> str:
     if not isinstance(s, str):
-        return []
-    s = "".join(_token_re.findall(s))
-    ws = jieba.lcut(s)
-    return [w for w in ws if w and w not in _stop and len(w)>=2]
+        return ""
+    return "".join(_token_re.findall(s))
+
+
+def tokenize(s: str):
+    """单条文本分词（供检索词等零散调用）；批量文本请用 tokenize_series。"""
+    return [w for w in segment(_normalize(s)) if w not in _stop]
+
+
+def tokenize_series(messages: pd.Series) -> pd.Series:
+    """整列分词，返回与 messages 同索引的词列表；经共享分词缓存，未命中的去重文本并行分词。"""
+    toks = tokenize_texts(messages.map(_normalize))
+    return pd.Series([[w for w in ws if w not in _stop] for ws in toks], index=messages.index, dtype=object)
+
+
+def ensure_tokens(df: pd.DataFrame) -> pd.Series:
+    """返回 df 的词列表列：已有 tokens 列（preprocess 预先写入，空格连接）直接拆分沿用，否则现场分词。
+
+    CSV 中空字符串读回为缺失值，故已有 tokens 列时缺失即视为无词。
+    """
+    if "tokens" in df.columns:
+        return df["tokens"].fillna("").astype(str).str.split()
+    return tokenize_series(df["message"])
+
+
+def warm_tokens(input_csv: str, output_json: str) -> str:
+    """为清洗后的全部评论查/填分词缓存，写出摘要 JSON（文本条数）。
+
+    流水线中作为唯一的分词阶段，主题与周词云在其后只读缓存，不再各自并行分词。
+    """
+    df = read_comments(input_csv, columns=["message", "tokens"]) if os.path.exists(input_csv) else pd.DataFrame()
+    if not df.empty:
+        ensure_tokens(df)
+    os.makedirs(os.path.dirname(output_json) or ".", exist_ok=True)
+    with open(output_json, "w", encoding="utf-8") as f:
+        json.dump({"texts": int(len(df))}, f, ensure_ascii=False)
+    return output_json
 
 
-def run(input_csv: str, output_dir: str, topn: int = 50) -> str:
+def run(
+    input_csv: str,
+    output_dir: str,
+    topn: int = 50,
+    start=None,
+    end=None,
+    near_dup: str = "off",
+    clusters_csv: str | None = None,
+) -> str:
+    """按月统计高频词；near_dup=weight/collapse 时按近重复簇降权或折叠（见 near_duplicates）。"""
     os.makedirs(output_dir, exist_ok=True)
     if not os.path.exists(input_csv):
         out = os.path.join(output_dir, "topics_by_window.csv")
-        pd.DataFrame([], columns=["window","word","freq"]).to_csv(out, index=False)
+        pd.DataFrame([], columns=TERM_COLUMNS).to_csv(out, index=False)
         return out
-    df = pd.read_csv(input_csv)
+    df = read_comments(input_csv, columns=["rpid", "ctime", "message", "tokens"], start=start, end=end)
     if df.empty:
         out = os.path.join(output_dir, "topics_by_window.csv")
-        pd.DataFrame([], columns=["window","word","freq"]).to_csv(out, index=False)
+        pd.DataFrame([], columns=TERM_COLUMNS).to_csv(out, index=False)
         return out
-    df["window"] = pd.to_datetime(df["ctime"], unit="s", errors="coerce").dt.to_period("M").astype(str)
-    df["tokens"] = df["message"].fillna("").astype(str).apply(tokenize)
-    recs = []
-    for w, g in df.explode("tokens").groupby(["window","tokens"], as_index=False):
-        pass
-    gdf = df.explode("tokens").groupby(["window","tokens"]).size().reset_index(name="freq")
-    gdf = gdf.sort_values(["window","freq"], ascending=[True, False])
-    out_rows = []
-    for window, sub in gdf.groupby("window"):
-        head = sub.head(topn)
-        for _, r in head.iterrows():
-            out_rows.append({"window": window, "word": r["tokens"], "freq": int(r["freq"])})
+    df["window"] = window_labels(df["ctime"], "M")
+    df = apply_near_dup(df, clusters_csv, near_dup)
+    df["tokens"] = ensure_tokens(df)
+    # 逐条累加成窗口×词项稀疏矩阵并持久化；词频按 dup_w 加权，未启用降权时即出现次数
+    tm = TopicMatrix.build(df["window"], df["tokens"], df["dup_w"] if near_dup == "weight" else None)
+    tm.save(matrix_path(output_dir))
     out = os.path.join(output_dir, "topics_by_window.csv")
-    pd.DataFrame(out_rows).to_csv(out, index=False)
+    tm.top_terms(topn).to_csv(out, index=False)
     return out
 
 
 def main():
     input_csv = os.environ.get("DZ_CLEANED_COMMENTS", os.path.join("analysis","cleaned","comments_cleaned.csv"))
     output_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
-    path = run(input_csv, output_dir)
+    path = run(
+        input_csv,
+        output_dir,
+        start=os.environ.get("DZ_START"),
+        end=os.environ.get("DZ_END"),
+        near_dup=os.environ.get("DZ_NEAR_DUP_MODE", "off"),
+        clusters_csv=os.environ.get("DZ_NEAR_DUP_CLUSTERS", os.path.join(output_dir, "near_dup_clusters.csv")),
+    )
     print(path)
 
 
@@ -0,0 +1,192 @@
+import os
+import sqlite3
+import sys
+from glob import glob
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.sqlite_cache import connect  # type: ignore
+from src.storage import COLUMNS  # type: ignore
+
+# 视频元数据索引（SQLite）：以 (bvid, 来源文件) 为键保存各采集 CSV 中的视频指标，
+# 并记录每个来源文件的大小/mtime；同步时只重读新增或变化的 CSV，已删除的文件连同其记录一并移除。
+# 查询按 bvid 列表取每个视频 view 最高的一行。B 站接口补全的结果单独存表，避免重复请求。
+DEFAULT_INDEX = os.path.join("analysis", "cache", "video_index.sqlite")
+META_COLUMNS = [c for c in COLUMNS if c != "bvid"]
+# 接口补全结果缓存与本地索引同一组字段
+API_COLUMNS = META_COLUMNS
+# 除主数据目录外，同级目录下若存在这些采集输出目录也一并纳入
+EXTRA_DIRS = ["data_click", "data_totalrank", "data_merged", "data_merged_relaxed"]
+_LOOKUP_BATCH = 500
+
+
+def index_path() -> str:
+    return os.environ.get("DZ_VIDEO_INDEX", DEFAULT_INDEX)
+
+
+def _q(col: str) -> str:
+    # like 等列名与 SQL 关键字冲突，统一加引号
+    return f'"{col}"'
+
+
+def _init_index(conn: sqlite3.Connection) -> None:
+    cols = ", ".join(_q(c) for c in META_COLUMNS)
+    api_cols = ", ".join(_q(c) for c in API_COLUMNS)
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);"
+        f"CREATE TABLE IF NOT EXISTS videos (bvid TEXT NOT NULL, source TEXT NOT NULL, {cols}, "
+        "PRIMARY KEY (bvid, source)) WITHOUT ROWID;"
+        "CREATE INDEX IF NOT EXISTS idx_videos_source ON videos(source);"
+        f"CREATE TABLE IF NOT EXISTS api_meta (bvid TEXT PRIMARY KEY, {api_cols}, fetched_at INTEGER);"
+    )
+    # 旧版索引的 api_meta 只有 title/view/reply/like，就地补齐新增字段
+    have = {r[1] for r in conn.execute("PRAGMA table_info(api_meta)")}
+    for c in API_COLUMNS:
+        if c not in have:
+            conn.execute(f"ALTER TABLE api_meta ADD COLUMN {_q(c)}")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    return connect(path, _init_index)
+
+
+def candidate_files(data_dir: str) -> List[str]:
+    """data_dir 及其同级采集输出目录下的全部 CSV（绝对路径，已排序）。"""
+    base = os.path.abspath(data_dir)
+    dirs: List[str] = [base]
+    for sub in EXTRA_DIRS:
+        p = os.path.join(os.path.dirname(base), sub)
+        if os.path.isdir(p):
+            dirs.append(p)
+    files: set = set()
+    for d in dirs:
+        # data_merged / data_merged_relaxed 里也可能是按月合并后的 csv
+        files.update(glob(os.path.join(d, "*.csv")))
+    return sorted(files)
+
+
+def _read_source(fp: str) -> pd.DataFrame:
+    """读取一个 CSV 中的视频指标列；不含 bvid 列的表（或读失败）返回空表。"""
+    try:
+        df = pd.read_csv(fp, usecols=lambda c: c in COLUMNS)
+    except Exception:
+        return pd.DataFrame()
+    if "bvid" not in df.columns:
+        return pd.DataFrame()
+    for c in META_COLUMNS:
+        if c not in df.columns:
+            df[c] = None
+    df = df[df["bvid"].notna()]
+    df["bvid"] = df["bvid"].astype(str)
+    # 同一文件内重复的 bvid 保留 view 最高的一行
+    df = df.sort_values("view", ascending=False, kind="stable").drop_duplicates("bvid", keep="first")
+    return df[COLUMNS]
+
+
+def _rows(df: pd.DataFrame, source: str) -> List[list]:
+    # astype(object) 把 numpy 标量转成 Python 原生类型，缺失值转 None
+    vals = df.astype(object).where(df.notna(), None).values.tolist()
+    return [[r[0], source, *r[1:]] for r in vals]
+
+
+def sync(data_dir: str, path: str | None = None) -> List[str]:
+    """把 data_dir 相关目录下新增/变化的 CSV 重新入索引，移除已消失的文件；返回当前来源文件列表。"""
+    conn = _connect(path or index_path())
+    files = candidate_files(data_dir)
+    known = {p: (s, m) for p, s, m in conn.execute("SELECT path, size, mtime_ns FROM sources")}
+    marks = ", ".join("?" * (len(COLUMNS) + 1))
+    insert = f"INSERT OR REPLACE INTO videos(bvid, source, {', '.join(_q(c) for c in META_COLUMNS)}) VALUES ({marks})"
+    for fp in files:
+        st = os.stat(fp)
+        if known.get(fp) == (st.st_size, st.st_mtime_ns):
+            continue
+        df = _read_source(fp)
+        with conn:
+            conn.execute("DELETE FROM videos WHERE source = ?", (fp,))
+            if not df.empty:
+                conn.executemany(insert, _rows(df, fp))
+            conn.execute("INSERT OR REPLACE INTO sources(path, size, mtime_ns) VALUES (?, ?, ?)", (fp, st.st_size, st.st_mtime_ns))
+    gone = [p for p in known if not os.path.exists(p)]
+    if gone:
+        with conn:
+            conn.executemany("DELETE FROM videos WHERE source = ?", [(p,) for p in gone])
+            conn.executemany("DELETE FROM sources WHERE path = ?", [(p,) for p in gone])
+    return files
+
+
+def lookup(bvids: Iterable[str], sources: Iterable[str] | None = None, path: str | None = None) -> pd.DataFrame:
+    """按 bvid 列表查询，每个 bvid 返回 view 最高的一行；sources 非空时只在这些来源文件中查找。"""
+    conn = _connect(path or index_path())
+    ids = sorted({str(b) for b in bvids if isinstance(b, str) and b})
+    allowed = set(sources) if sources is not None else None
+    cols = ", ".join(_q(c) for c in META_COLUMNS)
+    parts: List[pd.DataFrame] = []
+    for i in range(0, len(ids), _LOOKUP_BATCH):
+        part = ids[i:i + _LOOKUP_BATCH]
+        marks = ",".join("?" * len(part))
+        parts.append(pd.read_sql_query(
+            f"SELECT bvid, source, {cols} FROM videos WHERE bvid IN ({marks})", conn, params=part,
+        ))
+    # 空批次的列为 object，拼进来会把数值列也变成 object，只拼有结果的批次
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame([], columns=COLUMNS)
+    df = pd.concat(parts, ignore_index=True)
+    if allowed is not None:
+        df = df[df["source"].isin(allowed)]
+    # view 缺失的行排在最后；并列时按来源路径取第一个，结果可复现
+    df = df.sort_values(["bvid", "view", "source"], ascending=[True, False, True], na_position="last", kind="stable")
+    return df.drop_duplicates("bvid", keep="first")[COLUMNS].reset_index(drop=True)
+
+
+def load_videos(data_dir: str, bvids: Iterable[str], path: str | None = None) -> pd.DataFrame:
+    """同步 data_dir 相关目录后查询给定 bvid 的视频元数据。"""
+    return lookup(bvids, sources=sync(data_dir, path), path=path)
+
+
+def cached_api_meta(bvids: Iterable[str], path: str | None = None) -> Dict[str, Dict]:
+    """已缓存的接口补全结果 {bvid: {字段: 值}}，字段同 API_COLUMNS。"""
+    conn = _connect(path or index_path())
+    ids = sorted({str(b) for b in bvids})
+    out: Dict[str, Dict] = {}
+    for i in range(0, len(ids), _LOOKUP_BATCH):
+        part = ids[i:i + _LOOKUP_BATCH]
+        marks = ",".join("?" * len(part))
+        rows = conn.execute(
+            f"SELECT bvid, {', '.join(_q(c) for c in API_COLUMNS)} FROM api_meta WHERE bvid IN ({marks})", part,
+        )
+        for r in rows:
+            out[r[0]] = dict(zip(API_COLUMNS, r[1:]))
+    return out
+
+
+def save_api_meta(metas: Dict[str, Dict], fetched_at: int, path: str | None = None) -> None:
+    conn = _connect(path or index_path())
+    rows = [[b, *[m.get(c) for c in API_COLUMNS], fetched_at] for b, m in metas.items() if m]
+    if not rows:
+        return
+    marks = ", ".join("?" * (len(API_COLUMNS) + 2))
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO api_meta(bvid, {', '.join(_q(c) for c in API_COLUMNS)}, fetched_at) VALUES ({marks})",
+            rows,
+        )
+
+
+def main() -> None:
+    data_dir = os.environ.get("DZ_VIDEO_DATA", os.path.join("data"))
+    files = sync(data_dir)
+    conn = _connect(index_path())
+    n = conn.execute("SELECT COUNT(DISTINCT bvid) FROM videos").fetchone()[0]
+    print(f"{index_path()}: {len(files)} source files, {n} videos")
+
+
+if __name__ == "__main__":
+    main()
@@ -250,7 +250,7 @@ def main():
     topics_csv = os.environ.get("DZ_TOPICS", os.path.join("analysis","topics_by_window.csv"))
     out_dir = os.environ.get("DZ_ANALYSIS_DIR", os.path.join("analysis"))
     weekly_csv = ts_csv
-    cand_weeks_csv = os.path.join(out_dir, "candidate_weeks.csv")
+    cand_weeks_csv = os.environ.get("DZ_CANDIDATE_WEEKS", os.path.join(out_dir, "candidate_weeks.csv"))
     a = plot_sentiment(ts_csv, out_dir)
     b = wordcloud_from_topics(topics_csv, out_dir)
     c = plot_sentiment_ratios(ts_csv, out_dir)
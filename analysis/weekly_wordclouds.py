@@ -4,7 +4,8 @@ from typing import Dict, Any
 import pandas as pd
 from wordcloud import WordCloud
 
-from topics_baseline import tokenize  # 复用已有分词与停用词逻辑
+from comments_io import load_week_index
+from topics_baseline import ensure_tokens  # 复用已有分词与停用词逻辑（经共享分词缓存）
 from visualize import _pick_font  # 复用字体选择
 
 
@@ -19,21 +20,19 @@ def build_weekly_wordclouds(
     if not os.path.exists(cleaned_comments_csv) or not os.path.exists(candidate_weeks_csv):
         return ""
 
-    comments = pd.read_csv(cleaned_comments_csv)
-    if comments.empty:
-        return ""
-
-    # 补一个与 weekly 相同格式的 week 列
-    ts = pd.to_datetime(comments["ctime"], unit="s", errors="coerce")
-    comments = comments.assign(
-        ts=ts,
-        week=ts.dt.to_period("W").astype(str),
-    )
-
     cweeks = pd.read_csv(candidate_weeks_csv)
     if cweeks.empty:
         return ""
 
+    # 只读取候选周覆盖的时间范围（Parquet 可按月分区裁剪），按 ctime 排序一次建立周索引，
+    # 再只保留候选周内的评论
+    comments = load_week_index(cleaned_comments_csv, cweeks["window"].astype(str), columns=["message", "tokens"])
+    comments = comments.subset(cweeks["window"].astype(str))
+    if comments.empty:
+        return ""
+    # 优先用预分词列，否则整批查缓存/并行分词
+    comments.df["tokens"] = ensure_tokens(comments.df)
+
     font_path = _pick_font()
     base_wc_dir = os.path.join(output_dir, "visualizations", "week_wordclouds")
     os.makedirs(base_wc_dir, exist_ok=True)
@@ -42,17 +41,13 @@ def build_weekly_wordclouds(
 
     for _, row in cweeks.iterrows():
         window = str(row["window"])
-        wk = comments[comments["week"] == window]
+        wk = comments.week(window)
         if wk.empty:
             continue
-        # 构造该周的所有 message 文本
-        texts = wk["message"].fillna("").astype(str).tolist()
-        if not texts:
-            continue
-        # 分词 + 计数
+        # 计数
         freq: Dict[str, int] = {}
-        for s in texts:
-            for w in tokenize(s):
+        for ws in wk["tokens"]:
+            for w in ws:
                 freq[w] = freq.get(w, 0) + 1
         if not freq:
             continue
@@ -81,7 +76,7 @@ def main() -> None:
         "DZ_CLEANED_COMMENTS",
         os.path.join(base_analysis, "cleaned", "comments_cleaned.csv"),
     )
-    cand_weeks = os.path.join(base_analysis, "candidate_weeks.csv")
+    cand_weeks = os.environ.get("DZ_CANDIDATE_WEEKS", os.path.join(base_analysis, "candidate_weeks.csv"))
     paths = build_weekly_wordclouds(cleaned_csv, cand_weeks, base_analysis)
     print(paths)
 
@@ -8,7 +8,7 @@ from datetime import datetime, timezone, timedelta
 
 from src.config import load_config, merge_config
 from src.crawler import HttpClient, BiliCrawler
-from src.storage import persist_all, save_json
+from src.storage import DB_FILENAME, persist_all, save_comments_sqlite, save_json
 from src.stats import generate_stats
 
 
@@ -96,6 +96,7 @@ def main():
         logger.info(f"Start fetching popular: pages={pages}, ps={ps}")
         items = crawler.fetch_popular(pages=pages, ps=ps)
         basename = "popular"
+        tags = {"source": "popular"}
     elif mode == "ranking":
         r = cfg.get("ranking", {})
         rid = int(r.get("rid", 0))
@@ -104,6 +105,7 @@ def main():
         logger.info(f"Start fetching ranking: rid={rid}, day={day}, type={rtype}")
         items = crawler.fetch_ranking(rid=rid, day=day, type_=rtype)
         basename = f"ranking_rid{rid}"
+        tags = {"source": basename}
     elif mode == "search":
         s = cfg.get("search", {})
         kw = s.get("keyword") or ""
@@ -116,6 +118,7 @@ def main():
         items = crawler.fetch_search_videos(keyword=kw, pages=pages, page_size=page_size, order=order)
         safe_kw = re.sub(r"[^0-9a-zA-Z\u4e00-\u9fa5_]+", "_", kw)
         basename = f"search_{safe_kw}"
+        tags = {"source": "search", "keyword": kw, "order": order}
     elif mode == "comments":
         s = cfg.get("comments", {})
         kw = s.get("keyword") or ""
@@ -167,8 +170,12 @@ def main():
         basename = f"comments_{safe_kw}_{year}{int(month):02d}"
         json_path = os.path.join(output_dir, f"{basename}.json")
         save_json(comments_payload, json_path)
+        save_comments_sqlite(comments_payload, os.path.join(output_dir, DB_FILENAME))
         # 同时保存被选中的视频列表（CSV/DB）
-        paths = persist_all(picked, output_dir=output_dir, basename=basename)
+        paths = persist_all(
+            picked, output_dir=output_dir, basename=basename,
+            source="comments", keyword=kw, month=f"{year}-{int(month):02d}", order=order,
+        )
         logger.info(f"Saved comments JSON: {json_path}; videos: {paths}")
         return
     else:
@@ -176,7 +183,9 @@ def main():
 
     if not items:
         logger.warning("No items fetched.")
-    paths = persist_all(items, output_dir=output_dir, basename=basename)
+    # 热门/排行/搜索不按月筛选，以抓取当月（UTC+8）作为 month 标签，便于按时间区分多次抓取
+    tags.setdefault("month", datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m"))
+    paths = persist_all(items, output_dir=output_dir, basename=basename, **tags)
     logger.info(f"Saved to: {paths}")
 
     stat_paths = generate_stats(paths["csv"], output_dir)
@@ -13,7 +13,7 @@ if str(ROOT) not in sys.path:
 
 from src.config import load_config, merge_config  # type: ignore
 from src.crawler import HttpClient, BiliCrawler  # type: ignore
-from src.storage import persist_all, save_json  # type: ignore
+from src.storage import DB_FILENAME, persist_all, save_comments_sqlite, save_json  # type: ignore
 
 
 def pick_top_this_month(crawler: BiliCrawler, pages: int = 10, ps: int = 20) -> List[Dict[str, Any]]:
@@ -72,7 +72,8 @@ def main():
     # 保存
     basename = f"hot_{ym}"
     save_json(payload, os.path.join(output_dir, f"{basename}.json"))
-    persist_all(top_videos, output_dir=output_dir, basename=basename)
+    save_comments_sqlite(payload, os.path.join(output_dir, DB_FILENAME))
+    persist_all(top_videos, output_dir=output_dir, basename=basename, source="hot", month=f"{y}-{m:02d}")
     print(f"Saved: {os.path.join(output_dir, f'{basename}.json')} and CSV/SQLite for top videos")
 
 
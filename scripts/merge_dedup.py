@@ -1,125 +1,402 @@
 import argparse
+import codecs
+import hashlib
+import json
 import os
 import glob
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
-import shutil
-import json
+import sys
+from pathlib import Path
 
+# ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
-def read_csv_safe(path: str) -> pd.DataFrame:
-    for enc in ("utf-8", "utf-8-sig", "gb18030"):
-        try:
-            return pd.read_csv(path, encoding=enc, low_memory=False)
-        except Exception:
-            continue
-    raise RuntimeError(f"failed to read csv: {path}")
+from src.dedup_index import DedupIndex  # type: ignore
+from src.keyword_matcher import KeywordMatcher, load_keywords  # type: ignore
+from src.storage import iter_json_items, write_json_items  # type: ignore
 
 
-def merge_and_dedup(dir_a: str, dir_b: str, out_dir: str, keys: list[str]):
-    os.makedirs(out_dir, exist_ok=True)
-    names = set()
-    for d in (dir_a, dir_b):
-        names.update(os.path.basename(p) for p in glob.glob(os.path.join(d, "*.csv")))
+def detect_encoding(path: str) -> str:
+    """流式校验整份文件能否按 UTF-8 解码，否则回退 gb18030。"""
+    dec = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                dec.decode(block)
+            dec.decode(b"", final=True)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+
+def iter_csv_chunks(path: str, chunksize: int, columns: list[str] | None = None):
+    """按块读取 CSV；所有列按文本读入，原样写出，避免跨块类型推断不一致。"""
+    enc = detect_encoding(path)
+    for chunk in pd.read_csv(path, encoding=enc, dtype=str, chunksize=chunksize):
+        yield chunk if columns is None else chunk.reindex(columns=columns)
+
+
+# 按文本读入后，同一数值在不同来源可能写成 123 / 123.0 / 0123；参与去重的键先规整为整数写法
+_int_text_re = re.compile(r"^\s*([+-]?)0*(\d+?)(?:\.0*)?\s*$")
 
-    for name in sorted(names):
-        dfs = []
-        for d in (dir_a, dir_b):
-            p = os.path.join(d, name)
-            if os.path.exists(p):
+
+def normalize_keys(frame: pd.DataFrame) -> pd.DataFrame:
+    """返回用于计算行键哈希的副本：整数形式的文本统一写法，其余文本去掉首尾空白；输出行保持原样。"""
+    return frame.apply(lambda s: s.str.replace(_int_text_re, r"\1\2", regex=True).str.strip())
+
+
+def read_header(path: str) -> list[str]:
+    return list(pd.read_csv(path, encoding=detect_encoding(path), nrows=0).columns)
+
+
+def _dedup_subset(columns: list[str], keys: list[str]) -> list[str] | None:
+    # choose keys that exist in df
+    use_keys = [k for k in keys if k in columns]
+    if use_keys:
+        return use_keys
+    text_cols = [c for c in ["content", "message", "text"] if c in columns]
+    id_cols = [c for c in ["rpid", "id", "reply_id", "bvid", "oid", "mid", "uid"] if c in columns]
+    return (text_cols + id_cols) or None
+
+
+def merge_month(name: str, dirs: list[str], out_dir: str, keys: list[str], chunksize: int = 50000):
+    """流式合并各目录中的同名 CSV 并去重（保留首见行），返回 (输出路径, 行数, bvid 集合)。
+
+    行顺序与“按目录顺序 concat 后 drop_duplicates(keep='first')”一致。
+    """
+    paths = [os.path.join(d, name) for d in dirs if os.path.exists(os.path.join(d, name))]
+    columns: list[str] = []
+    readable: list[str] = []
+    for p in paths:
+        try:
+            cols = read_header(p)
+        except Exception as e:
+            print(f"[warn] read {p} failed: {e}")
+            continue
+        readable.append(p)
+        columns.extend(c for c in cols if c not in columns)
+    if not readable:
+        return None, 0, set()
+
+    subset = _dedup_subset(columns, keys) or columns
+    index = DedupIndex()
+    out_path = os.path.join(out_dir, name)
+    rows = 0
+    bvids: set[str] = set()
+    try:
+        with open(out_path, "w", encoding="utf-8-sig", newline="") as f:
+            header = True
+            for p in readable:
                 try:
-                    dfs.append(read_csv_safe(p))
+                    for chunk in iter_csv_chunks(p, chunksize, columns):
+                        h = pd.util.hash_pandas_object(normalize_keys(chunk[subset]), index=False).to_numpy()
+                        chunk = chunk[index.filter_new(h)]
+                        chunk.to_csv(f, index=False, header=header)
+                        header = False
+                        rows += len(chunk)
+                        if "bvid" in chunk.columns:
+                            bvids.update(chunk["bvid"].astype(str))
                 except Exception as e:
                     print(f"[warn] read {p} failed: {e}")
-        if not dfs:
+            if header:
+                pd.DataFrame([], columns=columns).to_csv(f, index=False)
+    finally:
+        index.close()
+    print(f"merged -> {out_path} rows={rows}")
+    return out_path, rows, bvids
+
+
+def merge_and_dedup(dirs: list[str], out_dir: str, keys: list[str], chunksize: int = 50000):
+    os.makedirs(out_dir, exist_ok=True)
+    for name in list_months(dirs):
+        out_path, rows, bvids = merge_month(name, dirs, out_dir, keys, chunksize)
+        if out_path is None:
             continue
+        yield name, out_path, rows, bvids
+
+
+def relaxed_filter_month(
+    merged_path: str,
+    out_path: str,
+    kw_matcher: KeywordMatcher,
+    cols: list[str],
+    closed_matcher: KeywordMatcher,
+    keep_closed_if_title_match: bool,
+    chunksize: int = 50000,
+):
+    """对合并结果分块做关键词宽松筛选；返回 (命中列, 保留行数, bvid 集合)，无可用列时返回 None。
+
+    命中的关键词以 ";" 连接写入新增的 matched_keywords 列。
+    """
+    columns = read_header(merged_path)
+    use_cols = [c for c in cols if c in columns]
+    if not use_cols or not len(kw_matcher):
+        return None
+    order = {p: i for i, p in enumerate(kw_matcher.patterns)}
+    rows = 0
+    bvids: set[str] = set()
+    with open(out_path, "w", encoding="utf-8-sig", newline="") as f:
+        header = True
+        for df in iter_csv_chunks(merged_path, chunksize):
+            hits = [set() for _ in range(len(df))]
+            for c in use_cols:
+                for i, found in enumerate(kw_matcher.find_series(df[c])):
+                    hits[i].update(found)
+            mask = np.array([bool(h) for h in hits], dtype=bool)
+
+            # 豁免：检测“评论区关闭”相关表述，或标题命中关键词时也保留
+            if keep_closed_if_title_match:
+                # 关闭短语检测：在常见文本列里找提示信息（区分大小写）
+                closed_cols = [c for c in ["error_msg", "message", "text", "content", "desc"] if c in df.columns]
+                for c in closed_cols:
+                    mask |= closed_matcher.contains_any(df[c]).to_numpy()
+                # 标题命中：即使评论文本不匹配，只要标题包含关键词也保留
+                if "title" in df.columns and "title" not in use_cols:
+                    for i, found in enumerate(kw_matcher.find_series(df["title"])):
+                        if found:
+                            hits[i].update(found)
+                            mask[i] = True
+
+            dff = df[mask].copy()
+            dff["matched_keywords"] = [
+                ";".join(sorted(h, key=order.__getitem__)) for h, keep in zip(hits, mask) if keep
+            ]
+            dff.to_csv(f, index=False, header=header)
+            header = False
+            rows += len(dff)
+            if "bvid" in dff.columns:
+                bvids.update(dff["bvid"].astype(str))
+        if header:
+            pd.DataFrame([], columns=columns + ["matched_keywords"]).to_csv(f, index=False)
+    return use_cols, rows, bvids
+
+
+def _item_bvid(item) -> str | None:
+    if not isinstance(item, dict):
+        return None
+    return (item.get("video") or {}).get("bvid") or (item.get("comments") or {}).get("bvid")
+
+
+def _n_children(reply: dict) -> int:
+    return len(reply.get("replies") or [])
+
+
+def _merge_replies(base: list, extra: list) -> list:
+    """按 rpid 合并两份评论列表：保留 base 的顺序，同一 rpid 取子评论更多的版本并合并其子评论。"""
+    merged: dict = {}
+    loose: list = []
+    for r in list(base or []) + list(extra or []):
+        if not isinstance(r, dict) or r.get("rpid") is None:
+            loose.append(r)
+            continue
+        old = merged.get(r["rpid"])
+        if old is None:
+            merged[r["rpid"]] = r
+            continue
+        rich, poor = (r, old) if _n_children(r) > _n_children(old) else (old, r)
+        children = _merge_replies(rich.get("replies") or [], poor.get("replies") or [])
+        merged[r["rpid"]] = {**poor, **rich, "replies": children}
+    return list(merged.values()) + loose
+
+
+def _merge_item(old: dict, new: dict) -> dict:
+    # 评论条数更多的一侧作为主版本，另一侧只补充缺失的字段与评论
+    oc, nc = old.get("comments") or {}, new.get("comments") or {}
+    if len(nc.get("replies") or []) > len(oc.get("replies") or []):
+        old, new, oc, nc = new, old, nc, oc
+    video = {**(new.get("video") or {}), **(old.get("video") or {})}
+    comments = {**nc, **oc, "replies": _merge_replies(oc.get("replies") or [], nc.get("replies") or [])}
+    return {**new, **old, "video": video, "comments": comments}
 
-        df = pd.concat(dfs, ignore_index=True)
 
-        # choose keys that exist in df
-        use_keys = [k for k in keys if k in df.columns]
-        if use_keys:
-            df = df.drop_duplicates(subset=use_keys)
+class JsonItemIndex:
+    """磁盘可溢出的 bvid → 条目索引（临时 SQLite，同 DedupIndex）。
+
+    条目以 JSON 文本存放，同一 bvid 再次出现时取出合并后写回；内存中只有当前条目，
+    与单月 JSON 的总量无关。按首次出现的顺序输出，无 bvid 的条目排在最后。
+    """
+
+    def __init__(self, path: str = ""):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS items (seq INTEGER PRIMARY KEY, bvid TEXT UNIQUE, body TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS loose (seq INTEGER PRIMARY KEY, body TEXT NOT NULL)")
+
+    def add(self, item) -> None:
+        bv = _item_bvid(item)
+        if bv is None:
+            self.conn.execute("INSERT INTO loose(body) VALUES (?)", (json.dumps(item, ensure_ascii=False),))
+            return
+        row = self.conn.execute("SELECT seq, body FROM items WHERE bvid = ?", (bv,)).fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO items(bvid, body) VALUES (?, ?)", (bv, json.dumps(item, ensure_ascii=False)))
         else:
-            text_cols = [c for c in ["content", "message", "text"] if c in df.columns]
-            id_cols = [c for c in ["rpid", "id", "reply_id", "bvid", "oid", "mid", "uid"] if c in df.columns]
-            subset = text_cols + id_cols
-            df = df.drop_duplicates(subset=subset or None)
+            body = json.dumps(_merge_item(json.loads(row[1]), item), ensure_ascii=False)
+            self.conn.execute("UPDATE items SET body = ? WHERE seq = ?", (body, row[0]))
 
-        out_path = os.path.join(out_dir, name)
-        df.to_csv(out_path, index=False, encoding="utf-8-sig")
-        print(f"merged -> {out_path} rows={len(df)}")
+    def __iter__(self):
+        for table in ("items", "loose"):
+            for (body,) in self.conn.execute(f"SELECT body FROM {table} ORDER BY seq"):
+                yield json.loads(body)
 
-        yield name, df
+    def close(self) -> None:
+        self.conn.close()
 
 
-def choose_and_copy_json(month_csv_name: str, dir_a: str, dir_b: str, json_out_dir: str):
+def merge_json_sources(month_csv_name: str, dirs: list[str], json_out_dir: str, bvids: set[str]):
+    """把各目录同名月度 JSON 流式并集合并到 json_out_dir，并在同一遍中按 bvid 裁剪。
+
+    同一 bvid 的条目合并为一条，评论按 rpid 去重并保留更完整的子评论列表；
+    bvids 为空时不裁剪。只保留命中的条目，输出只写一次；合并状态存于 JsonItemIndex。
+    """
     base = os.path.splitext(month_csv_name)[0] + ".json"
-    pa = os.path.join(dir_a, base)
-    pb = os.path.join(dir_b, base)
-    cand = []
-    if os.path.exists(pa):
-        try:
-            cand.append((pa, os.path.getsize(pa)))
-        except Exception:
-            cand.append((pa, 0))
-    if os.path.exists(pb):
-        try:
-            cand.append((pb, os.path.getsize(pb)))
-        except Exception:
-            cand.append((pb, 0))
-    if not cand:
+    srcs = [os.path.join(d, base) for d in dirs if os.path.exists(os.path.join(d, base))]
+    if not srcs:
         return False, None
-    cand.sort(key=lambda x: x[1], reverse=True)
-    src = cand[0][0]
-    os.makedirs(json_out_dir, exist_ok=True)
-    dst = os.path.join(json_out_dir, base)
+    index = JsonItemIndex()
+    total = 0
+    used = 0
     try:
-        shutil.copy2(src, dst)
-        print(f"json -> {dst} from {src} size={cand[0][1]}")
-        return True, dst
-    except Exception as e:
-        print(f"[warn] copy json failed for {base}: {e}")
-        return False, None
+        for src in srcs:
+            try:
+                for item in iter_json_items(src):
+                    total += 1
+                    if bvids and _item_bvid(item) not in bvids:
+                        continue
+                    index.add(item)
+                used += 1
+            except Exception as e:
+                print(f"[warn] read json failed for {src}: {e}")
+        if not used:
+            return False, None
+        dst = os.path.join(json_out_dir, base)
+        try:
+            kept = write_json_items(index, dst)
+        except Exception as e:
+            print(f"[warn] write json failed for {base}: {e}")
+            return False, None
+    finally:
+        index.close()
+    print(f"json -> {dst} sources={used} kept={kept} of total={total}")
+    return True, dst
+
+
+# 增量清单：记录每个月份输入文件的 size/mtime/sha1、本次参数与输出文件，
+# 输入与参数都未变且输出完好的月份下次直接跳过
+MANIFEST_NAME = ".merge_manifest.json"
+MANIFEST_VERSION = 1
 
+# 每个工作进程各自构建一次的关键词/关闭短语自动机
+_MATCHERS: tuple[KeywordMatcher, KeywordMatcher] | None = None
 
-def filter_json_by_bvids(json_path: str, bvids: set[str]) -> bool:
+
+def _init_worker(kws: list[str], closed_phrases: list[str]) -> None:
+    global _MATCHERS
+    _MATCHERS = (KeywordMatcher(kws), KeywordMatcher(closed_phrases, ignore_case=False))
+
+
+def list_months(dirs: list[str]) -> list[str]:
+    names = set()
+    for d in dirs:
+        names.update(os.path.basename(p) for p in glob.glob(os.path.join(d, "*.csv")))
+    return sorted(names)
+
+
+def month_inputs(name: str, dirs: list[str], with_json: bool) -> list[str]:
+    files = [name]
+    if with_json:
+        files.append(os.path.splitext(name)[0] + ".json")
+    return [os.path.join(d, fn) for d in dirs for fn in files if os.path.exists(os.path.join(d, fn))]
+
+
+def fingerprint(path: str, prev: dict | None = None) -> dict:
+    """文件指纹；size 与 mtime 均未变时沿用上次的 sha1，不再重读文件。"""
+    st = os.stat(path)
+    if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+        return prev
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": h.hexdigest()}
+
+
+def load_manifest(path: str) -> dict:
     try:
-        if not os.path.exists(json_path):
-            return False
-        with open(json_path, 'r', encoding='utf-8') as f:
+        with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        if not isinstance(data, list):
+        if data.get("version") == MANIFEST_VERSION:
+            return data
+    except Exception:
+        pass
+    return {"version": MANIFEST_VERSION, "months": {}}
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _outputs_intact(outputs: dict) -> bool:
+    for p, fp in outputs.items():
+        try:
+            st = os.stat(p)
+        except OSError:
             return False
-        if not bvids:
-            # If no bvids provided, leave as is
-            return True
-        filtered = []
-        for item in data:
-            try:
-                bv = (
-                    (item.get('video') or {}).get('bvid')
-                    or (item.get('comments') or {}).get('bvid')
-                )
-            except Exception:
-                bv = None
-            if bv in bvids:
-                filtered.append(item)
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(filtered, f, ensure_ascii=False, indent=2)
-        print(f"json filtered -> {json_path} kept={len(filtered)} of total={len(data)}")
-        return True
-    except Exception as e:
-        print(f"[warn] filter json failed for {json_path}: {e}")
-        return False
-    
+        if st.st_size != fp.get("size") or st.st_mtime_ns != fp.get("mtime_ns"):
+            return False
+    return True
+
+
+def process_month(name: str, dirs: list[str], opts: dict) -> dict:
+    """单个月份的完整流水线：合并去重 →（可选）宽松筛选 →（可选）JSON 合并；返回输出文件清单。"""
+    outputs: list[str] = []
+    merged_path, rows, bvids = merge_month(name, dirs, opts["out_dir"], opts["keys"], opts["chunksize"])
+    if merged_path is None:
+        return {"name": name, "rows": 0, "outputs": outputs}
+    outputs.append(merged_path)
+    if opts["relaxed_filter"]:
+        if _MATCHERS is None:
+            _init_worker(opts["kws"], opts["closed_phrases"])
+        kw_matcher, closed_matcher = _MATCHERS
+        out_path = os.path.join(opts["filter_out_dir"], name)
+        res = relaxed_filter_month(
+            merged_path, out_path, kw_matcher, opts["cols"], closed_matcher,
+            opts["keep_closed_if_title_match"], opts["chunksize"],
+        )
+        if res is not None:
+            use_cols, kept, kept_bvids = res
+            print(f"filtered -> {out_path} rows={kept} (cols={','.join(use_cols)})")
+            outputs.append(out_path)
+            # Prefer filtered bvids when relaxed_filter is on
+            bvids = kept_bvids
+    if opts["copy_json"]:
+        if opts["copy_json_always"] or rows > 0:
+            ok, dst = merge_json_sources(name, dirs, opts["json_out_dir"], bvids)
+            if ok and dst:
+                outputs.append(dst)
+    return {"name": name, "rows": rows, "outputs": outputs}
 
 
 def parse_args():
-    ap = argparse.ArgumentParser(description="Merge and deduplicate monthly CSVs from two folders.")
+    ap = argparse.ArgumentParser(description="Merge and deduplicate monthly CSVs from several folders.")
+    ap.add_argument("--dirs", nargs="+", default=None, help="input dirs in priority order (overrides --dir_a/--dir_b)")
     ap.add_argument("--dir_a", default="data_click", help="first input dir")
     ap.add_argument("--dir_b", default="data_totalrank", help="second input dir")
     ap.add_argument("--out_dir", default="data_merged", help="output dir for merged CSVs")
     ap.add_argument("--keys", default="rpid,id,reply_id", help="comma separated keys for dedup if present")
+    ap.add_argument("--chunksize", type=int, default=50000, help="rows per streamed chunk")
+    ap.add_argument("--workers", type=int, default=0, help="parallel month workers (default: CPU count)")
+    ap.add_argument("--force", action="store_true", help="ignore the manifest and re-merge every month")
     ap.add_argument("--relaxed_filter", action="store_true", help="enable relaxed keyword filtering for related content")
     ap.add_argument("--filter_out_dir", default="data_merged_relaxed", help="output dir for filtered CSVs if relaxed_filter is on")
     ap.add_argument("--filter_keywords", default="", help="comma separated keywords for relaxed filtering (optional)")
@@ -147,76 +424,82 @@ def parse_args():
 
 def main():
     args = parse_args()
+    dirs = args.dirs or [args.dir_a, args.dir_b]
     keys = [k.strip() for k in args.keys.split(",") if k.strip()]
-    iterator = merge_and_dedup(args.dir_a, args.dir_b, args.out_dir, keys)
+    if args.filter_keywords_file and os.path.exists(args.filter_keywords_file):
+        kws = load_keywords(args.filter_keywords_file)
+    else:
+        kws = [k.strip() for k in args.filter_keywords.split(",") if k.strip()]
+    cols = [c.strip() for c in args.filter_cols.split(",") if c.strip()]
+    closed_phrases = [p.strip() for p in (args.closed_phrases or "").split(",") if p.strip()]
 
+    opts = {
+        "out_dir": args.out_dir,
+        "keys": keys,
+        "chunksize": args.chunksize,
+        "relaxed_filter": args.relaxed_filter,
+        "filter_out_dir": args.filter_out_dir,
+        "kws": kws,
+        "cols": cols,
+        "closed_phrases": closed_phrases,
+        "keep_closed_if_title_match": args.keep_closed_if_title_match,
+        "copy_json": args.copy_json,
+        "copy_json_always": args.copy_json_always,
+        "json_out_dir": args.json_out_dir,
+    }
+    os.makedirs(args.out_dir, exist_ok=True)
     if args.relaxed_filter:
         os.makedirs(args.filter_out_dir, exist_ok=True)
-        kws = []
-        if args.filter_keywords_file and os.path.exists(args.filter_keywords_file):
-            with open(args.filter_keywords_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    kws.append(line)
-        else:
-            kws = [k.strip() for k in args.filter_keywords.split(",") if k.strip()]
-        cols = [c.strip() for c in args.filter_cols.split(",") if c.strip()]
-        closed_phrases = [p.strip() for p in (args.closed_phrases or "").split(",") if p.strip()]
-        for name, df in iterator:
-            use_cols = [c for c in cols if c in df.columns]
-            if not use_cols or not kws:
-                if args.copy_json:
-                    if args.copy_json_always or len(df) > 0:
-                        ok, dst = choose_and_copy_json(name, args.dir_a, args.dir_b, args.json_out_dir)
-                        if ok and dst:
-                            bvids = set(df['bvid'].astype(str)) if 'bvid' in df.columns else set()
-                            filter_json_by_bvids(dst, bvids)
-                continue
-            mask = False
-            for c in use_cols:
-                s = df[c].astype(str).str.lower()
-                for kw in kws:
-                    mask = mask | s.str.contains(kw.lower(), na=False)
+    if args.copy_json:
+        os.makedirs(args.json_out_dir, exist_ok=True)
 
-            # 豁免：检测“评论区关闭”相关表述，或标题命中关键词时也保留
-            extra_mask = False
-            if args.keep_closed_if_title_match:
-                # 关闭短语检测：在常见文本列里找提示信息
-                closed_cols = [c for c in ["error_msg", "message", "text", "content", "desc"] if c in df.columns]
-                for c in closed_cols:
-                    s = df[c].astype(str)
-                    for phrase in closed_phrases:
-                        extra_mask = extra_mask | s.str.contains(phrase, na=False)
-                # 标题命中：即使评论文本不匹配，只要标题包含关键词也保留
-                if "title" in df.columns:
-                    ts = df["title"].astype(str).str.lower()
-                    for kw in kws:
-                        extra_mask = extra_mask | ts.str.contains(kw.lower(), na=False)
-
-            mask = mask | extra_mask
-            dff = df[mask]
-            out_path = os.path.join(args.filter_out_dir, name)
-            dff.to_csv(out_path, index=False, encoding="utf-8-sig")
-            print(f"filtered -> {out_path} rows={len(dff)} (cols={','.join(use_cols)})")
-            if args.copy_json:
-                if args.copy_json_always or len(df) > 0:
-                    ok, dst = choose_and_copy_json(name, args.dir_a, args.dir_b, args.json_out_dir)
-                    if ok and dst:
-                        # Prefer filtered bvids when relaxed_filter is on
-                        bvids = set(dff['bvid'].astype(str)) if 'bvid' in dff.columns else (
-                            set(df['bvid'].astype(str)) if 'bvid' in df.columns else set()
-                        )
-                        filter_json_by_bvids(dst, bvids)
-    else:
-        for name, df in iterator:
-            if args.copy_json:
-                if args.copy_json_always or len(df) > 0:
-                    ok, dst = choose_and_copy_json(name, args.dir_a, args.dir_b, args.json_out_dir)
-                    if ok and dst:
-                        bvids = set(df['bvid'].astype(str)) if 'bvid' in df.columns else set()
-                        filter_json_by_bvids(dst, bvids)
+    # 参数签名：任何影响输出的参数（含关键词库内容）变化都会使全部月份失效
+    params = hashlib.sha1(
+        json.dumps({"dirs": dirs, **{k: v for k, v in opts.items() if k != "chunksize"}},
+                   ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    manifest_path = os.path.join(args.out_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    months = manifest["months"]
+
+    names = list_months(dirs)
+    todo: dict[str, dict] = {}
+    for name in names:
+        prev = months.get(name) or {}
+        prev_inputs = prev.get("inputs") or {}
+        inputs = {p: fingerprint(p, prev_inputs.get(p)) for p in month_inputs(name, dirs, args.copy_json)}
+        unchanged = (
+            not args.force
+            and prev.get("params") == params
+            and {p: fp["sha1"] for p, fp in inputs.items()} == {p: fp.get("sha1") for p, fp in prev_inputs.items()}
+            and _outputs_intact(prev.get("outputs") or {})
+        )
+        if unchanged:
+            continue
+        todo[name] = inputs
+    print(f"months: {len(todo)} to merge, {len(names) - len(todo)} unchanged")
+
+    def _record(res: dict) -> None:
+        outputs = {}
+        for p in res["outputs"]:
+            st = os.stat(p)
+            outputs[p] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        months[res["name"]] = {"params": params, "inputs": todo[res["name"]], "outputs": outputs}
+        save_manifest(manifest_path, manifest)
+
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(todo) or 1))
+    if workers == 1:
+        _init_worker(kws, closed_phrases)
+        for name in todo:
+            _record(process_month(name, dirs, opts))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(kws, closed_phrases)) as ex:
+        futs = {ex.submit(process_month, name, dirs, opts): name for name in todo}
+        for fut in as_completed(futs):
+            try:
+                _record(fut.result())
+            except Exception as e:
+                print(f"[warn] merge failed for {futs[fut]}: {e}")
 
 
 if __name__ == "__main__":
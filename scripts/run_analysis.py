@@ -7,27 +7,122 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+# analysis 模块之间使用同目录导入（如 from comments_io import ...）
+if str(ROOT / "analysis") not in sys.path:
+    sys.path.insert(0, str(ROOT / "analysis"))
 
-from analysis.preprocess import load_and_clean
+from analysis.preprocess import load_and_clean, load_and_clean_db
+from analysis.near_duplicates import MODES as NEAR_DUP_MODES, run as run_near_dup
+from analysis.pipeline import DEFAULT_WORKERS, STATE_NAME, Stage, run_pipeline
 from analysis.sentiment_baseline import run as run_sent
-from analysis.topics_baseline import run as run_topics
-from analysis.visualize import plot_sentiment, wordcloud_from_topics
+from analysis.sentiment_cache import warm_cache as warm_sentiment
+from analysis.topics_baseline import run as run_topics, warm_tokens
+from analysis.visualize import plot_sentiment, plot_weekly_sentiment_with_candidates, wordcloud_from_topics
+from analysis.key_nodes_prepare import build_weekly_timeseries
+from analysis.key_nodes_detect import detect_candidate_weeks
+from analysis.key_nodes_videos import extract_key_videos
+from analysis.backfill_video_meta import backfill_key_videos
+from analysis.weekly_wordclouds import build_weekly_wordclouds
+from analysis.key_videos_summary import summarize_key_videos
 
 
 def parse_args():
     p = argparse.ArgumentParser()
     p.add_argument("--data_dir", default="data")
     p.add_argument("--analysis_dir", default="analysis")
+    p.add_argument("--db", default=None, help="read comments from the crawl SQLite (e.g. data/dzspider.sqlite) instead of JSON")
+    p.add_argument("--parquet", action="store_true", help="also write a keyword/month partitioned Parquet dataset and analyse from it")
+    p.add_argument("--with_sentiment", action="store_true", help="score comments once during preprocessing and keep sent_raw in the cleaned data")
+    p.add_argument("--with_tokens", action="store_true", help="segment comments once during preprocessing and keep a tokens column in the cleaned data")
+    p.add_argument("--roots_only", action="store_true", help="keep only top-level comments (drop nested replies) when preprocessing")
+    p.add_argument("--near_dup", choices=NEAR_DUP_MODES, default="off", help="down-weight (weight) or collapse near-duplicate comment clusters")
+    p.add_argument("--key_nodes", action="store_true", help="also run the key-week chain (weekly series, detection, key videos, weekly wordclouds, summary)")
+    p.add_argument("--backfill", action="store_true", help="backfill missing key video metadata from the bilibili API (needs --key_nodes)")
+    p.add_argument("--video_data", default=None, help="crawl CSV directory for key video metadata (default: --data_dir)")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="max stages running in parallel (1 = sequential)")
+    p.add_argument("--force", nargs="*", default=None, help="rerun the named stages (no names: all stages) even if unchanged")
     return p.parse_args()
 
 
+def build_stages(args) -> list:
+    """分析流水线各阶段及其输入/输出；依赖关系由路径自动推出。"""
+    a = args.analysis_dir
+    cleaned_dir = os.path.join(a, "cleaned")
+    parquet_dir = os.path.join(cleaned_dir, "parquet") if args.parquet else None
+    opts = dict(parquet_dir=parquet_dir, with_sentiment=args.with_sentiment, with_tokens=args.with_tokens, roots_only=args.roots_only)
+    cleaned_out = [os.path.join(cleaned_dir, "comments_cleaned.csv")] + ([parquet_dir] if parquet_dir else [])
+    if args.db:
+        prep = Stage("preprocess", load_and_clean_db, [args.db], cleaned_out, db_path=args.db, output_dir=cleaned_dir, **opts)
+    else:
+        prep = Stage("preprocess", load_and_clean, [args.data_dir], cleaned_out, input_dir=args.data_dir, output_dir=cleaned_dir, **opts)
+    cleaned = os.path.join(parquet_dir, "comments") if parquet_dir else cleaned_out[0]
+    # 分词用户词典变化会影响主题与词云
+    user_dict = [p for p in [str(ROOT / "keywords.txt")] if os.path.exists(p)]
+
+    stages = [prep]
+    clusters = None
+    if args.near_dup != "off":
+        clusters = os.path.join(a, "near_dup_clusters.csv")
+        stages.append(Stage("near_dup", run_near_dup, [cleaned], [clusters], input_csv=cleaned, output_dir=a))
+    dup = dict(near_dup=args.near_dup, clusters_csv=clusters)
+    dup_in = [clusters] if clusters else []
+    # 关键周链路中月度/周度情感、主题/周词云两两并行，各自打分或分词会重复计算并争抢同一缓存库；
+    # 此时先由单独的打分/分词阶段填好缓存，各消费阶段依赖其摘要文件，只读缓存。
+    # 预处理已写入 sent_raw / tokens 时无需这两步。
+    scored, segmented = [], []
+    if args.key_nodes and not args.with_sentiment:
+        scored = [os.path.join(a, "cache", "sentiment_scored.json")]
+        stages.append(Stage("score", warm_sentiment, [cleaned], scored, input_csv=cleaned, output_json=scored[0]))
+    if args.key_nodes and not args.with_tokens:
+        segmented = [os.path.join(a, "cache", "tokens_segmented.json")]
+        stages.append(Stage("tokenize", warm_tokens, [cleaned, *user_dict], segmented, input_csv=cleaned, output_json=segmented[0]))
+    sent_csv = os.path.join(a, "sentiment_timeseries.csv")
+    topics_csv = os.path.join(a, "topics_by_window.csv")
+    vis = os.path.join(a, "visualizations")
+    stages += [
+        Stage("sentiment", run_sent, [cleaned, *dup_in, *scored], [sent_csv], input_csv=cleaned, output_dir=a, **dup),
+        Stage("topics", run_topics, [cleaned, *dup_in, *user_dict, *segmented], [topics_csv, os.path.join(a, "topics_matrix.npz")],
+              input_csv=cleaned, output_dir=a, **dup),
+        Stage("plot_sentiment", plot_sentiment, [sent_csv], [os.path.join(vis, "sentiment_timeseries.png")],
+              ts_csv=sent_csv, output_dir=a),
+        Stage("topic_wordclouds", wordcloud_from_topics, [topics_csv], [os.path.join(vis, "wordclouds")],
+              topics_csv=topics_csv, output_dir=a),
+    ]
+    if not args.key_nodes:
+        return stages
+
+    weekly = os.path.join(a, "sentiment_timeseries_weekly.csv")
+    cand = os.path.join(a, "candidate_weeks.csv")
+    key_videos = os.path.join(a, "key_videos.csv")
+    video_data = args.video_data or args.data_dir
+    stages += [
+        Stage("weekly_series", build_weekly_timeseries, [cleaned, *scored], [weekly], input_csv=cleaned, output_dir=a),
+        Stage("detect", detect_candidate_weeks, [weekly], [cand], weekly_csv=weekly, output_dir=a),
+        Stage("plot_key_weeks", plot_weekly_sentiment_with_candidates, [weekly, cand],
+              [os.path.join(vis, "weekly_sentiment_key_weeks.png")], weekly_csv=weekly, candidate_csv=cand, output_dir=a),
+        Stage("key_videos", extract_key_videos, [cand, weekly, cleaned, video_data, *scored], [key_videos],
+              candidate_weeks_csv=cand, weekly_csv=weekly, cleaned_comments_csv=cleaned, data_dir=video_data, output_dir=a),
+        Stage("week_wordclouds", build_weekly_wordclouds, [cleaned, cand, *user_dict, *segmented], [os.path.join(vis, "week_wordclouds")],
+              cleaned_comments_csv=cleaned, candidate_weeks_csv=cand, output_dir=a),
+    ]
+    if args.backfill:
+        enriched = os.path.join(a, "key_videos_enriched.csv")
+        stages.append(Stage("backfill", backfill_key_videos, [key_videos], [enriched],
+                            input_csv=key_videos, output_csv=enriched, data_dir=video_data))
+        key_videos = enriched
+    summary = os.path.join(a, "key_videos_summary.csv")
+    stages.append(Stage("key_videos_summary", summarize_key_videos, [key_videos], [summary],
+                        key_videos_csv=key_videos, output_csv=summary))
+    return stages
+
+
 def main():
     args = parse_args()
-    cleaned_csv = load_and_clean(args.data_dir, os.path.join(args.analysis_dir, "cleaned"))
-    sent_csv = run_sent(cleaned_csv, args.analysis_dir)
-    topics_csv = run_topics(cleaned_csv, args.analysis_dir)
-    plot_sentiment(sent_csv, args.analysis_dir)
-    wordcloud_from_topics(topics_csv, args.analysis_dir)
+    state_path = os.path.join(args.analysis_dir, "cache", STATE_NAME)
+    force = True if args.force == [] else (args.force or False)
+    status = run_pipeline(build_stages(args), state_path, workers=args.workers, force=force)
+    if any(v in ("failed", "blocked") for v in status.values()):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -15,7 +15,7 @@ if str(ROOT) not in sys.path:
 
 from src.config import load_config, merge_config  # type: ignore
 from src.crawler import HttpClient, BiliCrawler  # type: ignore
-from src.storage import persist_all, save_json  # type: ignore
+from src.storage import DB_FILENAME, persist_all, save_comments_sqlite, save_json  # type: ignore
 from tqdm import tqdm  # type: ignore
 
 
@@ -127,6 +127,9 @@ def month_task(
     except Exception:
         pass
 
+    # 评论表按 rpid UPSERT，不会丢失已有数据，因此无论 JSON 是否覆盖都写入
+    save_comments_sqlite(comments_payload, os.path.join(output_dir, DB_FILENAME))
+
     # 如果已存在旧文件且更“丰富”，避免被较差结果覆盖
     def _score(payload):
         try:
@@ -143,7 +146,10 @@ def month_task(
         except Exception:
             pass
     save_json(comments_payload, json_path)
-    persist_all(picked, output_dir=output_dir, basename=basename)
+    persist_all(
+        picked, output_dir=output_dir, basename=basename,
+        source="comments", keyword=keyword, month=f"{year}-{int(month):02d}", order=order,
+    )
     try:
         total_replies = sum(len(((it or {}).get("comments") or {}).get("replies") or []) for it in (comments_payload or []))
         print(f"[Monthly] {year}-{int(month):02d} picked={len(picked)} total_replies={total_replies} -> {json_path}")
@@ -235,6 +235,7 @@ class BiliCrawler:
         content = c.get("content", {})
         return {
             "rpid": c.get("rpid"),
+            "root": c.get("root"),
             "parent": c.get("parent"),
             "floor": c.get("floor"),
             "like": c.get("like"),
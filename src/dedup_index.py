@@ -0,0 +1,40 @@
+from __future__ import annotations
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# 跨分块 / 跨文件“保留首见行”的去重索引，scripts/merge_dedup.py 与 analysis/preprocess.py 共用。
+
+
+class DedupIndex:
+    """磁盘可溢出的去重索引：以 64 位键（行键哈希或 rpid 等整数主键）为主键存入临时 SQLite。
+
+    sqlite3.connect("") 创建私有临时库，超过页缓存后自动落盘、关闭即删除，
+    因此内存占用只与分块大小有关，与已登记的键总量无关。
+    调用方可能在其他线程中消费分块（如 pyarrow 写 Parquet 时拉取生成器），连接不绑定线程；
+    同一索引只应被顺序使用。
+    """
+
+    def __init__(self, path: str = ""):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (h INTEGER PRIMARY KEY)")
+
+    def filter_new(self, hashes: np.ndarray) -> np.ndarray:
+        """返回布尔掩码：该行键此前（含本块更早的行）未出现过，并登记这些新键。"""
+        hashes = hashes.astype(np.uint64).view(np.int64)
+        first = ~pd.Series(hashes).duplicated(keep="first").to_numpy()
+        cand = hashes[first].tolist()
+        existing: set[int] = set()
+        for i in range(0, len(cand), 500):
+            part = cand[i:i + 500]
+            q = "SELECT h FROM seen WHERE h IN (" + ",".join("?" * len(part)) + ")"
+            existing.update(r[0] for r in self.conn.execute(q, part))
+        mask = first & ~np.isin(hashes, np.fromiter(existing, dtype=np.int64, count=len(existing)))
+        self.conn.executemany("INSERT INTO seen(h) VALUES (?)", ((int(h),) for h in hashes[mask]))
+        return mask
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from collections import deque
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import ahocorasick  # type: ignore
+    _HAS_AHOCORASICK = True
+except Exception:  # pragma: no cover - 未安装 pyahocorasick 时使用纯 Python 自动机
+    ahocorasick = None
+    _HAS_AHOCORASICK = False
+
+
+def load_keywords(path: str) -> List[str]:
+    """读取关键词库：每行一个关键词，忽略空行与 # 注释。"""
+    out: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            out.append(line)
+    return out
+
+
+class KeywordMatcher:
+    """多模式字符串匹配（Aho-Corasick）：构建一次，每段文本只扫描一遍。
+
+    匹配代价与关键词数量无关，只与文本长度和命中数有关；安装了 pyahocorasick
+    时使用其 C 实现，否则退回等价的纯 Python 自动机。
+    """
+
+    def __init__(self, patterns: Iterable[str], ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        self.patterns: List[str] = []
+        keys: Dict[str, int] = {}
+        # 归一化后相同的模式（如大小写不同）共用一个自动机键，命中时全部报告
+        self._owners: List[List[int]] = []
+        for p in patterns:
+            if not p:
+                continue
+            idx = len(self.patterns)
+            self.patterns.append(p)
+            k = self._norm(p)
+            if k not in keys:
+                keys[k] = len(self._owners)
+                self._owners.append([])
+            self._owners[keys[k]].append(idx)
+        self._keys = list(keys)
+        if not self._keys:
+            return
+        if _HAS_AHOCORASICK:
+            self._automaton = ahocorasick.Automaton()
+            for i, k in enumerate(self._keys):
+                self._automaton.add_word(k, i)
+            self._automaton.make_automaton()
+        else:
+            self._build(self._keys)
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _norm(self, s: str) -> str:
+        return s.lower() if self.ignore_case else s
+
+    def _build(self, keys: List[str]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+        for i, k in enumerate(keys):
+            s = 0
+            for ch in k:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    out.append([])
+                    goto[s][ch] = nxt
+                s = nxt
+            out[s].append(i)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, t in goto[s].items():
+                queue.append(t)
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[t] = goto[f].get(ch, 0)
+                out[t] = out[t] + out[fail[t]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def _scan(self, text: str) -> set:
+        if _HAS_AHOCORASICK:
+            return {i for _, i in self._automaton.iter(text)}
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: set = set()
+        s = 0
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                hits.update(out[s])
+        return hits
+
+    def hits(self, text) -> set:
+        """返回 text 中出现的模式下标集合（不排序），供需要自行汇总的调用方使用。"""
+        if not self._keys or not isinstance(text, str) or not text:
+            return set()
+        found = self._scan(self._norm(text))
+        if len(self._owners) == len(self.patterns):
+            return {self._owners[i][0] for i in found}
+        return {j for i in found for j in self._owners[i]}
+
+    def find(self, text) -> List[str]:
+        """返回 text 中出现的全部模式（去重，按构建时的顺序）。"""
+        if not self._keys or not isinstance(text, str) or not text:
+            return []
+        idx = sorted(j for i in self._scan(self._norm(text)) for j in self._owners[i])
+        return [self.patterns[j] for j in idx]
+
+    def find_series(self, s: pd.Series) -> pd.Series:
+        """逐格匹配，返回与 s 同索引的命中模式列表；相同取值只扫描一次。"""
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+        found = [self.find(u) for u in uniques]
+        found.append([])  # 缺失值（code=-1）对应空列表
+        return pd.Series([found[c] for c in codes], index=s.index, dtype=object)
+
+    def contains_any(self, s: pd.Series) -> pd.Series:
+        """布尔掩码：该格是否命中任一模式。"""
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+        hit = np.array([bool(self.find(u)) for u in uniques] + [False], dtype=bool)
+        return pd.Series(hit[codes], index=s.index)
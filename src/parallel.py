@@ -0,0 +1,27 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Sequence
+
+# 按块分发到进程池的批处理：量小或只有一个进程时直接在本进程计算，省去进程池启动开销；
+# 每个工作进程由 initializer 预热一次（加载模型/词典），结果按提交顺序逐块取回。
+
+
+def chunked_map(
+    func: Callable[[List[Any]], List[Any]],
+    items: Sequence[Any],
+    workers: int,
+    chunk_size: int,
+    min_parallel: int,
+    initializer: Callable[[], None] | None = None,
+) -> List[Any]:
+    """返回 func 逐块处理 items 后按原顺序拼接的结果（func 接收一块、返回等长列表）。"""
+    items = list(items)
+    if workers <= 1 or len(items) < min_parallel:
+        return list(func(items))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    out: List[Any] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as ex:
+        # map 按提交顺序产出，逐块取回，不必等全部完成
+        for part in ex.map(func, chunks):
+            out.extend(part)
+    return out
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import atexit
+import hashlib
+import os
+import sqlite3
+from typing import Any, Callable, Dict, List, Sequence
+
+# 进程内共享的 SQLite 连接与“内容哈希 → 结果”缓存读写。
+# 每个库文件每个进程只打开一次（WAL + synchronous=NORMAL），建表等初始化随首次连接执行；
+# 情感分、分词、部分和、视频索引与抓取库都经由这里取连接。
+_LOOKUP_BATCH = 500
+# 并行阶段同时写同一缓存库时等待写锁的秒数（sqlite3 默认 5 秒，整批写回时可能不够）
+BUSY_TIMEOUT = 60.0
+
+_connections: Dict[str, sqlite3.Connection] = {}
+
+
+def connect(path: str, init: Callable[[sqlite3.Connection], None] | None = None) -> sqlite3.Connection:
+    """返回 path 的进程级连接；首次打开时创建目录、设置 PRAGMA 并调用 init(conn) 建表。"""
+    conn = _connections.get(path)
+    if conn is not None:
+        return conn
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if init is not None:
+        init(conn)
+    conn.commit()
+    _connections[path] = conn
+    return conn
+
+
+def close_connections() -> None:
+    while _connections:
+        _, conn = _connections.popitem()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+atexit.register(close_connections)
+
+
+def text_hash(s: str) -> int:
+    # 64 位有符号整数，直接作 SQLite INTEGER 主键
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def lookup(
+    conn: sqlite3.Connection,
+    table: str,
+    column: str,
+    hashes: List[int],
+    key: Dict[str, Any],
+) -> Dict[int, Any]:
+    """分批按 h IN (...) 查询，返回 {h: column}；key 为其余主键列的等值条件（如打分器与版本）。"""
+    where = "".join(f" AND {k} = ?" for k in key)
+    found: Dict[int, Any] = {}
+    for i in range(0, len(hashes), _LOOKUP_BATCH):
+        part = hashes[i:i + _LOOKUP_BATCH]
+        marks = ",".join("?" * len(part))
+        rows = conn.execute(
+            f"SELECT h, {column} FROM {table} WHERE h IN ({marks}){where}",
+            [*part, *key.values()],
+        )
+        found.update(rows)
+    return found
+
+
+def cached_compute(
+    texts: Sequence[str],
+    conn: sqlite3.Connection,
+    table: str,
+    column: str,
+    key: Dict[str, Any],
+    compute: Callable[[List[str]], Sequence[Any]],
+    encode: Callable[[Any], Any] = lambda v: v,
+    decode: Callable[[Any], Any] = lambda v: v,
+) -> List[Any]:
+    """返回与 texts 一一对应的结果：命中缓存的直接取回，其余交给 compute 批量计算并写回。
+
+    texts 应已去重且非空；表需有 (h, *key, column) 列且以 (h, *key) 为主键。
+    encode/decode 在写入与读出缓存时转换取值（如词列表 ↔ 空格连接的字符串）。
+    """
+    texts = list(texts)
+    hashes = [text_hash(t) for t in texts]
+    cached = lookup(conn, table, column, hashes, key)
+    out: List[Any] = [decode(cached[h]) if h in cached else None for h in hashes]
+    missing = [i for i, h in enumerate(hashes) if h not in cached]
+    if missing:
+        fresh = compute([texts[i] for i in missing])
+        for i, v in zip(missing, fresh):
+            out[i] = v
+        cols = ", ".join(["h", *key, column])
+        marks = ", ".join("?" * (len(key) + 2))
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table}({cols}) VALUES ({marks})",
+                [(hashes[i], *key.values(), encode(v)) for i, v in zip(missing, fresh)],
+            )
+    return out
@@ -2,11 +2,13 @@ from __future__ import annotations
 import os
 import csv
 import sqlite3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 
 import pandas as pd
 import json
 
+from .sqlite_cache import connect
+
 
 COLUMNS = [
     "bvid",
@@ -41,58 +43,243 @@ def save_csv(items: List[Dict[str, Any]], csv_path: str) -> None:
     df.to_csv(csv_path, index=False)
 
 
+# 单库存储：同一数据集（output_dir）的所有月份/来源写入同一个 SQLite，
+# 以 source/keyword/month/order 区分，跨月查询只需一次索引查询。
+DB_FILENAME = "dzspider.sqlite"
+TAG_COLUMNS = ["source", "keyword", "month", "order"]
+STAT_COLUMNS = ["view", "danmaku", "reply", "favorite", "coin", "share", "like"]
+
+def _q(col: str) -> str:
+    # order/like 等列名与 SQL 关键字冲突，统一加引号
+    return f'"{col}"'
+
+
+def _init_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS videos (
+            bvid TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT '',
+            keyword TEXT NOT NULL DEFAULT '',
+            month TEXT NOT NULL DEFAULT '',
+            "order" TEXT NOT NULL DEFAULT '',
+            title TEXT,
+            tname TEXT,
+            pubdate INTEGER,
+            duration INTEGER,
+            owner TEXT,
+            view INTEGER,
+            danmaku INTEGER,
+            reply INTEGER,
+            favorite INTEGER,
+            coin INTEGER,
+            share INTEGER,
+            "like" INTEGER,
+            PRIMARY KEY (bvid, source, keyword, month, "order")
+        );
+        CREATE INDEX IF NOT EXISTS idx_videos_keyword_month ON videos(keyword, month);
+        CREATE INDEX IF NOT EXISTS idx_videos_month ON videos(month);
+        CREATE INDEX IF NOT EXISTS idx_videos_source ON videos(source);
+
+        CREATE TABLE IF NOT EXISTS comments (
+            rpid INTEGER PRIMARY KEY,
+            bvid TEXT,
+            root INTEGER,
+            parent INTEGER,
+            floor INTEGER,
+            "like" INTEGER,
+            ctime INTEGER,
+            mid INTEGER,
+            uname TEXT,
+            message TEXT,
+            depth INTEGER,
+            fts_done INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_comments_bvid ON comments(bvid);
+        CREATE INDEX IF NOT EXISTS idx_comments_ctime ON comments(ctime);
+        CREATE INDEX IF NOT EXISTS idx_comments_mid ON comments(mid);
+        """
+    )
+    # fts_done：是否已按当前 message 写入全文索引（见 analysis/comments_fts.py）；旧库就地补列
+    if "fts_done" not in {r[1] for r in conn.execute("PRAGMA table_info(comments)")}:
+        conn.execute("ALTER TABLE comments ADD COLUMN fts_done INTEGER NOT NULL DEFAULT 0")
+    conn.commit()
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """Return a process-wide connection for db_path, creating schema and PRAGMAs once."""
+    return connect(os.path.abspath(db_path), _init_schema)
+
+
 def init_sqlite(db_path: str) -> None:
-    conn = sqlite3.connect(db_path)
-    try:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS videos (
-                bvid TEXT PRIMARY KEY,
-                title TEXT,
-                tname TEXT,
-                pubdate INTEGER,
-                duration INTEGER,
-                owner TEXT,
-                view INTEGER,
-                danmaku INTEGER,
-                reply INTEGER,
-                favorite INTEGER,
-                coin INTEGER,
-                share INTEGER,
-                like INTEGER
-            )
-            """
-        )
-        conn.commit()
-    finally:
-        conn.close()
-
-
-def save_sqlite(items: List[Dict[str, Any]], db_path: str) -> None:
-    conn = sqlite3.connect(db_path)
-    try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        sql = (
-            "INSERT OR REPLACE INTO videos (" + ",".join(COLUMNS) + ") "
-            "VALUES (" + ",".join(["?" for _ in COLUMNS]) + ")"
-        )
-        rows = [tuple(item.get(col) for col in COLUMNS) for item in items]
-        conn.executemany(sql, rows)
-        conn.commit()
-    finally:
-        conn.close()
-
-
-def persist_all(items: List[Dict[str, Any]], output_dir: str, basename: str = "videos") -> Dict[str, str]:
+    get_connection(db_path)
+
+
+def _build_upsert_sql() -> str:
+    cols = ["bvid"] + TAG_COLUMNS + [c for c in COLUMNS if c != "bvid"]
+    key = ["bvid"] + TAG_COLUMNS
+    updates = []
+    for c in COLUMNS:
+        if c == "bvid":
+            continue
+        if c in STAT_COLUMNS:
+            # 统计量只增不减：取新旧两者的最大值，避免较差的一次抓取覆盖已有结果；
+            # 一方缺失时取另一方，两方都缺失时保持 NULL（未知不等于 0）
+            new, old = f"excluded.{_q(c)}", f"videos.{_q(c)}"
+            updates.append(f"{_q(c)}=COALESCE(MAX({new}, {old}), {new}, {old})")
+        else:
+            updates.append(f"{_q(c)}=COALESCE(NULLIF(excluded.{_q(c)}, ''), videos.{_q(c)})")
+    return (
+        "INSERT INTO videos (" + ",".join(_q(c) for c in cols) + ") "
+        "VALUES (" + ",".join("?" for _ in cols) + ") "
+        "ON CONFLICT(" + ",".join(_q(c) for c in key) + ") DO UPDATE SET " + ", ".join(updates)
+    )
+
+
+_UPSERT_SQL = _build_upsert_sql()
+
+
+def save_sqlite(
+    items: List[Dict[str, Any]],
+    db_path: str,
+    source: str = "",
+    keyword: str = "",
+    month: str = "",
+    order: str = "",
+    batch_size: int = 500,
+) -> None:
+    conn = get_connection(db_path)
+    tags = (source or "", keyword or "", month or "", order or "")
+    rows = [
+        (item.get("bvid"),) + tags + tuple(item.get(col) for col in COLUMNS if col != "bvid")
+        for item in items
+        if item.get("bvid")
+    ]
+    # 单个事务内分批 executemany，减少提交次数
+    with conn:
+        for i in range(0, len(rows), batch_size):
+            conn.executemany(_UPSERT_SQL, rows[i:i + batch_size])
+
+
+def query_videos(
+    db_path: str,
+    keyword: str | None = None,
+    source: str | None = None,
+    month_from: str | None = None,
+    month_to: str | None = None,
+) -> pd.DataFrame:
+    """跨月份/来源的一次性索引查询；month 形如 "2023-04"，区间两端均包含。"""
+    conds: List[str] = []
+    params: List[Any] = []
+    if keyword is not None:
+        conds.append("keyword = ?")
+        params.append(keyword)
+    if source is not None:
+        conds.append("source = ?")
+        params.append(source)
+    if month_from:
+        conds.append("month >= ?")
+        params.append(month_from)
+    if month_to:
+        conds.append("month <= ?")
+        params.append(month_to)
+    sql = "SELECT * FROM videos"
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    sql += " ORDER BY month, view DESC"
+    return pd.read_sql_query(sql, get_connection(db_path), params=params)
+
+
+COMMENT_COLUMNS = ["rpid", "bvid", "root", "parent", "floor", "like", "ctime", "mid", "uname", "message", "depth"]
+
+_COMMENT_UPSERT_SQL = (
+    "INSERT INTO comments (" + ",".join(_q(c) for c in COMMENT_COLUMNS) + ") "
+    "VALUES (" + ",".join("?" for _ in COMMENT_COLUMNS) + ") "
+    "ON CONFLICT(rpid) DO UPDATE SET "
+    # 点赞数与视频统计量同一口径：取新旧较大值，一方缺失取另一方，都缺失保持 NULL
+    "\"like\"=COALESCE(MAX(excluded.\"like\", comments.\"like\"), excluded.\"like\", comments.\"like\"), "
+    "message=COALESCE(NULLIF(excluded.message, ''), comments.message), "
+    "uname=COALESCE(NULLIF(excluded.uname, ''), comments.uname), "
+    "floor=COALESCE(excluded.floor, comments.floor), "
+    "root=COALESCE(excluded.root, comments.root), "
+    # 正文变化时清除全文索引标记，下次增量索引用新正文替换旧词条（SET 中的 comments.* 均为更新前的值）
+    "fts_done=CASE WHEN COALESCE(NULLIF(excluded.message, ''), comments.message) IS comments.message "
+    "THEN comments.fts_done ELSE 0 END"
+)
+
+
+def flatten_comments(payload: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """将评论 JSON（video → comments → replies → 子回复）展开为逐条评论行。
+
+    根评论 depth=0、root=0；子回复 depth=1，root 为所属根评论 rpid。
+    """
+    for it in payload or []:
+        v = (it or {}).get("video") or {}
+        cm = (it or {}).get("comments") or {}
+        bvid = v.get("bvid") or cm.get("bvid")
+        for c in cm.get("replies") or []:
+            rpid = c.get("rpid")
+            if rpid is None:
+                continue
+            yield {
+                "rpid": rpid, "bvid": bvid, "root": 0, "parent": c.get("parent"),
+                "floor": c.get("floor"), "like": c.get("like"), "ctime": c.get("ctime"),
+                "mid": c.get("mid"), "uname": c.get("uname"), "message": c.get("message"),
+                "depth": 0,
+            }
+            for cc in c.get("replies") or []:
+                if cc.get("rpid") is None:
+                    continue
+                yield {
+                    "rpid": cc.get("rpid"), "bvid": bvid, "root": cc.get("root") or rpid,
+                    "parent": cc.get("parent"), "floor": cc.get("floor"), "like": cc.get("like"),
+                    "ctime": cc.get("ctime"), "mid": cc.get("mid"), "uname": cc.get("uname"),
+                    "message": cc.get("message"), "depth": 1,
+                }
+
+
+def save_comments_sqlite(payload: List[Dict[str, Any]], db_path: str, batch_size: int = 1000) -> int:
+    """按 rpid 主键 UPSERT 评论，重复抓取只会刷新点赞、正文等字段（正文变化时待重新入全文索引）；返回写入行数。"""
+    conn = get_connection(db_path)
+    rows = [tuple(r.get(c) for c in COMMENT_COLUMNS) for r in flatten_comments(payload)]
+    with conn:
+        for i in range(0, len(rows), batch_size):
+            conn.executemany(_COMMENT_UPSERT_SQL, rows[i:i + batch_size])
+    return len(rows)
+
+
+def import_comments_json(input_dir: str, db_path: str) -> int:
+    """把已有的 comments_*.json 导入评论表（幂等），用于历史数据迁移。"""
+    total = 0
+    for fn in sorted(os.listdir(input_dir)):
+        if not (fn.startswith("comments_") and fn.lower().endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(input_dir, fn), "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception:
+            continue
+        if isinstance(payload, list):
+            total += save_comments_sqlite(payload, db_path)
+    return total
+
+
+def persist_all(
+    items: List[Dict[str, Any]],
+    output_dir: str,
+    basename: str = "videos",
+    source: str = "",
+    keyword: str = "",
+    month: str = "",
+    order: str = "",
+) -> Dict[str, str]:
     ensure_dir(output_dir)
     csv_path = os.path.join(output_dir, f"{basename}.csv")
-    db_path = os.path.join(output_dir, f"{basename}.sqlite")
-    init_sqlite(db_path)
+    db_path = os.path.join(output_dir, DB_FILENAME)
     # Always create/update CSV and SQLite, even when items is empty
     # so that monthly tasks always produce expected artifacts.
     save_csv(items, csv_path)
-    save_sqlite(items, db_path)
+    save_sqlite(items, db_path, source=source, keyword=keyword, month=month, order=order)
     return {"csv": csv_path, "sqlite": db_path}
 
 
@@ -101,3 +288,51 @@ def save_json(data: Any, path: str) -> str:
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     return path
+
+
+def iter_json_items(path: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """流式逐个产出顶层 JSON 数组的元素，内存只保留当前元素与一个读缓冲。"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{path}: top-level JSON value is not an array")
+        pos, eof = 1, False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if buf.startswith("]", pos):
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                # 元素后必须紧跟 "," 或 "]"，否则可能是被缓冲截断的数字/字面量
+                nxt = end
+                while nxt < len(buf) and buf[nxt] in " \t\r\n":
+                    nxt += 1
+                complete = nxt < len(buf) and buf[nxt] in ",]"
+            except json.JSONDecodeError:
+                complete = False
+            if complete:
+                yield item
+                pos = end
+                continue
+            if eof:
+                raise ValueError(f"{path}: truncated or malformed JSON array")
+            # 单个元素跨多个缓冲时按倍增补读，避免大元素被反复从头解析
+            more = f.read(max(chunk_size, len(buf) - pos))
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+
+
+def write_json_items(items: Iterable[Any], path: str) -> int:
+    """逐个写出数组元素，格式与 save_json（indent=2）一致；返回元素数。"""
+    ensure_dir(os.path.dirname(path) or ".")
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            body = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            f.write(("[\n  " if n == 0 else ",\n  ") + body)
+            n += 1
+        f.write("\n]" if n else "[]")
+    return n
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+import pandas as pd
+import jieba
+
+from .keyword_matcher import load_keywords
+from .parallel import chunked_map
+from .sqlite_cache import cached_compute, connect
+
+# 共享分词层：jieba 只加载一次用户词典（keywords.txt 中的关键词），
+# 分词结果按文本内容哈希 + 分词器版本缓存在 SQLite 中，跨阶段、跨运行复用；
+# 未命中缓存的文本去重后按块分发到进程池分词。
+# 缓存的是规范化切分结果（去空白、丢弃单字），停用词由各调用方自行过滤。
+DEFAULT_CACHE = os.path.join("analysis", "cache", "tokens_cache.sqlite")
+DEFAULT_USER_DICT = str(Path(__file__).resolve().parents[1] / "keywords.txt")
+# 切分规则变化时递增，使旧缓存失效
+RULES_VERSION = "1"
+DEFAULT_CHUNK = 2000
+# 待分词文本少于该数量时直接在本进程计算，省去进程池启动开销
+MIN_PARALLEL = 5000
+_dict_loaded: str | None = None
+
+
+def cache_path() -> str:
+    return os.environ.get("DZ_TOKEN_CACHE", DEFAULT_CACHE)
+
+
+def user_dict_path() -> str:
+    return os.environ.get("DZ_USER_DICT", DEFAULT_USER_DICT)
+
+
+def load_user_dict(path: str | None = None) -> None:
+    """把关键词库加入 jieba 词典（每个进程只做一次），保证“丁真珍珠”等专名不被切开。"""
+    global _dict_loaded
+    path = path or user_dict_path()
+    if _dict_loaded == path:
+        return
+    if path and os.path.exists(path):
+        for kw in load_keywords(path):
+            # 含空白的关键词（如 ding zhen）jieba 无法作为整词切出，跳过
+            if not any(ch.isspace() for ch in kw):
+                jieba.add_word(kw)
+    _dict_loaded = path
+
+
+def tokenizer_version() -> str:
+    """jieba 版本 + 规则版本 + 用户词典内容摘要；任一变化都换版本。"""
+    try:
+        from importlib.metadata import version
+        v = version("jieba")
+    except Exception:
+        v = "unknown"
+    out = f"{v}+{RULES_VERSION}"
+    path = user_dict_path()
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            out += "+" + hashlib.sha1(f.read()).hexdigest()[:12]
+    return out
+
+
+def segment(text: str) -> List[str]:
+    """单条文本分词：去掉空白，丢弃单字与空串。"""
+    load_user_dict()
+    out: List[str] = []
+    for w in jieba.cut(text, HMM=True):
+        w = w.strip()
+        if len(w) >= 2:
+            out.append(w)
+    return out
+
+
+def _init_worker() -> None:
+    # 预热：加载 jieba 主词典与用户词典，每个进程只做一次
+    jieba.initialize()
+    load_user_dict()
+
+
+def _segment_chunk(texts: List[str]) -> List[List[str]]:
+    return [segment(t) for t in texts]
+
+
+def default_workers() -> int:
+    env = os.environ.get("DZ_TOKEN_WORKERS")
+    if env:
+        return max(1, int(env))
+    return os.cpu_count() or 1
+
+
+def segment_texts(
+    texts: Sequence[str],
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK,
+) -> List[List[str]]:
+    """批量分词（不经缓存），texts 应已去重；量大时多进程并行，结果与输入一一对应。"""
+    return chunked_map(_segment_chunk, texts, workers or default_workers(), chunk_size, MIN_PARALLEL, _init_worker)
+
+
+def _init_cache(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS tokens ("
+        "h INTEGER NOT NULL, version TEXT NOT NULL, tokens TEXT NOT NULL, "
+        "PRIMARY KEY (h, version)) WITHOUT ROWID"
+    )
+
+
+def tokenize_texts(texts: Iterable[str], path: str | None = None, workers: int | None = None) -> List[List[str]]:
+    """返回与 texts 一一对应的分词结果；命中缓存的文本不再分词，新结果写回缓存。
+
+    只对去重后的非空文本查缓存/分词；空文本恒为空列表。
+    """
+    codes, uniques = pd.factorize(pd.Series(list(texts), dtype=object).fillna("").astype(str), sort=False)
+    values: List[List[str]] = [[] for _ in range(len(uniques))]
+    todo = [i for i, t in enumerate(uniques) if t]
+    if todo:
+        found = cached_compute(
+            [uniques[i] for i in todo],
+            connect(path or cache_path(), _init_cache),
+            "tokens", "tokens", {"version": tokenizer_version()},
+            lambda miss: segment_texts(miss, workers=workers),
+            # 切分结果不含空白，以空格连接存储
+            encode=" ".join, decode=str.split,
+        )
+        for i, toks in zip(todo, found):
+            values[i] = toks
+    return [values[c] for c in codes]
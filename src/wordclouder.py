@@ -3,12 +3,13 @@ import os
 from typing import Iterable, List
 
 import pandas as pd
-import jieba
 from wordcloud import WordCloud
 import numpy as np
 from PIL import Image
 from wordcloud import ImageColorGenerator
 
+from .tokenizer import tokenize_texts
+
 try:
     import cv2  # type: ignore
 except Exception:  # pragma: no cover
@@ -47,16 +48,9 @@ def build_corpus_from_csv(csv_path: str, columns: Iterable[str]) -> List[str]:
 def tokenize(texts: Iterable[str], extra_stopwords: Iterable[str] | None = None) -> str:
     stop = set(extra_stopwords or []) | DEFAULT_STOPWORDS
     tokens: List[str] = []
-    for t in texts:
-        for w in jieba.cut(t, HMM=True):
-            w = w.strip()
-            if not w:
-                continue
-            if len(w) <= 1:
-                continue
-            if w in stop:
-                continue
-            tokens.append(w)
+    # 共享分词层已去空白、丢弃单字，并经内容哈希缓存
+    for ws in tokenize_texts(texts):
+        tokens.extend(w for w in ws if w not in stop)
     return " ".join(tokens)
 
 